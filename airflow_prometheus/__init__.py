@@ -1,9 +1,20 @@
-from .prometheus_exporter import AirflowPrometheusPlugin
-from . import grafana_data
-
 __all__ = [
     "AirflowPrometheusPlugin",
     "grafana_data",
 ]
 
 __version__ = "0.4.2"
+
+
+def __getattr__(name):
+    # The plugin pulls in Flask, the UI views and pandas, which the
+    # standalone exporter and the command line tools do not need.
+    if name == "AirflowPrometheusPlugin":
+        from .prometheus_exporter import AirflowPrometheusPlugin
+
+        return AirflowPrometheusPlugin
+    if name == "grafana_data":
+        from . import grafana_data
+
+        return grafana_data
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
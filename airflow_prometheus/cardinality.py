@@ -0,0 +1,133 @@
+"""Cardinality limits for the exported metric families."""
+import heapq
+import re
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional
+
+from airflow_prometheus.xcom_config import load_xcom_config
+
+# Label value of the series that aggregates everything outside of the top-K.
+OTHER = "other"
+
+
+class FamilyPolicy(NamedTuple):
+    drop_labels: FrozenSet[str] = frozenset()
+    top_k: Optional[int] = None
+    top_k_by: str = "count"
+    max_series: Optional[int] = None
+
+
+class CardinalityPolicy(object):
+    """Limits read from the `cardinality` section of config.yaml.
+
+    Example:
+        cardinality:
+          include_dags: ["^etl_"]
+          exclude_dags: ["_test$"]
+          families:
+            airflow_task_status:
+              drop_labels: [operator_name, owner]
+              top_k: 1000
+              top_k_by: count
+              max_series: 50000
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or dict()
+        self.include_dags = [re.compile(pattern) for pattern in config.get("include_dags") or []]
+        self.exclude_dags = [re.compile(pattern) for pattern in config.get("exclude_dags") or []]
+        self.families: Dict[str, FamilyPolicy] = dict()
+        for name, family in (config.get("families") or dict()).items():
+            family = family or dict()
+            top_k_by = family.get("top_k_by", "count")
+            if top_k_by not in ("count", "duration"):
+                raise ValueError("Unknown top_k_by value for %s: %s" % (name, top_k_by))
+            self.families[name] = FamilyPolicy(
+                drop_labels=frozenset(family.get("drop_labels") or []),
+                top_k=family.get("top_k"),
+                top_k_by=top_k_by,
+                max_series=family.get("max_series"),
+            )
+
+    @property
+    def filters_dags(self) -> bool:
+        return bool(self.include_dags or self.exclude_dags)
+
+    def allows_dag(self, dag_id: str) -> bool:
+        if self.include_dags and not any(pattern.search(dag_id) for pattern in self.include_dags):
+            return False
+        return not any(pattern.search(dag_id) for pattern in self.exclude_dags)
+
+    def family(self, name: str) -> FamilyPolicy:
+        return self.families.get(name, FamilyPolicy())
+
+
+_lock = threading.Lock()
+_cached_config: Optional[Dict[str, Any]] = None
+_cached_policy = CardinalityPolicy()
+
+
+def load_cardinality_policy() -> CardinalityPolicy:
+    """The cardinality policy, parsed again only when config.yaml changed."""
+    global _cached_config, _cached_policy
+    config = load_xcom_config().get("cardinality") or dict()
+    with _lock:
+        if config is not _cached_config:
+            _cached_policy = CardinalityPolicy(config)
+            _cached_config = config
+        return _cached_policy
+
+
+def top_k(
+    rows: Iterable[Any],
+    k: int,
+    key: Callable[[Any], float],
+    fold: Callable[[List[Any]], Iterable[Any]],
+) -> List[Any]:
+    """The k largest rows by key, followed by fold() of all the other rows."""
+    rows = list(rows)
+    if len(rows) <= k:
+        return rows
+    indices = set(heapq.nlargest(k, range(len(rows)), key=lambda index: key(rows[index])))
+    kept = [row for index, row in enumerate(rows) if index in indices]
+    rest = [row for index, row in enumerate(rows) if index not in indices]
+    return kept + list(fold(rest))
+
+
+class DroppedSeries(object):
+    """Number of series every family dropped during a scrape, by reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = dict()
+
+    def record(self, family: str, reason: str, count: int):
+        with self._lock:
+            self.counts.setdefault(family, dict())[reason] = count
+
+    def items(self):
+        with self._lock:
+            return [
+                (family, reason, count)
+                for family, reasons in self.counts.items()
+                for reason, count in reasons.items()
+            ]
+
+    def limit(self, family: str, samples: Iterable[Any], max_series: Optional[int]) -> Iterator[Any]:
+        """Pass at most max_series samples through, counting the rest as dropped."""
+        self.record(family, "budget", 0)
+        if max_series is None:
+            yield from samples
+            return
+        dropped = 0
+        for index, sample in enumerate(samples):
+            if index < max_series:
+                yield sample
+            else:
+                dropped += 1
+        self.record(family, "budget", dropped)
+
+
+def dropped_series_of(context) -> DroppedSeries:
+    """Dropped series of a scrape, kept on its context so that concurrent scrapes count apart."""
+    return context.cache.setdefault(DroppedSeries, DroppedSeries())
@@ -0,0 +1,18 @@
+"""Registration of the exporter collectors."""
+from prometheus_client import CollectorRegistry
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from airflow_prometheus.metrics import TasksMetricsCollector, DagsMetricsCollector,\
+    SchedulerMetricsCollector, DagBagMetricsCollector, DurationsMetricsCollector, ExporterMetricsCollector
+
+
+def register_collectors(registry: CollectorRegistry):
+    """Register all exporter collectors on the registry."""
+    registry.register(instrumentation.collector(TasksMetricsCollector()))
+    registry.register(instrumentation.collector(DagsMetricsCollector()))
+    registry.register(instrumentation.collector(SchedulerMetricsCollector()))
+    registry.register(instrumentation.collector(DagBagMetricsCollector()))
+    registry.register(instrumentation.collector(DurationsMetricsCollector()))
+    if settings.SELF_INSTRUMENTATION:
+        registry.register(ExporterMetricsCollector())
@@ -0,0 +1,85 @@
+"""Streaming Prometheus text exposition."""
+from typing import Iterable, Iterator, List
+
+from prometheus_client import REGISTRY
+from prometheus_client.metrics_core import Metric
+from prometheus_client.utils import floatToGoString
+
+# Munging of OpenMetrics types into the Prometheus text format.
+_TYPE_NAMES = {
+    "info": "gauge",
+    "stateset": "gauge",
+    "gaugehistogram": "histogram",
+    "unknown": "untyped",
+}
+_OPENMETRICS_SUFFIXES = ("_created", "_gsum", "_gcount")
+
+
+def lazy_family(family: Metric, samples: Iterable) -> Metric:
+    """Let a metric family produce its samples only while it is being exposed.
+
+    The samples iterable is consumed once, so the family must not be
+    collected twice.
+    """
+    family.samples = samples
+    return family
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _sample_line(sample) -> str:
+    if sample.labels:
+        labelstr = "{%s}" % ",".join(
+            '%s="%s"' % (name, _escape(value)) for name, value in sorted(sample.labels.items())
+        )
+    else:
+        labelstr = ""
+    timestamp = ""
+    if sample.timestamp is not None:
+        # Convert to milliseconds.
+        timestamp = " %d" % int(float(sample.timestamp) * 1000)
+    return "%s%s %s%s\n" % (sample.name, labelstr, floatToGoString(sample.value), timestamp)
+
+
+def _header(name: str, documentation: str, type_name: str) -> str:
+    documentation = documentation.replace("\\", r"\\").replace("\n", r"\n")
+    return "# HELP %s %s\n# TYPE %s %s\n" % (name, documentation, name, type_name)
+
+
+def generate_stream(registry=REGISTRY, batch_size: int = 1000) -> Iterator[bytes]:
+    """Same output as prometheus_client.generate_latest, produced in chunks.
+
+    Every chunk holds at most batch_size lines, so memory use is bounded by
+    the batch size as long as collectors produce their samples lazily.
+    """
+    lines: List[str] = []
+    for metric in registry.collect():
+        name = metric.name
+        type_name = metric.type
+        if type_name == "counter":
+            name += "_total"
+        elif type_name == "info":
+            name += "_info"
+        type_name = _TYPE_NAMES.get(type_name, type_name)
+        lines.append(_header(name, metric.documentation, type_name))
+
+        openmetrics_lines = dict()
+        for sample in metric.samples:
+            for suffix in _OPENMETRICS_SUFFIXES:
+                if sample.name == metric.name + suffix:
+                    # OpenMetrics specific sample, put in a gauge at the end.
+                    openmetrics_lines.setdefault(suffix, []).append(_sample_line(sample))
+                    break
+            else:
+                lines.append(_sample_line(sample))
+                if len(lines) >= batch_size:
+                    yield "".join(lines).encode("utf-8")
+                    lines = []
+
+        for suffix, suffix_lines in sorted(openmetrics_lines.items()):
+            lines.append(_header(metric.name + suffix, metric.documentation, "gauge"))
+            lines.extend(suffix_lines)
+    if lines:
+        yield "".join(lines).encode("utf-8")
@@ -0,0 +1,33 @@
+"""Annotation readers of failed DAG runs, task failures and retries."""
+from typing import Callable, List
+
+from airflow_prometheus.grafana_data.registry import data_generators as dg
+from airflow_prometheus.grafana_data.serialization import Table
+from airflow_prometheus.stat import AnnotationEvent, get_failed_dag_runs, get_task_failures, get_task_retries
+
+
+def _events_table(kind: str, events: List[AnnotationEvent]) -> Table:
+    def name(event: AnnotationEvent) -> str:
+        return event.dag_id if event.task_id is None else f"{event.dag_id}.{event.task_id}"
+
+    return Table(dict(
+        time=[event.time for event in events],
+        title=[f"{kind}: {name(event)}" for event in events],
+        text=[f"{name(event)} of {event.execution_date.isoformat()}: {event.detail}" for event in events],
+        tags=[[kind, event.dag_id] for event in events],
+    ))
+
+
+def annotation_reader(kind: str, get_events: Callable[..., List[AnnotationEvent]]):
+    """Reader of "<kind>:*" (all DAGs) and "<kind>:<dag_id>" annotation queries."""
+    def reader(target, ts_range) -> Table:
+        dag_ids = None if target in ('', '*') else [target]
+        return _events_table(kind, get_events(ts_range['$gt'], ts_range['$lte'], dag_ids=dag_ids))
+
+    return reader
+
+
+def init_annotation_readers():
+    dg.add_annotation_reader("failed_dag_runs", annotation_reader("failed_dag_runs", get_failed_dag_runs))
+    dg.add_annotation_reader("task_failures", annotation_reader("task_failures", get_task_failures))
+    dg.add_annotation_reader("task_retries", annotation_reader("task_retries", get_task_retries))
@@ -0,0 +1,42 @@
+"""Blueprint of the JSON datasource, importing its views on the first request."""
+from importlib import import_module
+
+from flask import Blueprint
+
+pandas_component = Blueprint('pandas-component', __name__, url_prefix='/metrics/json')
+methods = ['GET', 'POST']
+
+# (rule, module of grafana_data, view function)
+ROUTES = [
+    ('/', 'service', 'hello_world'),
+    ('/search', 'service', 'find_metrics'),
+    ('/query', 'service', 'query_metrics'),
+    ('/annotations', 'service', 'query_annotations'),
+    ('/panels', 'service', 'get_panel'),
+    ('/tag-keys', 'data', 'tag_keys'),
+    ('/tag-values', 'data', 'tag_values'),
+]
+
+
+@pandas_component.record_once
+def exempt_from_csrf(state):
+    # Grafana posts its JSON queries without a CSRF token.
+    from airflow.www.app import csrf
+
+    csrf.exempt(pandas_component)
+
+
+def lazy_view(module, name):
+    """View that imports pandas and registers the JSON exporters only when it is first called."""
+    def view():
+        from airflow_prometheus.prometheus_exporter import ensure_initialized
+
+        ensure_initialized()
+        return getattr(import_module('airflow_prometheus.grafana_data.' + module), name)()
+
+    view.__name__ = name
+    return view
+
+
+for rule, module, name in ROUTES:
+    pandas_component.add_url_rule(rule, name, lazy_view(module, name), methods=methods)
@@ -0,0 +1,128 @@
+"""Cache of serialized JSON datasource responses, shared by concurrent identical requests."""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Requests that waited for the identical request being computed.
+    coalesced: int = 0
+    evictions: int = 0
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.payload: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache(object):
+    """Payloads by key, expiring after a TTL and evicted least recently used beyond a size budget.
+
+    Only one thread computes a missing key, the others asking for it meanwhile
+    wait for its payload (or its error, which is not cached).
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = ResponseCacheStats()
+        self.size = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], bytes]) -> bytes:
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats.misses += 1
+            else:
+                self.stats.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.payload
+
+        try:
+            flight.payload = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        else:
+            self._store(key, flight.payload)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.payload
+
+    def collect(self):
+        """Hit, eviction and size metrics of the cache."""
+        json_cache_requests = CounterMetricFamily(
+            "airflow_prometheus_json_cache_requests",
+            "Requests for cached JSON datasource responses by result",
+            labels=["result"],
+        )
+        json_cache_requests.add_metric(["hit"], self.stats.hits)
+        json_cache_requests.add_metric(["miss"], self.stats.misses)
+        json_cache_requests.add_metric(["coalesced"], self.stats.coalesced)
+        yield json_cache_requests
+
+        json_cache_evictions = CounterMetricFamily(
+            "airflow_prometheus_json_cache_evictions",
+            "JSON datasource responses evicted from the cache before they expired",
+        )
+        json_cache_evictions.add_metric([], self.stats.evictions)
+        yield json_cache_evictions
+
+        json_cache_size = GaugeMetricFamily(
+            "airflow_prometheus_json_cache_bytes",
+            "Size of the cached JSON datasource responses in bytes",
+        )
+        json_cache_size.add_metric([], self.size)
+        yield json_cache_size
+
+    def _store(self, key: Hashable, payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.stats.evictions += 1
+
+
+response_cache = ResponseCache(settings.JSON_CACHE_TTL, settings.JSON_CACHE_MAX_BYTES)
+instrumentation.register_metrics(response_cache.collect)
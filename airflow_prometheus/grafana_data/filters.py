@@ -0,0 +1,106 @@
+"""Grafana ad-hoc filters, pushed down into metric readers or applied to their results."""
+import re
+from typing import Any, Collection, Dict, Iterable, List, NamedTuple, Pattern, Tuple
+
+import numpy as np
+
+from airflow_prometheus.grafana_data.serialization import Table
+
+# Operators of Grafana ad-hoc filters; "=|" and "!=|" are the multi-value variants.
+EQUAL_OPERATORS = ("=", "=|")
+NOT_EQUAL_OPERATORS = ("!=", "!=|")
+REGEX_OPERATORS = ("=~",)
+NOT_REGEX_OPERATORS = ("!~",)
+OPERATORS = EQUAL_OPERATORS + NOT_EQUAL_OPERATORS + REGEX_OPERATORS + NOT_REGEX_OPERATORS
+
+
+class AdHocFilter(NamedTuple):
+    key: str
+    operator: str
+    # A row matches any of the values (none of them for negated operators).
+    values: Tuple[str, ...]
+    # Anchored like Prometheus label matchers.
+    patterns: Tuple[Pattern, ...] = ()
+
+    @property
+    def negated(self) -> bool:
+        return self.operator in NOT_EQUAL_OPERATORS + NOT_REGEX_OPERATORS
+
+    @property
+    def is_regex(self) -> bool:
+        return self.operator in REGEX_OPERATORS + NOT_REGEX_OPERATORS
+
+    def matches(self, value: Any) -> bool:
+        if self.is_regex:
+            found = any(pattern.fullmatch(str(value)) for pattern in self.patterns)
+        else:
+            found = str(value) in self.values
+        return found != self.negated
+
+    def mask(self, column: np.ndarray) -> np.ndarray:
+        """matches() of every value of a column."""
+        column = column.astype(str)
+        if self.is_regex:
+            found = np.fromiter(
+                (any(pattern.fullmatch(value) for pattern in self.patterns) for value in column),
+                dtype=bool, count=len(column),
+            )
+        else:
+            found = np.isin(column, self.values)
+        return ~found if self.negated else found
+
+
+class FilterSet(object):
+    """The ad-hoc filters of a query, all of which must match."""
+
+    def __init__(self, filters: Iterable[AdHocFilter] = ()):
+        self.filters: List[AdHocFilter] = list(filters)
+
+    @classmethod
+    def from_grafana(cls, ad_hoc_filters: List[Dict[str, Any]]) -> "FilterSet":
+        """Filters of the adhocFilters of a query; raises ValueError for unsupported operators."""
+        filters = []
+        for ad_hoc_filter in ad_hoc_filters:
+            operator = ad_hoc_filter.get("operator", "=")
+            if operator not in OPERATORS:
+                raise ValueError("Unsupported ad-hoc filter operator %r" % operator)
+            values = ad_hoc_filter.get("values")
+            if values is None:
+                values = [ad_hoc_filter.get("value", "")]
+            values = tuple(str(value) for value in values)
+            patterns = ()
+            if operator in REGEX_OPERATORS + NOT_REGEX_OPERATORS:
+                try:
+                    patterns = tuple(re.compile(value) for value in values)
+                except re.error as error:
+                    raise ValueError("Invalid ad-hoc filter regex: %s" % error)
+            filters.append(AdHocFilter(ad_hoc_filter["key"], operator, values, patterns))
+        return cls(filters)
+
+    def __bool__(self) -> bool:
+        return bool(self.filters)
+
+    def cache_key(self) -> Tuple:
+        return tuple((ad_hoc_filter.key, ad_hoc_filter.operator, ad_hoc_filter.values) for ad_hoc_filter in self.filters)
+
+    def only(self, keys: Collection[str]) -> "FilterSet":
+        return FilterSet(ad_hoc_filter for ad_hoc_filter in self.filters if ad_hoc_filter.key in keys)
+
+    def without(self, keys: Collection[str]) -> "FilterSet":
+        return FilterSet(ad_hoc_filter for ad_hoc_filter in self.filters if ad_hoc_filter.key not in keys)
+
+    def allows(self, key: str, value: Any) -> bool:
+        """Whether a value of the key passes every filter on that key."""
+        return all(ad_hoc_filter.matches(value) for ad_hoc_filter in self.filters if ad_hoc_filter.key == key)
+
+    def apply(self, frame):
+        """Rows of a Table or DataFrame that pass the filters; filters on columns it lacks are ignored."""
+        mask = None
+        for ad_hoc_filter in self.filters:
+            if ad_hoc_filter.key not in frame.columns:
+                continue
+            filter_mask = ad_hoc_filter.mask(np.asarray(frame[ad_hoc_filter.key]))
+            mask = filter_mask if mask is None else mask & filter_mask
+        if mask is None:
+            return frame
+        return frame.filter(mask) if isinstance(frame, Table) else frame.loc[mask]
@@ -11,7 +11,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from typing import Dict, Callable
+from typing import Collection, Dict, Callable, FrozenSet, Set
 from dataclasses import dataclass, field
 
 
@@ -23,12 +23,25 @@ class DataGenerators:
     """
 
     metric_readers: Dict[str, Callable] = field(default_factory=dict)
+    # Ad-hoc filter keys the metric readers apply themselves (see add_metric_reader).
+    metric_pushdown: Dict[str, FrozenSet[str]] = field(default_factory=dict)
+    # Metric readers that aggregate per intervalMs themselves.
+    bucketed_readers: Set[str] = field(default_factory=set)
     metric_finders: Dict[str, Callable] = field(default_factory=dict)
     annotation_readers: Dict[str, Callable] = field(default_factory=dict)
     panel_readers: Dict[str, Callable] = field(default_factory=dict)
 
-    def add_metric_reader(self, name, reader):
+    def add_metric_reader(self, name, reader, pushdown: Collection[str] = (), bucketed: bool = False):
+        """
+        Readers with pushdown keys are called with a third argument, the
+        FilterSet of the ad-hoc filters on those keys. Filters on other keys
+        are applied to the returned frames. Bucketed readers also get the
+        interval_ms keyword argument, the interval of the panel.
+        """
         self.metric_readers[name] = reader
+        self.metric_pushdown[name] = frozenset(pushdown)
+        if bucketed:
+            self.bucketed_readers.add(name)
 
     def add_metric_finder(self, name, finder):
         self.metric_finders[name] = finder
@@ -0,0 +1,197 @@
+"""Grafana table and timeseries JSON of reader results, without pandas for Table and TimeSeries results."""
+import datetime
+import json
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def column_header(name: str) -> Dict[str, Any]:
+    """Grafana column of a table, node graph arc columns get their fixed colour."""
+    if "node_graph_" in name:
+        colour = name.replace("node_graph_", "")
+        return dict(
+            text=f"arc__{colour}",
+            color=dict(
+                mode="fixed",
+                fixedColor=colour,
+            )
+        )
+    return {"text": name,}
+
+
+def _column(values) -> np.ndarray:
+    if isinstance(values, np.ndarray):
+        return values
+    # Object arrays keep Python values and concatenate across dtypes.
+    column = np.array(values, dtype=object)
+    if column.ndim > 1:
+        # Sequences as values (e.g. annotation tags) must not become dimensions.
+        column = np.empty(len(values), dtype=object)
+        for index, value in enumerate(values):
+            column[index] = value
+    return column
+
+
+class Table(object):
+    """Columnar table returned by readers, the meta (e.g. name) is merged into its Grafana frame."""
+
+    def __init__(self, columns: Dict[str, Any], meta: Optional[Dict[str, Any]] = None):
+        self.columns: Dict[str, np.ndarray] = {name: _column(values) for name, values in columns.items()}
+        self.meta = meta or dict()
+
+    @classmethod
+    def from_rows(cls, names: Sequence[str], rows: Sequence[Sequence], meta: Optional[Dict[str, Any]] = None):
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        return cls(dict(zip(names, (list(column) for column in columns))), meta)
+
+    @classmethod
+    def concat(cls, names: Sequence[str], tables: Iterable["Table"]) -> "Table":
+        tables = list(tables)
+        return cls({
+            name: np.concatenate([table[name] for table in tables]) if tables else _column([])
+            for name in names
+        })
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def with_meta(self, **meta) -> "Table":
+        """The same columns (not copied) with other frame metadata."""
+        return Table(self.columns, meta)
+
+    def filter(self, mask: np.ndarray) -> "Table":
+        return Table({name: values[mask] for name, values in self.columns.items()}, self.meta)
+
+    def rows(self) -> List[tuple]:
+        columns = []
+        for values in self.columns.values():
+            if values.dtype.kind == "f":
+                values = np.where(np.isnan(values), None, values)
+            columns.append(values.tolist())
+        return list(zip(*columns))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {**self.meta,
+                'type': 'table',
+                'columns': [column_header(name) for name in self.columns],
+                'rows': self.rows()}
+
+
+class TimeSeries(object):
+    """Datapoints of one Grafana target; timestamps are datetime64, datetimes or epoch milliseconds."""
+
+    def __init__(self, target: str, timestamps: Any, values: Any):
+        self.target = target
+        self.timestamps = np.asarray(timestamps)
+        self.values = np.asarray(values, dtype=float)
+
+    def to_json(self, interval_ms: Optional[int] = None) -> Dict[str, Any]:
+        timestamps = epoch_milliseconds(self.timestamps)
+        values = self.values
+        present = ~np.isnan(values)
+        timestamps, values = timestamps[present], values[present]
+        if interval_ms:
+            timestamps, values = _resample_mean(timestamps, values, interval_ms)
+        else:
+            order = np.argsort(timestamps, kind="stable")
+            timestamps, values = timestamps[order], values[order]
+        return {'target': '%s' % (self.target),
+                'datapoints': list(zip(values.tolist(), timestamps.tolist()))}
+
+
+def epoch_milliseconds(timestamps: np.ndarray) -> np.ndarray:
+    if timestamps.dtype.kind == "M":
+        return timestamps.astype("datetime64[ms]").astype(np.int64)
+    if timestamps.dtype.kind in "iuf":
+        return timestamps.astype(np.int64)
+    # Timezone aware datetimes, which numpy cannot convert itself.
+    return np.fromiter(
+        (int(timestamp.timestamp() * 1000) for timestamp in timestamps), dtype=np.int64, count=len(timestamps),
+    )
+
+
+def _resample_mean(timestamps: np.ndarray, values: np.ndarray, interval_ms: int):
+    """Mean per interval labelled and closed on the right, like DataFrame.resample(label/closed='right')."""
+    buckets = -(-timestamps // interval_ms) * interval_ms
+    labels, inverse = np.unique(buckets, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(labels))
+    counts = np.bincount(inverse, minlength=len(labels))
+    return labels, sums / counts
+
+
+def table_response(target, result) -> List[Dict[str, Any]]:
+    """Grafana table frames of a Table, a list of Tables or DataFrame results."""
+    if isinstance(result, Table):
+        return [result.to_json()] if len(result) else []
+    if isinstance(result, list) and all(isinstance(item, Table) for item in result):
+        return [table.to_json() for table in result]
+    from airflow_prometheus.grafana_data.util import dataframe_to_json_table
+
+    return dataframe_to_json_table(target, result)
+
+
+def timeseries_response(target, result, interval_ms: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Grafana timeseries of a TimeSeries, a list of TimeSeries or DataFrame results."""
+    if isinstance(result, TimeSeries):
+        return [result.to_json(interval_ms)]
+    if isinstance(result, list) and all(isinstance(item, TimeSeries) for item in result):
+        return [series.to_json(interval_ms) for series in result]
+    from airflow_prometheus.grafana_data.util import dataframe_to_response
+
+    return dataframe_to_response(target, result, freq=None if interval_ms is None else f"{interval_ms}ms")
+
+
+def annotations_response(annotation, result) -> List[Dict[str, Any]]:
+    """Grafana annotations of a Table with time, title and optional text and tags columns, or of DataFrames."""
+    if not isinstance(result, Table):
+        from airflow_prometheus.grafana_data.util import annotations_to_response
+
+        return annotations_to_response(annotation, result)
+    columns = dict(time=epoch_milliseconds(result['time']).tolist())
+    for name in ('title', 'text', 'tags'):
+        if name in result.columns:
+            columns[name] = result[name].tolist()
+    return [
+        dict(annotation=annotation, **dict(zip(columns, row)))
+        for row in zip(*columns.values())
+    ]
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError("Object of type %s is not JSON serializable" % type(value).__name__)
+
+
+def dumps(value) -> bytes:
+    """JSON of a response, encoded with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def concat_arrays(payloads: Iterable[bytes]) -> bytes:
+    """One JSON array of the items of serialized JSON arrays."""
+    return b"[" + b",".join(payload[1:-1] for payload in payloads if payload != b"[]") + b"]"
+
+
+def json_response(value) -> Response:
+    """Response of a value or of its already serialized JSON."""
+    return Response(value if isinstance(value, bytes) else dumps(value), mimetype="application/json")
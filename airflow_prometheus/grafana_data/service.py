@@ -11,28 +11,35 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from flask import Blueprint, request, jsonify, abort
-from airflow.models.dagbag import DagBag
-from flask_admin.base import expose_plugview
-import pandas as pd
+from flask import request, abort
 import datetime
 
-from airflow.www.app import csrf
+from airflow_prometheus.grafana_data.cache import response_cache
+from airflow_prometheus.grafana_data.filters import FilterSet
 from airflow_prometheus.grafana_data.registry import data_generators as dg
-from airflow_prometheus.grafana_data.util import dataframe_to_response, dataframe_to_json_table, annotations_to_response
+from airflow_prometheus.grafana_data.serialization import annotations_response, concat_arrays, dumps, \
+    json_response, table_response, timeseries_response
 
-pandas_component = Blueprint('pandas-component', __name__, url_prefix='/metrics/json')
-methods = ['GET', 'POST']
+
+def parse_time(value: str) -> datetime.datetime:
+    """Timezone aware datetime of an ISO 8601 time sent by Grafana, e.g. 2021-06-01T10:00:00.000Z."""
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def align_to_interval(moment: datetime.datetime, interval_ms: int, up: bool) -> datetime.datetime:
+    """Moment rounded down (or up) to a multiple of the interval, so that nearby requests share the cache."""
+    interval = datetime.timedelta(milliseconds=interval_ms)
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=moment.tzinfo)
+    aligned = epoch + (moment - epoch) // interval * interval
+    if up and aligned < moment:
+        aligned += interval
+    return aligned
 
 
-@csrf.exempt
-@pandas_component.route('/', methods=methods)
 def hello_world():
     return 'Jether\'s Grafana Pandas Datasource, used for rendering HTML panels and timeseries data.'
 
 
-@csrf.exempt
-@pandas_component.route('/search', methods=methods)
 def find_metrics():
     req = request.get_json()
 
@@ -43,6 +50,10 @@ def find_metrics():
     if target == '':
         target = '*'
 
+    return json_response(response_cache.get_or_compute(('search', target), lambda: dumps(_find_metrics(target))))
+
+
+def _find_metrics(target):
     if ':' in target:
         finder, target = target.split(':', 1)
     else:
@@ -58,76 +69,100 @@ def find_metrics():
         else:
             metrics.append(target)
 
-        metrics = list(set(metrics))
-        return jsonify(metrics)
+        return list(set(metrics))
     else:
-        return jsonify(list(set(dg.metric_finders[finder](target))))
+        return list(set(dg.metric_finders[finder](target)))
 
 
-@csrf.exempt
-@pandas_component.route('/query', methods=methods)
 def query_metrics():
     req = request.get_json()
 
     results = []
-    ad_hoc_filters = []
-    freq = None
+    ad_hoc_filters = FilterSet()
+    interval_ms = None
     targets = [dict(target="dags", type="table")]
     data_range_from, data_range_to = None, None
     if req is not None:
         if 'adhocFilters' in req:
-            ad_hoc_filters = req['adhocFilters']
+            try:
+                ad_hoc_filters = FilterSet.from_grafana(req['adhocFilters'])
+            except ValueError as error:
+                abort(400, str(error))
         if 'targets' in req:
             targets = req['targets']
         if 'intervalMs' in req:
-            freq = str(req.get('intervalMs')) + 'ms'
+            interval_ms = int(req.get('intervalMs'))
         if 'range' in req:
             if 'from' in req['range']:
-                data_range_from = pd.Timestamp(req['range']['from']).to_pydatetime()
+                data_range_from = parse_time(req['range']['from'])
             if 'to' in req['range']:
-                data_range_to = pd.Timestamp(req['range']['to']).to_pydatetime()
+                data_range_to = parse_time(req['range']['to'])
 
     if data_range_from is None:
-        data_range_from = pd.Timestamp.min.to_pydatetime()
+        data_range_from = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+    elif interval_ms:
+        data_range_from = align_to_interval(data_range_from, interval_ms, up=False)
     if data_range_to is None:
-        data_range_to = datetime.datetime.now().timestamp()
+        data_range_to = datetime.datetime.now(datetime.timezone.utc)
+    if interval_ms:
+        data_range_to = align_to_interval(data_range_to, interval_ms, up=True)
 
     ts_range = {'$gt': data_range_from,
                 '$lte': data_range_to}
 
     for target in targets:
         req_type = target.get('type', 'timeserie')
-
         target = target['target']
-        arg = target
-        if ":" in target:
-            [target, arg] = target.split(':')
-        query_results = dg.metric_readers[target](arg, ts_range)
-
-        for ad_hoc_filter in ad_hoc_filters:
-            assert ad_hoc_filter["operator"] == "="
-            if isinstance(query_results, list):
-                query_results = [(meta, df.loc[df[ad_hoc_filter["key"]] == ad_hoc_filter["value"]]) for (meta, df) in query_results]
-            else:
-                query_results = query_results.loc[query_results[ad_hoc_filter["key"]] == ad_hoc_filter["value"]]
-
-        if req_type == 'table':
-            results.extend(dataframe_to_json_table(target, query_results))
-        else:
-            results.extend(dataframe_to_response(target, query_results, freq=freq))
-
-    return jsonify(results)
+        if not interval_ms:
+            # Unaligned ranges (e.g. ending now) never repeat, caching them would only evict other responses.
+            results.append(_query_target(target, req_type, ts_range, ad_hoc_filters, interval_ms))
+            continue
+        key = ('query', target, req_type, ad_hoc_filters.cache_key(), data_range_from, data_range_to, interval_ms)
+        results.append(response_cache.get_or_compute(
+            key,
+            lambda: _query_target(target, req_type, ts_range, ad_hoc_filters, interval_ms),
+        ))
+
+    return json_response(concat_arrays(results))
+
+
+def _query_target(target, req_type, ts_range, ad_hoc_filters, interval_ms) -> bytes:
+    arg = target
+    if ":" in target:
+        [target, arg] = target.split(':')
+    pushdown = dg.metric_pushdown.get(target, frozenset())
+    args = [arg, ts_range]
+    if pushdown:
+        args.append(ad_hoc_filters.only(pushdown))
+    kwargs = dict(interval_ms=interval_ms) if target in dg.bucketed_readers else dict()
+    query_results = dg.metric_readers[target](*args, **kwargs)
+
+    # Filters the reader could not apply itself.
+    post_filters = ad_hoc_filters.without(pushdown)
+    if post_filters:
+        if isinstance(query_results, list):
+            query_results = [
+                post_filters.apply(item) if hasattr(item, 'columns') else (item[0], post_filters.apply(item[1]))
+                for item in query_results
+            ]
+        elif hasattr(query_results, 'columns'):
+            query_results = post_filters.apply(query_results)
+
+    if req_type == 'table':
+        return dumps(table_response(target, query_results))
+    if target in dg.bucketed_readers:
+        # Already aggregated per interval by the database, resampling would average sums and means.
+        return dumps(timeseries_response(target, query_results))
+    return dumps(timeseries_response(target, query_results, interval_ms))
 
 
-@csrf.exempt
-@pandas_component.route('/annotations', methods=methods)
 def query_annotations():
     req = request.get_json()
 
     results = []
 
-    ts_range = {'$gt': pd.Timestamp(req['range']['from']).to_pydatetime(),
-                '$lte': pd.Timestamp(req['range']['to']).to_pydatetime()}
+    ts_range = {'$gt': parse_time(req['range']['from']),
+                '$lte': parse_time(req['range']['to'])}
 
     query = req['annotation']['query']
 
@@ -135,18 +170,16 @@ def query_annotations():
         abort(404, Exception('Target must be of type: <finder>:<metric_query>, got instead: ' + query))
 
     finder, target = query.split(':', 1)
-    results.extend(annotations_to_response(query, dg.annotation_readers[finder](target, ts_range)))
+    results.extend(annotations_response(query, dg.annotation_readers[finder](target, ts_range)))
 
-    return jsonify(results)
+    return json_response(results)
 
 
-@csrf.exempt
-@pandas_component.route('/panels', methods=methods)
 def get_panel():
     req = request.args
 
-    ts_range = {'$gt': pd.Timestamp(int(req['from']), unit='ms').to_pydatetime(),
-                '$lte': pd.Timestamp(int(req['to']), unit='ms').to_pydatetime()}
+    ts_range = {'$gt': datetime.datetime.fromtimestamp(int(req['from']) / 1000, datetime.timezone.utc),
+                '$lte': datetime.datetime.fromtimestamp(int(req['to']) / 1000, datetime.timezone.utc)}
 
     query = req['query']
 
@@ -0,0 +1,64 @@
+"""Historical timeseries readers, aggregated per panel interval by the database."""
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from airflow_prometheus.grafana_data.filters import FilterSet
+from airflow_prometheus.grafana_data.registry import data_generators as dg
+from airflow_prometheus.grafana_data.serialization import TimeSeries
+from airflow_prometheus.stat import BucketValue, dag_bag_provider, get_dag_run_count_buckets, \
+    get_dag_run_duration_buckets, get_queue_wait_buckets, get_task_duration_buckets
+
+# Bucket size used when Grafana does not send the interval of the panel.
+DEFAULT_INTERVAL_MS = 60 * 1000
+
+
+def _selected_dag_ids(name: str, arg: str, filters: FilterSet) -> Optional[List[str]]:
+    """DAGs of "<name>:<dag_id>" and the dag_id ad-hoc filters, None for all of them."""
+    if arg == name and not filters:
+        return None
+    return [
+        dag.dag_id for dag in dag_bag_provider.get_dags()
+        if (arg == name or dag.dag_id == arg) and filters.allows("dag_id", dag.dag_id)
+    ]
+
+
+def _to_series(target: str, values: List[BucketValue]) -> List[TimeSeries]:
+    """One series of the values without a key, or one per key otherwise."""
+    by_key: Dict[Optional[str], List[BucketValue]] = dict()
+    for value in values:
+        by_key.setdefault(value.key, []).append(value)
+    if not by_key:
+        return [TimeSeries(target, np.array([], dtype=np.int64), [])]
+    return [
+        TimeSeries(
+            target if key is None else f"{target} {key}",
+            np.array([value.bucket for value in key_values], dtype=np.int64) * 1000,
+            [value.value for value in key_values],
+        )
+        for key, key_values in sorted(by_key.items(), key=lambda item: str(item[0]))
+    ]
+
+
+def bucketed_reader(name: str, get_buckets: Callable[..., List[BucketValue]]):
+    """Reader of "<name>" and "<name>:<dag_id>" targets over a stat function of bucketed values."""
+    def reader(arg, ts_range, filters: FilterSet, interval_ms: Optional[int] = None) -> List[TimeSeries]:
+        dag_ids = _selected_dag_ids(name, arg, filters)
+        if dag_ids is not None and not dag_ids:
+            return []
+        # Rounded up, Grafana expects at most one point per interval.
+        interval_seconds = max(1, -(-(interval_ms or DEFAULT_INTERVAL_MS) // 1000))
+        values = get_buckets(ts_range['$gt'], ts_range['$lte'], interval_seconds, dag_ids=dag_ids)
+        return _to_series(name if arg == name else f"{name}:{arg}", values)
+
+    return reader
+
+
+def init_timeseries_readers():
+    for name, get_buckets in (
+        ("task_duration", get_task_duration_buckets),
+        ("dag_run_duration", get_dag_run_duration_buckets),
+        ("dag_runs", get_dag_run_count_buckets),
+        ("queue_wait", get_queue_wait_buckets),
+    ):
+        dg.add_metric_reader(name, bucketed_reader(name, get_buckets), pushdown=["dag_id"], bucketed=True)
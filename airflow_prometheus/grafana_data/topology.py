@@ -0,0 +1,142 @@
+"""Node graph of the DAGs: structure cached per parsed DAG, states overlaid per request."""
+import threading
+from collections import OrderedDict
+from typing import Collection, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from airflow.models import DAG
+
+from airflow_prometheus.grafana_data.serialization import Table
+from airflow_prometheus.stat import LatestTaskInfo, ProcessingState
+
+NODE_COLUMNS = ["id", "task_id", "dag_id", "title", "subTitle"]
+EDGE_COLUMNS = ["id", "source", "target", "dag_id", "task_id"]
+
+# Arc colours of the node graph and the states they stand for, every other state is gray.
+STATE_COLOURS = {
+    "green": [ProcessingState.SUCCESS],
+    "red": [ProcessingState.FAILED],
+    "yellow": [],
+    "purple": [ProcessingState.RUNNING],
+}
+
+
+def node_id(dag_id: str, task_id: str) -> str:
+    """Node id of a task, unique across DAGs ('/' cannot occur in DAG ids)."""
+    return f"{dag_id}/{task_id}"
+
+
+class Topology(NamedTuple):
+    nodes: Table
+    edges: Table
+
+
+def build_dag_topology(dag: DAG) -> Topology:
+    tasks = dag.tasks
+    nodes = Table(dict(
+        id=[node_id(dag.dag_id, task.task_id) for task in tasks],
+        task_id=[task.task_id for task in tasks],
+        dag_id=[dag.dag_id] * len(tasks),
+        title=[task.task_id for task in tasks],
+        subTitle=[task.__class__.__name__ for task in tasks],
+    ))
+    edges = []
+    for task in tasks:
+        source = node_id(dag.dag_id, task.task_id)
+        for downstream in task.downstream_list:
+            if downstream.task_id == task.task_id:
+                continue
+            target = node_id(dag.dag_id, downstream.task_id)
+            edges.append((f"{source}--{target}", source, target, dag.dag_id, task.task_id))
+    return Topology(nodes, Table.from_rows(EDGE_COLUMNS, edges))
+
+
+class TopologyCache(object):
+    """Topologies of the DAGs of the DagBag.
+
+    The DagBag provider only re-parses changed files, so a new DAG object is a
+    new version of the DAG: only those are rebuilt. The topology of every DAG
+    is kept until the DAG leaves the DagBag, whatever the requests select, and
+    the concatenated graphs of the latest selections are reused as long as
+    none of their DAGs changed.
+    """
+
+    def __init__(self, max_selections: int = 64):
+        self.max_selections = max_selections
+        self._lock = threading.Lock()
+        self._dags: Dict[str, Tuple[DAG, Topology]] = dict()
+        # Combined topologies by the identities of the selected DAGs.
+        self._combined: "OrderedDict[Tuple[int, ...], Topology]" = OrderedDict()
+
+    def get(self, dags: List[DAG], loaded_dag_ids: Collection[str]) -> Topology:
+        """Combined topology of the selected DAGs, loaded_dag_ids are all the DAGs of the DagBag."""
+        # The cached DAG objects are kept alive, so their ids cannot be reused.
+        versions = tuple(id(dag) for dag in dags)
+        with self._lock:
+            combined = self._combined.get(versions)
+            if combined is not None:
+                self._combined.move_to_end(versions)
+                return combined
+            replaced = False
+            for dag in dags:
+                entry = self._dags.get(dag.dag_id)
+                if entry is None or entry[0] is not dag:
+                    self._dags[dag.dag_id] = (dag, build_dag_topology(dag))
+                    replaced = replaced or entry is not None
+            removed = [dag_id for dag_id in self._dags if dag_id not in loaded_dag_ids]
+            for dag_id in removed:
+                del self._dags[dag_id]
+            if replaced or removed:
+                # The released DAG objects may be freed and their ids reused.
+                self._combined.clear()
+
+            topologies = [self._dags[dag.dag_id][1] for dag in dags]
+            if len(topologies) == 1:
+                combined = topologies[0]
+            else:
+                combined = Topology(
+                    Table.concat(NODE_COLUMNS, (topology.nodes for topology in topologies)),
+                    Table.concat(EDGE_COLUMNS, (topology.edges for topology in topologies)),
+                )
+            self._combined[versions] = combined
+            while len(self._combined) > self.max_selections:
+                self._combined.popitem(last=False)
+            return combined
+
+
+def _positions(keys: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Position of every id in the unique keys, -1 for the missing ones."""
+    if len(keys) == 0:
+        return np.full(len(ids), -1)
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    found = np.minimum(np.searchsorted(sorted_keys, ids), len(keys) - 1)
+    return np.where(sorted_keys[found] == ids, order[found], -1)
+
+
+def overlay_states(nodes: Table, latest_tasks_info: Dict[str, Dict[str, LatestTaskInfo]]) -> Table:
+    """Nodes with the state and duration of their latest task instance and the arc colours."""
+    infos = [info for tasks in latest_tasks_info.values() for info in tasks.values()]
+    keys = np.array([node_id(info.dag_id, info.task_id) for info in infos], dtype=object)
+    # The trailing entry is picked for nodes without a task instance (position -1).
+    states = np.array([info.state.value for info in infos] + [ProcessingState.NO_STATUS.value], dtype=object)
+    durations = np.array([f"{info.duration} sec" for info in infos] + [""], dtype=object)
+    positions = _positions(keys, nodes["id"])
+
+    node_states = states[positions]
+    columns = {name: nodes[name] for name in NODE_COLUMNS}
+    columns["mainStat"] = node_states
+    columns["secondaryStat"] = durations[positions]
+    coloured = np.zeros(len(nodes), dtype=bool)
+    for colour, colour_states in STATE_COLOURS.items():
+        in_colour = np.isin(node_states, [state.value for state in colour_states])
+        coloured |= in_colour
+        columns[f"node_graph_{colour}"] = in_colour.astype(int)
+    columns["node_graph_gray"] = (~coloured).astype(int)
+    column_order = NODE_COLUMNS + ["mainStat", "secondaryStat"] + [
+        "node_graph_%s" % colour for colour in ("green", "red", "yellow", "gray", "purple")
+    ]
+    return Table({name: columns[name] for name in column_order})
+
+
+topology_cache = TopologyCache()
@@ -2,6 +2,8 @@ import numpy as np
 import pandas as pd
 from werkzeug.exceptions import abort
 
+from airflow_prometheus.grafana_data.serialization import column_header as get_df_col, epoch_milliseconds
+
 
 def dataframe_to_response(target, df, freq=None):
     response = []
@@ -24,19 +26,6 @@ def dataframe_to_response(target, df, freq=None):
     return response
 
 
-def get_df_col(col):
-    if "node_graph_" in col:
-        col = col.replace("node_graph_", "")
-        return dict(
-            text=f"arc__{col}",
-            color=dict(
-                mode="fixed",
-                fixedColor=col,
-            )
-        )
-    return {"text": col,}
-
-
 def dataframe_to_json_table(target, df):
     response = []
     if isinstance(df, pd.DataFrame):
@@ -60,38 +49,34 @@ def dataframe_to_json_table(target, df):
 
 
 def annotations_to_response(target, df):
-    response = []
-
     # Single series with DatetimeIndex and values as text
     if isinstance(df, pd.Series):
-        for timestamp, value in df.iteritems():
-            response.append({
-                "annotation": target, # The original annotation sent from Grafana.
-                "time": timestamp.value // 10 ** 6, # Time since UNIX Epoch in milliseconds. (required)
-                "title": value, # The title for the annotation tooltip. (required)
-                #"tags": tags, # Tags for the annotation. (optional)
-                #"text": text # Text for the annotation. (optional)
-            })
-    # Dataframe with annotation text/tags for each entry
-    elif isinstance(df, pd.DataFrame):
-        for timestamp, row in df.iterrows():
-            annotation = {
+        times = epoch_milliseconds(df.index.values).tolist()
+        return [
+            {
                 "annotation": target,  # The original annotation sent from Grafana.
-                "time": timestamp.value // 10 ** 6,  # Time since UNIX Epoch in milliseconds. (required)
-                "title": row.get('title', ''),  # The title for the annotation tooltip. (required)
+                "time": time,  # Time since UNIX Epoch in milliseconds. (required)
+                "title": title,  # The title for the annotation tooltip. (required)
             }
-
-            if 'text' in row:
-                annotation['text'] = str(row.get('text'))
-            if 'tags' in row:
-                annotation['tags'] = str(row.get('tags'))
-
-            response.append(annotation)
+            for time, title in zip(times, df.tolist())
+        ]
+    # Dataframe with annotation text/tags for each entry
+    elif isinstance(df, pd.DataFrame):
+        columns = dict(
+            time=epoch_milliseconds(df.index.values).tolist(),
+            title=df['title'].tolist() if 'title' in df else [''] * len(df),
+        )
+        if 'text' in df:
+            columns['text'] = df['text'].astype(str).tolist()
+        if 'tags' in df:
+            columns['tags'] = df['tags'].astype(str).tolist()
+        return [
+            dict(annotation=target, **dict(zip(columns, row)))
+            for row in zip(*columns.values())
+        ]
     else:
         abort(404, Exception('Received object is not a dataframe or series.'))
 
-    return response
-
 
 def _series_to_annotations(df, target):
     if df.empty:
@@ -0,0 +1,248 @@
+"""Index advisor for the queries of the exporter.
+
+Explains the queries of every stat function on the metadata database,
+reports the ones that scan tables without a supporting index and
+optionally creates the recommended indexes:
+
+    airflow-prometheus-indexes report
+    airflow-prometheus-indexes create --dry-run
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import typer
+from sqlalchemy import create_engine, inspect
+
+from airflow_prometheus.query_plan import explain_stat_functions
+
+app = typer.Typer()
+
+
+@dataclass(frozen=True)
+class IndexRecommendation:
+    name: str
+    table: str
+    columns: Sequence[str]
+    # Stat functions whose plans the index improves.
+    serves: Sequence[str]
+    # Covering columns, an INCLUDE clause on Postgres and trailing key columns elsewhere.
+    include: Sequence[str] = ()
+    # Predicate of a partial index (ignored on MySQL, which lacks them).
+    where: Optional[str] = None
+
+    def ddl(self, dialect: str, server_version: Optional[Tuple[int, ...]] = None) -> str:
+        columns = list(self.columns)
+        include = ""
+        if dialect == "postgresql" and self.include and (server_version or (11,)) >= (11,):
+            include = " INCLUDE (%s)" % ", ".join(self.include)
+        else:
+            columns.extend(self.include)
+        where = " WHERE %s" % self.where if self.where and dialect != "mysql" else ""
+        if dialect == "postgresql":
+            prefix = "CREATE INDEX CONCURRENTLY IF NOT EXISTS"
+        elif dialect == "sqlite":
+            prefix = "CREATE INDEX IF NOT EXISTS"
+        else:
+            prefix = "CREATE INDEX"
+        return "%s %s ON %s (%s)%s%s" % (prefix, self.name, self.table, ", ".join(columns), include, where)
+
+
+RECOMMENDED_INDEXES = [
+    IndexRecommendation(
+        name="idx_airflow_prometheus_ti_state_aggregation",
+        table="task_instance",
+        columns=("dag_id", "task_id", "state", "operator"),
+        include=("duration", "max_tries"),
+        serves=("get_task_state_info", "get_task_state_rollup"),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_ti_dag_execution_date",
+        table="task_instance",
+        columns=("dag_id", "execution_date"),
+        include=("task_id", "state", "duration"),
+        serves=(
+            "get_latest_tasks_state_info_by_dag", "get_dag_duration_info", "get_task_duration_info",
+        ),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_ti_finished_end_date",
+        table="task_instance",
+        columns=("end_date",),
+        include=("dag_id", "task_id", "duration"),
+        where="state IN ('success', 'failed')",
+        serves=("DurationSketches.refresh",),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_ti_start_date",
+        table="task_instance",
+        columns=("start_date",),
+        serves=("get_task_scheduler_delay", "get_task_retries"),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_dr_dag_state_execution_date",
+        table="dag_run",
+        columns=("dag_id", "state", "execution_date"),
+        include=("start_date", "end_date"),
+        serves=(
+            "get_dag_state_info", "get_dag_duration_info", "get_task_duration_info",
+            "get_latest_tasks_state_info_by_dag", "get_xcom_parameter_values",
+        ),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_dr_state_execution_date",
+        table="dag_run",
+        columns=("state", "execution_date"),
+        include=("dag_id", "start_date"),
+        serves=("get_dag_scheduler_delay",),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_dr_success_end_date",
+        table="dag_run",
+        columns=("end_date",),
+        include=("dag_id", "start_date"),
+        where="state = 'success'",
+        serves=("DurationSketches.refresh",),
+    ),
+    IndexRecommendation(
+        # The primary key of Airflow 2.2 leads with key, not dag_id.
+        name="idx_airflow_prometheus_xcom_dag_execution_date",
+        table="xcom",
+        columns=("dag_id", "execution_date"),
+        serves=("get_xcom_parameter_values",),
+    ),
+    IndexRecommendation(
+        name="idx_airflow_prometheus_tf_dag_task",
+        table="task_fail",
+        columns=("dag_id", "task_id"),
+        serves=("get_task_failure_counts",),
+    ),
+]
+
+
+@dataclass
+class IndexAdvice:
+    recommendation: IndexRecommendation
+    # Name of the index that already serves the recommendation, if any.
+    existing: Optional[str]
+    # Stat functions that scan the table of the recommendation in full.
+    scanning_functions: List[str]
+
+    @property
+    def needed(self) -> bool:
+        return self.existing is None and bool(self.scanning_functions)
+
+
+def _existing_index(inspector, recommendation: IndexRecommendation) -> Optional[str]:
+    columns = list(recommendation.columns)
+    indexes = inspector.get_indexes(recommendation.table)
+    primary_key = inspector.get_pk_constraint(recommendation.table)
+    indexes.append(dict(
+        name=primary_key.get("name") or "primary key",
+        column_names=primary_key["constrained_columns"],
+    ))
+    for index in indexes:
+        if index["name"] == recommendation.name or list(index["column_names"][:len(columns)]) == columns:
+            return index["name"]
+    return None
+
+
+def advise(engine) -> Tuple[List[IndexAdvice], Dict[str, List[str]]]:
+    """Advice for every recommended index and the plan issues of every stat function."""
+    plans = explain_stat_functions(engine)
+    scanned: Set[Tuple[str, str]] = set()
+    issues: Dict[str, List[str]] = dict()
+    for function, statements in plans.items():
+        for plan in statements:
+            for issue in plan.issues:
+                scanned.add((function, issue.table))
+                issues.setdefault(function, []).append(
+                    "%s of %s: %s" % (issue.kind, issue.table or "-", issue.detail)
+                )
+
+    inspector = inspect(engine)
+    advice = []
+    for recommendation in RECOMMENDED_INDEXES:
+        table_columns = {column["name"] for column in inspector.get_columns(recommendation.table)}
+        if not table_columns.issuperset(list(recommendation.columns) + list(recommendation.include)):
+            # Written for another Airflow version, e.g. task instances keyed by run_id since 2.2.
+            continue
+        advice.append(IndexAdvice(
+            recommendation=recommendation,
+            existing=_existing_index(inspector, recommendation),
+            scanning_functions=[
+                function for function in recommendation.serves
+                if (function, recommendation.table) in scanned
+                # Cartesian products are reported without a table on Postgres.
+                or (function, None) in scanned
+            ],
+        ))
+    return advice, issues
+
+
+def _engine(database_url: Optional[str]):
+    if database_url is not None:
+        return create_engine(database_url)
+    from airflow import settings as airflow_settings
+
+    return airflow_settings.engine
+
+
+@app.command()
+def report(
+    database_url: Optional[str] = typer.Option(None, help="Defaults to the sql_alchemy_conn of Airflow"),
+):
+    """Report the exporter queries that lack supporting indexes."""
+    engine = _engine(database_url)
+    advice, issues = advise(engine)
+    for function, function_issues in sorted(issues.items()):
+        typer.echo(function)
+        for issue in function_issues:
+            typer.echo("    %s" % issue)
+    typer.echo("")
+    server_version = getattr(engine.dialect, "server_version_info", None)
+    for item in advice:
+        recommendation = item.recommendation
+        if item.existing is not None:
+            status = "exists (%s)" % item.existing
+        elif item.needed:
+            status = "recommended for %s" % ", ".join(item.scanning_functions)
+        else:
+            status = "not needed"
+        typer.echo("%s: %s" % (recommendation.name, status))
+        if item.needed:
+            typer.echo("    %s;" % recommendation.ddl(engine.dialect.name, server_version))
+
+
+@app.command()
+def create(
+    database_url: Optional[str] = typer.Option(None, help="Defaults to the sql_alchemy_conn of Airflow"),
+    all_missing: bool = typer.Option(False, "--all", help="Create every missing index, not only the needed ones"),
+    dry_run: bool = typer.Option(False, help="Only print the statements"),
+):
+    """Create the recommended indexes (concurrently on Postgres)."""
+    engine = _engine(database_url)
+    advice, _ = advise(engine)
+    missing = [
+        item.recommendation for item in advice
+        if item.existing is None and (all_missing or item.needed)
+    ]
+    server_version = getattr(engine.dialect, "server_version_info", None)
+    statements = [recommendation.ddl(engine.dialect.name, server_version) for recommendation in missing]
+    for statement in statements:
+        typer.echo("%s;" % statement)
+    if dry_run or not statements:
+        return
+    if engine.dialect.name == "postgresql":
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for statement in statements:
+                connection.execute(statement)
+    else:
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(statement)
+    typer.echo("Created %d indexes" % len(statements))
+
+
+if __name__ == "__main__":
+    app()
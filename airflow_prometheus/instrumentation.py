@@ -0,0 +1,192 @@
+"""Timings, row and series counts of the exporter itself."""
+import functools
+import inspect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from airflow_prometheus import settings
+
+_QUERY_STARTS = "airflow_prometheus_query_starts"
+
+
+@dataclass
+class QueryStats:
+    queries: int = 0
+    duration: float = 0.0
+    rows: int = 0
+
+
+def result_rows(result) -> int:
+    """Rows of the result of a stat function.
+
+    List items, the leaf values of (nested) dicts and one for any other
+    result but None. The database rows behind aggregated results are not
+    counted, SQLAlchemy 1.3 has no event for fetched rows.
+    """
+    if result is None:
+        return 0
+    if isinstance(result, (list, set, frozenset)):
+        return len(result)
+    if isinstance(result, dict):
+        return sum(result_rows(value) if isinstance(value, dict) else 1 for value in result.values())
+    return 1
+
+
+class Instrumentation(object):
+    """Statistics of the stat functions, collectors and payloads of the exporter.
+
+    Queries are attributed to the innermost stat function running on the
+    thread that executes them; queries outside of stat functions are ignored.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.queries: Dict[str, QueryStats] = dict()
+        self.collector_durations: Dict[str, float] = dict()
+        self.series: Dict[str, Dict[str, int]] = dict()
+        self.payload_size: Optional[int] = None
+        # Self-metrics of optional components (e.g. the JSON response cache), published
+        # with those of the exporter only once the component has been imported.
+        self.metric_sources: List[Callable[[], Iterable]] = []
+
+    def install(self, engine: Engine):
+        """Time the queries of the engine (idempotent)."""
+        if not self.enabled or event.contains(engine, "before_cursor_execute", self._before_execute):
+            return
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_QUERY_STARTS, []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get(_QUERY_STARTS)
+        if not starts:
+            return
+        duration = time.perf_counter() - starts.pop()
+        function = getattr(self._local, "function", None)
+        if function is None:
+            return
+        with self._lock:
+            stats = self.queries.setdefault(function, QueryStats())
+            stats.queries += 1
+            stats.duration += duration
+
+    def _record_rows(self, function: str, rows: int):
+        with self._lock:
+            self.queries.setdefault(function, QueryStats()).rows += rows
+
+    def stat_function(self, func: Callable) -> Callable:
+        """Attribute the queries and rows of a stat function to its name."""
+        if not self.enabled:
+            return func
+        name = func.__qualname__
+        local = self._local
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                rows = 0
+                generator = func(*args, **kwargs)
+                try:
+                    while True:
+                        # Rows are fetched lazily, so every step runs attributed.
+                        previous, local.function = getattr(local, "function", None), name
+                        try:
+                            row = next(generator)
+                        except StopIteration:
+                            break
+                        finally:
+                            local.function = previous
+                        rows += 1
+                        yield row
+                finally:
+                    generator.close()
+                    self._record_rows(name, rows)
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous, local.function = getattr(local, "function", None), name
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                local.function = previous
+            self._record_rows(name, result_rows(result))
+            return result
+
+        return wrapper
+
+    def collector(self, collector):
+        """Wrap a collector to time it and count the series of its families."""
+        if not self.enabled:
+            return collector
+        return InstrumentedCollector(self, collector)
+
+    def record_payload(self, size: int):
+        self.payload_size = size
+
+    def register_metrics(self, collect: Callable[[], Iterable]):
+        """Publish the metric families yielded by collect with the exporter metrics."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.metric_sources.append(collect)
+
+
+class InstrumentedCollector(object):
+    """Collector that times another one, including the lazy samples of its families."""
+
+    def __init__(self, instrumentation: Instrumentation, collector):
+        self.instrumentation = instrumentation
+        self.collector = collector
+        self.name = type(collector).__name__
+
+    def describe(self):
+        return self.collector.describe()
+
+    @staticmethod
+    def _timed(iterator: Iterator, elapsed: List[float]):
+        while True:
+            started_at = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed[0] += time.perf_counter() - started_at
+            yield item
+
+    def _counted(self, family: str, samples: Iterable, series: Dict[str, int], elapsed: List[float]):
+        count = 0
+        try:
+            for sample in self._timed(iter(samples), elapsed):
+                count += 1
+                yield sample
+        finally:
+            series[family] = series.get(family, 0) + count
+
+    def collect(self):
+        # Scrapes may run concurrently, so the totals are kept per call.
+        elapsed = [0.0]
+        series: Dict[str, int] = dict()
+        try:
+            for metric in self._timed(iter(self.collector.collect()), elapsed):
+                metric.samples = self._counted(metric.name, metric.samples, series, elapsed)
+                yield metric
+        finally:
+            # Every yielded family has been exposed once the collector is exhausted.
+            with self.instrumentation._lock:
+                self.instrumentation.collector_durations[self.name] = elapsed[0]
+                self.instrumentation.series[self.name] = series
+
+
+instrumentation = Instrumentation(settings.SELF_INSTRUMENTATION)
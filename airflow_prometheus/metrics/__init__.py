@@ -2,11 +2,15 @@ from .dags import DagsMetricsCollector
 from .scheduler import SchedulerMetricsCollector
 from .tasks import TasksMetricsCollector, check_if_can_query_tasks
 from .dag_bag import DagBagMetricsCollector
+from .durations import DurationsMetricsCollector
+from .exporter import ExporterMetricsCollector
 
 __all__ = [
     "DagsMetricsCollector",
     "SchedulerMetricsCollector",
     "TasksMetricsCollector",
     "DagBagMetricsCollector",
+    "DurationsMetricsCollector",
+    "ExporterMetricsCollector",
     "check_if_can_query_tasks",
 ]
\ No newline at end of file
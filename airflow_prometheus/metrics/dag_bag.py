@@ -1,5 +1,5 @@
 """Prometheus exporter for Airflow."""
-from prometheus_client.core import CounterMetricFamily
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 from airflow_prometheus.stat import get_dag_bag_info
 
 
@@ -22,4 +22,27 @@ class DagBagMetricsCollector(object):
 
         yield d_state
 
+        cache_requests = CounterMetricFamily(
+            "airflow_prometheus_dag_bag_cache_requests",
+            "Requests for the shared dag bag by result",
+            labels=["result"],
+        )
+        cache_requests.add_metric(["hit"], dag_bag_info.cache.hits)
+        cache_requests.add_metric(["miss"], dag_bag_info.cache.misses)
+        yield cache_requests
+
+        reload_seconds = CounterMetricFamily(
+            "airflow_prometheus_dag_bag_reload_seconds",
+            "Total time spent (re)parsing DAG files in seconds",
+        )
+        reload_seconds.add_metric([], dag_bag_info.cache.total_reload_seconds)
+        yield reload_seconds
+
+        last_reload_seconds = GaugeMetricFamily(
+            "airflow_prometheus_dag_bag_last_reload_seconds",
+            "Duration of the last (re)parse of changed DAG files in seconds",
+        )
+        last_reload_seconds.add_metric([], dag_bag_info.cache.last_reload_seconds)
+        yield last_reload_seconds
+
 
@@ -1,6 +1,12 @@
 """Prometheus exporter for Airflow."""
 from prometheus_client.core import GaugeMetricFamily
+from airflow_prometheus.stat.context import ScrapeContext, scrape_context
 from airflow_prometheus.stat import get_dag_state_info, get_dag_duration_info
+from airflow_prometheus.exposition import lazy_family
+from airflow_prometheus.metrics.labels import LabelSets, make_sample
+
+DAG_STATE_LABELS = LabelSets(["dag_id", "owner", "status"])
+DAG_DURATION_LABELS = LabelSets(["dag_id"])
 
 
 class DagsMetricsCollector(object):
@@ -11,26 +17,40 @@ class DagsMetricsCollector(object):
 
     def collect(self):
         """Collect metrics."""
+        with scrape_context() as context:
+            yield from self.collect_from(context)
+
+    def collect_from(self, context: ScrapeContext):
+        """Collect metrics within an already opened scrape context."""
         # Dag Metrics
-        dag_info = get_dag_state_info()
-        d_state = GaugeMetricFamily(
-            "airflow_dag_status",
-            "Shows the number of dag starts with this status",
-            labels=["dag_id", "owner", "status"],
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_dag_status",
+                "Shows the number of dag starts with this status",
+                labels=DAG_STATE_LABELS.label_names,
+            ),
+            (
+                make_sample(
+                    "airflow_dag_status",
+                    DAG_STATE_LABELS.get((dag.dag_id, dag.owner, dag.state)),
+                    dag.count,
+                )
+                for dag in get_dag_state_info(context)
+            ),
         )
-        for dag in dag_info:
-            d_state.add_metric([dag.dag_id, dag.owner, dag.state], dag.count)
-        yield d_state
 
-        dag_duration = GaugeMetricFamily(
-            "airflow_dag_run_duration",
-            "Duration of successful dag_runs in seconds",
-            labels=["dag_id"],
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_dag_run_duration",
+                "Duration of successful dag_runs in seconds",
+                labels=DAG_DURATION_LABELS.label_names,
+            ),
+            (
+                make_sample(
+                    "airflow_dag_run_duration",
+                    DAG_DURATION_LABELS.get((dag.dag_id,)),
+                    (dag.end_date - dag.start_date).total_seconds(),
+                )
+                for dag in get_dag_duration_info(context)
+            ),
         )
-        for dag in get_dag_duration_info():
-            dag_duration_value = (
-                    dag.end_date - dag.start_date
-            ).total_seconds()
-            dag_duration.add_metric([dag.dag_id], dag_duration_value)
-        yield dag_duration
-
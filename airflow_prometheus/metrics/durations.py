@@ -0,0 +1,88 @@
+"""Prometheus exporter for Airflow."""
+from typing import Dict, Iterable, List
+
+from prometheus_client.core import HistogramMetricFamily, SummaryMetricFamily
+
+from airflow_prometheus import settings
+from airflow_prometheus.stat.context import ScrapeContext, scrape_context
+from airflow_prometheus.stat.durations import duration_sketches
+from airflow_prometheus.stat.sketch import QuantileSketch
+
+
+def _add_histogram(family: HistogramMetricFamily, labels: List[str], sketch: QuantileSketch):
+    buckets = [
+        (str(upper_bound), count)
+        for upper_bound, count in sketch.cumulative_counts(settings.DURATION_BUCKETS)
+    ]
+    buckets.append(("+Inf", sketch.count))
+    family.add_metric(labels, buckets, sketch.sum)
+
+
+def _add_summary(
+    family: SummaryMetricFamily,
+    label_names: Iterable[str],
+    labels: List[str],
+    sketch: QuantileSketch,
+):
+    family.add_metric(labels, sketch.count, sketch.sum)
+    label_values: Dict[str, str] = dict(zip(label_names, labels))
+    for quantile in settings.DURATION_QUANTILES:
+        family.add_sample(
+            family.name,
+            dict(label_values, quantile=str(quantile)),
+            sketch.quantile(quantile),
+        )
+
+
+class DurationsMetricsCollector(object):
+    """Metrics Collector for prometheus."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        """Collect metrics."""
+        if not settings.DURATION_SKETCHES:
+            return
+        with scrape_context() as context:
+            yield from self.collect_from(context)
+
+    def collect_from(self, context: ScrapeContext):
+        """Collect metrics within an already opened scrape context."""
+        duration_sketches.refresh(context)
+
+        task_labels = ["dag_id", "task_id"]
+        task_histogram = HistogramMetricFamily(
+            "airflow_task_duration_seconds",
+            "Durations of finished task instances in seconds",
+            labels=task_labels,
+        )
+        task_summary = SummaryMetricFamily(
+            "airflow_task_duration_quantile_seconds",
+            "Quantiles of durations of finished task instances in seconds",
+            labels=task_labels,
+        )
+        dag_labels = ["dag_id"]
+        dag_histogram = HistogramMetricFamily(
+            "airflow_dag_run_duration_seconds",
+            "Durations of successful dag runs in seconds",
+            labels=dag_labels,
+        )
+        dag_summary = SummaryMetricFamily(
+            "airflow_dag_run_duration_quantile_seconds",
+            "Quantiles of durations of successful dag runs in seconds",
+            labels=dag_labels,
+        )
+
+        with duration_sketches.lock:
+            for (dag_id, task_id), sketch in duration_sketches.tasks.items():
+                _add_histogram(task_histogram, [dag_id, task_id], sketch)
+                _add_summary(task_summary, task_labels, [dag_id, task_id], sketch)
+            for dag_id, sketch in duration_sketches.dags.items():
+                _add_histogram(dag_histogram, [dag_id], sketch)
+                _add_summary(dag_summary, dag_labels, [dag_id], sketch)
+
+        yield task_histogram
+        yield task_summary
+        yield dag_histogram
+        yield dag_summary
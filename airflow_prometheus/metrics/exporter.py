@@ -0,0 +1,75 @@
+"""Prometheus exporter for Airflow."""
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from airflow_prometheus.instrumentation import instrumentation
+
+
+class ExporterMetricsCollector(object):
+    """Metrics Collector for the exporter itself."""
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        """Collect metrics."""
+        with instrumentation._lock:
+            collector_durations = dict(instrumentation.collector_durations)
+            series = {name: dict(families) for name, families in instrumentation.series.items()}
+            queries = {
+                function: (stats.queries, stats.duration, stats.rows)
+                for function, stats in instrumentation.queries.items()
+            }
+            metric_sources = list(instrumentation.metric_sources)
+
+        collector_duration = GaugeMetricFamily(
+            "airflow_prometheus_collector_duration_seconds",
+            "Time spent by every collector during the previous scrape in seconds",
+            labels=["collector"],
+        )
+        for collector, duration in collector_durations.items():
+            collector_duration.add_metric([collector], duration)
+        yield collector_duration
+
+        series_count = GaugeMetricFamily(
+            "airflow_prometheus_series",
+            "Series emitted per family during the previous scrape",
+            labels=["collector", "family"],
+        )
+        for collector, families in series.items():
+            for family, count in families.items():
+                series_count.add_metric([collector, family], count)
+        yield series_count
+
+        query_count = CounterMetricFamily(
+            "airflow_prometheus_queries",
+            "Queries executed by stat functions",
+            labels=["function"],
+        )
+        query_duration = CounterMetricFamily(
+            "airflow_prometheus_query_duration_seconds",
+            "Time spent executing the queries of stat functions in seconds",
+            labels=["function"],
+        )
+        query_rows = CounterMetricFamily(
+            "airflow_prometheus_query_rows",
+            "Rows returned by stat functions: yielded and list items, dict values, 1 per scalar result",
+            labels=["function"],
+        )
+        for function, (count, duration, rows) in queries.items():
+            query_count.add_metric([function], count)
+            query_duration.add_metric([function], duration)
+            query_rows.add_metric([function], rows)
+        yield query_count
+        yield query_duration
+        yield query_rows
+
+        if instrumentation.payload_size is not None:
+            payload_size = GaugeMetricFamily(
+                "airflow_prometheus_payload_bytes",
+                "Size of the previous /metrics payload in bytes",
+            )
+            payload_size.add_metric([], instrumentation.payload_size)
+            yield payload_size
+
+        for collect in metric_sources:
+            yield from collect()
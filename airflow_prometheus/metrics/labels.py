@@ -0,0 +1,67 @@
+"""Label dictionaries of the samples of metric families."""
+import sys
+from enum import Enum
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from prometheus_client.samples import Sample
+
+
+def _label_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, Enum):
+        value = value.value
+    return sys.intern(value if type(value) is str else str(value))
+
+
+class LabelTable(dict):
+    """Label dictionaries built during one scrape, keyed by label names and values.
+
+    The duration and max_tries label sets of a task repeat for every state
+    row of the task, so each one is built once per scrape and shared by all
+    the samples that carry it. The table lives on the scrape context and is
+    dropped with it, so it does not grow with the series ever seen.
+    """
+
+
+def label_table_of(context) -> LabelTable:
+    """Label table of a scrape, kept on its context like its dropped series."""
+    return context.cache.setdefault(LabelTable, LabelTable())
+
+
+class LabelSets(object):
+    """Label dictionaries of a metric family built from interned label values.
+
+    The values are interned, so the families of a task share their strings.
+    Given the label table of a scrape, a label set is built once and the same
+    dictionary is returned for every sample that carries it, so the
+    dictionaries must never be mutated.
+    """
+
+    def __init__(self, label_names: Sequence[str]):
+        self.label_names = tuple(label_names)
+
+    def _build(self, values: Tuple) -> Dict[str, str]:
+        return {
+            name: _label_value(value)
+            for name, value in zip(self.label_names, values)
+        }
+
+    def get(self, values: Tuple, table: Optional[LabelTable] = None) -> Dict[str, str]:
+        if table is None:
+            return self._build(values)
+        key = (self.label_names, values)
+        labels = table.get(key)
+        if labels is None:
+            labels = table[key] = self._build(values)
+        return labels
+
+
+def make_sample(name: str, labels: Dict[str, str], value) -> Sample:
+    """A sample that uses the given labels without copying them."""
+    return Sample(name, labels, value, None, None)
+
+
+def add_sample(family, labels: Dict[str, str], value):
+    """Append a sample to a metric family without copying its labels."""
+    family.samples.append(make_sample(family.name, labels, value))
@@ -1,5 +1,6 @@
 """Prometheus exporter for Airflow."""
 from prometheus_client.core import GaugeMetricFamily
+from airflow_prometheus.stat.context import ScrapeContext, scrape_context
 from airflow_prometheus.stat import get_dag_scheduler_delay
 
 
@@ -11,6 +12,11 @@ class SchedulerMetricsCollector(object):
 
     def collect(self):
         """Collect metrics."""
+        with scrape_context() as context:
+            yield from self.collect_from(context)
+
+    def collect_from(self, context: ScrapeContext):
+        """Collect metrics within an already opened scrape context."""
         # Scheduler Metrics
         dag_scheduler_delay = GaugeMetricFamily(
             "airflow_dag_scheduler_delay",
@@ -18,7 +24,7 @@ class SchedulerMetricsCollector(object):
             labels=["dag_id"],
         )
 
-        for dag in get_dag_scheduler_delay():
+        for dag in get_dag_scheduler_delay(context):
             dag_scheduling_delay_value = (
                     dag.start_date - dag.execution_date
             ).total_seconds()
@@ -1,10 +1,122 @@
 """Prometheus exporter for Airflow."""
-from prometheus_client.core import GaugeMetricFamily
-from airflow_prometheus.stat import get_task_state_info, extract_xcom_parameter, get_xcom_params,\
+from typing import Callable, Collection, Iterable, List, Optional
+
+from airflow.models import TaskFail, TaskInstance
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from airflow_prometheus.stat.context import ScrapeContext, scrape_context
+from airflow_prometheus.stat import get_task_state_info, get_xcom_parameter_values,\
     get_num_queued_tasks, get_task_duration_info, get_task_failure_counts, \
-    get_task_scheduler_delay, get_latest_tasks_state_info_for_all_dags, check_if_can_query_tasks
+    get_task_scheduler_delay, get_latest_tasks_state_info_for_all_dags, check_if_can_query_tasks, \
+    xcom_value_cache, get_task_state_rollup, get_active_dag_ids
+from airflow_prometheus.stat.capabilities import capabilities
+from airflow_prometheus.cardinality import OTHER, CardinalityPolicy, dropped_series_of, load_cardinality_policy, \
+    top_k
+from airflow_prometheus.exposition import lazy_family
+from airflow_prometheus.metrics.labels import LabelSets, LabelTable, label_table_of, make_sample
+from airflow_prometheus.stat.tasks import TaskStateInfo
 from airflow_prometheus.xcom_config import load_xcom_config
 
+TASK_STATE_LABELS = LabelSets(["dag_id", "task_id", "operator_name", "owner", "state"])
+TASK_DURATION_LABELS = LabelSets(["aggregation", "operator_name", "task_id", "dag_id"])
+TASK_MAX_TRIES_LABELS = LabelSets(["operator_name", "task_id", "dag_id"])
+LAST_DAG_RUN_LABELS = LabelSets(["status", "task_id", "dag_id"])
+TASK_FAIL_LABELS = LabelSets(["dag_id", "task_id"])
+
+
+def _task_state_samples(name: str, tasks: Iterable[TaskStateInfo]):
+    for task in tasks:
+        yield make_sample(
+            name,
+            TASK_STATE_LABELS.get(
+                (task.dag_id, task.task_id, task.operator_name, task.owner, task.state)
+            ),
+            task.count,
+        )
+
+
+def _task_duration_samples(name: str, tasks: Iterable[TaskStateInfo], table: LabelTable):
+    for task in tasks:
+        task_key = (task.operator_name, task.task_id, task.dag_id)
+        yield make_sample(name, TASK_DURATION_LABELS.get(("avg",) + task_key, table), task.avg_duration)
+        yield make_sample(name, TASK_DURATION_LABELS.get(("min",) + task_key, table), task.min_duration)
+        yield make_sample(name, TASK_DURATION_LABELS.get(("max",) + task_key, table), task.max_duration)
+
+
+def _task_max_tries_samples(name: str, tasks: Iterable[TaskStateInfo], table: LabelTable):
+    for task in tasks:
+        yield make_sample(
+            name,
+            TASK_MAX_TRIES_LABELS.get((task.operator_name, task.task_id, task.dag_id), table),
+            task.max_tries,
+        )
+
+
+def _fold_other(
+    tasks: Iterable[TaskStateInfo], partition: Collection[str], drop_labels: Collection[str],
+) -> Iterable[TaskStateInfo]:
+    """One "other" row per value of the partition labels, aggregating all the given rows."""
+    folded = dict()
+    for task in tasks:
+        key = tuple(getattr(task, label) for label in partition)
+        other = folded.get(key)
+        if other is None:
+            folded[key] = task._replace(**{
+                label: OTHER
+                for label in TASK_STATE_LABELS.label_names
+                if label not in partition and label not in drop_labels
+            })
+            continue
+        count = other.count + task.count
+        folded[key] = other._replace(
+            count=count,
+            avg_duration=(
+                (other.avg_duration * other.count + task.avg_duration * task.count) / count
+                if count else 0
+            ),
+            min_duration=min(other.min_duration, task.min_duration),
+            max_duration=max(other.max_duration, task.max_duration),
+            max_tries=max(other.max_tries or 0, task.max_tries or 0),
+        )
+    return folded.values()
+
+
+def _limited_task_info(
+    name: str,
+    label_names: Collection[str],
+    partition: Collection[str],
+    policy: CardinalityPolicy,
+    dag_ids: Optional[List[str]],
+    task_info: Callable[[], Iterable[TaskStateInfo]],
+    context: ScrapeContext,
+) -> Iterable[TaskStateInfo]:
+    """Task states of a family with the labels, top-K and DAGs of its policy applied."""
+    family = policy.family(name)
+    dropped_series = dropped_series_of(context)
+    if family.drop_labels or dag_ids is not None:
+        # Only group by the labels the family keeps.
+        labels = [
+            label for label in TASK_STATE_LABELS.label_names
+            if label in label_names and label not in family.drop_labels
+        ]
+        tasks = get_task_state_rollup(labels, dag_ids, context)
+    else:
+        tasks = task_info()
+    if family.top_k is None:
+        dropped_series.record(name, "top_k", 0)
+        return tasks
+    tasks = list(tasks)
+    if family.top_k_by == "duration":
+        def key(task):
+            return task.max_duration
+    else:
+        def key(task):
+            return task.count
+    limited = top_k(
+        tasks, family.top_k, key, lambda rest: _fold_other(rest, partition, family.drop_labels),
+    )
+    dropped_series.record(name, "top_k", len(tasks) - len(limited))
+    return limited
+
 
 class TasksMetricsCollector(object):
     """Metrics Collector for prometheus."""
@@ -14,64 +126,102 @@ class TasksMetricsCollector(object):
 
     def collect(self):
         """Collect metrics."""
+        with scrape_context() as context:
+            yield from self.collect_from(context)
+
+    def collect_from(self, context: ScrapeContext):
+        """Collect metrics within an already opened scrape context."""
         # Task metrics
-        task_info = get_task_state_info()
+        # One row per airflow_task_status series, read once for all the task families
+        # (also when streaming) and only when a family is not served by a rollup.
+        task_info_rows = None
 
-        t_state = GaugeMetricFamily(
-            "airflow_task_status",
-            "Shows the number of task instances with particular status",
-            labels=["dag_id", "task_id", "operator_name", "owner", "state"],
-        )
-        for task in task_info:
-            t_state.add_metric(
-                [task.dag_id, task.task_id, task.operator_name, task.owner, task.state],
-                task.count,
-            )
-        yield t_state
+        def task_info():
+            nonlocal task_info_rows
+            if task_info_rows is None:
+                task_info_rows = list(get_task_state_info(context))
+            return task_info_rows
 
-        task_detailed_durations = GaugeMetricFamily(
-            "airflow_task_duration",
-            "Durations of tasks in seconds by operator",
-            labels=["aggregation", "operator_name", "task_id", "dag_id"],
-        )
-        for task in task_info:
-            task_detailed_durations.add_metric(
-                ["avg", task.operator_name, task.task_id, task.dag_id],
-                task.avg_duration,
-            )
-            task_detailed_durations.add_metric(
-                ["min", task.operator_name, task.task_id, task.dag_id],
-                task.min_duration,
-            )
-            task_detailed_durations.add_metric(
-                ["max", task.operator_name, task.task_id, task.dag_id],
-                task.max_duration,
+        policy = load_cardinality_policy()
+        dag_ids = None
+        if policy.filters_dags:
+            dag_ids = [dag_id for dag_id in get_active_dag_ids(context) if policy.allows_dag(dag_id)]
+
+        dropped_series = dropped_series_of(context)
+        label_table = label_table_of(context)
+
+        def limited(name, label_names, partition=()):
+            return _limited_task_info(
+                name, label_names, partition, policy, dag_ids, task_info, context,
             )
-        yield task_detailed_durations
 
-        task_max_tries = GaugeMetricFamily(
-            "airflow_task_max_tries",
-            "Max tries for tasks",
-            labels=["operator_name", "task_id", "dag_id"],
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_task_status",
+                "Shows the number of task instances with particular status",
+                labels=TASK_STATE_LABELS.label_names,
+            ),
+            dropped_series.limit(
+                "airflow_task_status",
+                _task_state_samples(
+                    "airflow_task_status",
+                    limited("airflow_task_status", TASK_STATE_LABELS.label_names, ("state",)),
+                ),
+                policy.family("airflow_task_status").max_series,
+            ),
+        )
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_task_duration",
+                "Durations of tasks in seconds by operator",
+                labels=TASK_DURATION_LABELS.label_names,
+            ),
+            dropped_series.limit(
+                "airflow_task_duration",
+                _task_duration_samples(
+                    "airflow_task_duration",
+                    limited("airflow_task_duration", TASK_DURATION_LABELS.label_names),
+                    label_table,
+                ),
+                policy.family("airflow_task_duration").max_series,
+            ),
+        )
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_task_max_tries",
+                "Max tries for tasks",
+                labels=TASK_MAX_TRIES_LABELS.label_names,
+            ),
+            dropped_series.limit(
+                "airflow_task_max_tries",
+                _task_max_tries_samples(
+                    "airflow_task_max_tries",
+                    limited("airflow_task_max_tries", TASK_MAX_TRIES_LABELS.label_names),
+                    label_table,
+                ),
+                policy.family("airflow_task_max_tries").max_series,
+            ),
         )
-        for task in task_info:
-            task_detailed_durations.add_metric(
-                [task.operator_name, task.task_id, task.dag_id],
-                task.max_tries,
-            )
-        yield task_max_tries
 
-        last_dag_run = GaugeMetricFamily(
-            "airflow_last_dag_run",
-            "Tasks status for latest dag run",
-            labels=["status", "task_id", "dag_id"],
+        yield lazy_family(
+            GaugeMetricFamily(
+                "airflow_last_dag_run",
+                "Tasks status for latest dag run",
+                labels=LAST_DAG_RUN_LABELS.label_names,
+            ),
+            dropped_series.limit(
+                "airflow_last_dag_run",
+                (
+                    make_sample(
+                        "airflow_last_dag_run",
+                        LAST_DAG_RUN_LABELS.get((task.state, task.task_id, task.dag_id)),
+                        task.duration,
+                    )
+                    for task in get_latest_tasks_state_info_for_all_dags(context, dag_ids)
+                ),
+                policy.family("airflow_last_dag_run").max_series,
+            ),
         )
-        for task in get_latest_tasks_state_info_for_all_dags():
-            last_dag_run.add_metric(
-                [task.state, task.task_id, task.dag_id],
-                task.duration,
-            )
-        yield last_dag_run
 
         successful_task_duration = GaugeMetricFamily(
             "airflow_successful_task_duration",
@@ -88,17 +238,22 @@ class TasksMetricsCollector(object):
             )
         yield successful_task_duration
 
-        if check_if_can_query_tasks():
-            task_failure_count = GaugeMetricFamily(
-                "airflow_task_fail_count",
-                "Count of failed tasks",
-                labels=["dag_id", "task_id"],
+        if check_if_can_query_tasks(context) and capabilities.supports(TaskFail, context=context):
+            yield lazy_family(
+                GaugeMetricFamily(
+                    "airflow_task_fail_count",
+                    "Count of failed tasks",
+                    labels=TASK_FAIL_LABELS.label_names,
+                ),
+                (
+                    make_sample(
+                        "airflow_task_fail_count",
+                        TASK_FAIL_LABELS.get((task.dag_id, task.task_id)),
+                        task.count,
+                    )
+                    for task in get_task_failure_counts(context)
+                ),
             )
-            for task in get_task_failure_counts():
-                task_failure_count.add_metric(
-                    [task.dag_id, task.task_id], task.count
-                )
-            yield task_failure_count
 
         xcom_params = GaugeMetricFamily(
             "airflow_xcom_parameter",
@@ -107,24 +262,29 @@ class TasksMetricsCollector(object):
         )
 
         xcom_config = load_xcom_config()
-        for tasks in xcom_config.get("xcom_params", []):
-            for param in get_xcom_params(tasks["task_id"]):
-                xcom_value = extract_xcom_parameter(param.value)
-
-                if tasks["key"] in xcom_value:
-                    xcom_params.add_metric(
-                        [param.dag_id, param.task_id], xcom_value[tasks["key"]]
-                    )
+        for param in get_xcom_parameter_values(xcom_config.get("xcom_params", []), context):
+            xcom_params.add_metric([param.dag_id, param.task_id], param.value)
 
         yield xcom_params
 
-        if check_if_can_query_tasks():
+        xcom_skipped = CounterMetricFamily(
+            "airflow_xcom_parameter_skipped",
+            "XCom values not used for parameters by reason",
+            labels=["reason"],
+        )
+        for reason, count in xcom_value_cache.skipped.items():
+            xcom_skipped.add_metric([reason.value], count)
+        yield xcom_skipped
+
+        if check_if_can_query_tasks(context) and capabilities.supports(
+            TaskInstance, "queue", "queued_dttm", context=context,
+        ):
             task_scheduler_delay = GaugeMetricFamily(
                 "airflow_task_scheduler_delay",
                 "Airflow Task scheduling delay",
                 labels=["queue"],
             )
-            for task in get_task_scheduler_delay():
+            for task in get_task_scheduler_delay(context):
                 task_scheduling_delay_value = (
                         task.start_date - task.queued_dttm
                 ).total_seconds()
@@ -137,6 +297,16 @@ class TasksMetricsCollector(object):
             "airflow_num_queued_tasks", "Airflow Number of Queued Tasks",
         )
 
-        num_queued_tasks = get_num_queued_tasks()
+        num_queued_tasks = get_num_queued_tasks(context)
         num_queued_tasks_metric.add_metric([], num_queued_tasks)
-        yield num_queued_tasks_metric
\ No newline at end of file
+        yield num_queued_tasks_metric
+
+        # Emitted last, after the limited families above have been exposed.
+        dropped = GaugeMetricFamily(
+            "airflow_prometheus_dropped_series",
+            "Series dropped by the cardinality limits during the latest scrape",
+            labels=["family", "reason"],
+        )
+        for family, reason, count in dropped_series.items():
+            dropped.add_metric([family, reason], count)
+        yield dropped
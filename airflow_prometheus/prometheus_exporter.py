@@ -1,33 +1,111 @@
 """Prometheus exporter for Airflow."""
+import threading
+from typing import Iterator, List, Union
 
 from airflow.plugins_manager import AirflowPlugin
 from flask import Blueprint
 from flask_admin import expose
 from flask_appbuilder import BaseView as AppBuilderBaseView
-from airflow_prometheus.grafana_data.service import pandas_component
+from airflow_prometheus.grafana_data.blueprint import pandas_component
 
 from airflow.settings import conf
 
-from flask import Response
-from prometheus_client import generate_latest, REGISTRY
-from airflow_prometheus.metrics import TasksMetricsCollector, DagsMetricsCollector,\
-    SchedulerMetricsCollector, DagBagMetricsCollector
-from airflow_prometheus.grafana_data.data import init_json_exporters
+from flask import Response, stream_with_context
+from prometheus_client import generate_latest, CollectorRegistry, REGISTRY
+from airflow_prometheus.exposition import generate_stream
+from airflow_prometheus.instrumentation import instrumentation
+from airflow_prometheus.snapshot import FIRST_SNAPSHOT_PENDING, SharedSnapshotWorker, SnapshotWorker
+from airflow_prometheus.stat.context import scrape_context
+from airflow_prometheus import settings
 
-REGISTRY.register(TasksMetricsCollector())
-REGISTRY.register(DagsMetricsCollector())
-REGISTRY.register(SchedulerMetricsCollector())
-REGISTRY.register(DagBagMetricsCollector())
-#REGISTRY.register(PrometheusStatsClient)
+# Set up by ensure_initialized() on the first request, so that the other
+# Airflow processes loading the plugin neither collect nor import pandas.
+collectors_registry = None
+snapshot_worker = None
+_initialized = False
+_initialize_lock = threading.Lock()
 
-init_json_exporters()
+# Size of the blocks in which a mapped snapshot is handed to the WSGI server.
+SNAPSHOT_BLOCK_SIZE = 64 * 1024
+
+
+def ensure_initialized():
+    """Register the collectors and the JSON exporters unless it was done already."""
+    global collectors_registry, snapshot_worker, _initialized
+    if _initialized:
+        return
+    with _initialize_lock:
+        if _initialized:
+            return
+        # In background mode the collectors only run on the snapshot thread,
+        # so they are kept away from the global registry served on demand.
+        if settings.SHARED_SNAPSHOT_DIR:
+            collectors_registry = CollectorRegistry(auto_describe=True)
+            snapshot_worker = SharedSnapshotWorker(
+                collectors_registry,
+                settings.REFRESH_INTERVAL,
+                settings.SHARED_SNAPSHOT_DIR,
+                settings.LEADER_POLL_INTERVAL,
+            )
+        elif settings.BACKGROUND_REFRESH:
+            collectors_registry = CollectorRegistry(auto_describe=True)
+            snapshot_worker = SnapshotWorker(collectors_registry, settings.REFRESH_INTERVAL)
+        else:
+            collectors_registry = REGISTRY
+            snapshot_worker = None
+
+        from airflow_prometheus.collectors import register_collectors
+
+        register_collectors(collectors_registry)
+        #REGISTRY.register(PrometheusStatsClient)
+
+        from airflow_prometheus.grafana_data.data import init_json_exporters
+
+        init_json_exporters()
+        _initialized = True
+
+
+def _stream_metrics():
+    # The scrape context stays open until the last chunk has been sent.
+    size = 0
+    with scrape_context():
+        for chunk in generate_stream(REGISTRY, settings.STREAM_BATCH_SIZE):
+            size += len(chunk)
+            yield chunk
+    instrumentation.record_payload(size)
+
+
+def _snapshot_response(chunks: List[Union[bytes, memoryview]]) -> Iterator[bytes]:
+    # WSGI servers (gunicorn) only accept bytes, so a mapped payload is copied
+    # one block at a time while it is sent instead of all at once.
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            yield chunk
+            continue
+        for offset in range(0, len(chunk), SNAPSHOT_BLOCK_SIZE):
+            yield bytes(chunk[offset:offset + SNAPSHOT_BLOCK_SIZE])
+    yield generate_latest()
 
 
 class Metrics(AppBuilderBaseView):
 
     @expose("/")
     def index(self):
-        return Response(generate_latest(), mimetype="text/plain")
+        ensure_initialized()
+        if snapshot_worker is not None:
+            # The global registry only holds the cheap process collectors here.
+            chunks = snapshot_worker.render_chunks(settings.FIRST_SNAPSHOT_TIMEOUT)
+            if chunks is None:
+                # Fails the scrape (up == 0) instead of reporting every series as gone.
+                return Response(FIRST_SNAPSHOT_PENDING, status=503, mimetype="text/plain")
+            return Response(_snapshot_response(chunks), mimetype="text/plain")
+        if settings.STREAMING_EXPOSITION:
+            return Response(stream_with_context(_stream_metrics()), mimetype="text/plain")
+        # All collectors share one session and read snapshot for the scrape.
+        with scrape_context():
+            payload = generate_latest()
+        instrumentation.record_payload(len(payload))
+        return Response(payload, mimetype="text/plain")
 
     @expose("/list")
     def list(self):
@@ -0,0 +1,220 @@
+"""Statements issued by stat functions, their query plans and plan budgets."""
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from sqlalchemy import event
+
+# SQLite EXPLAIN QUERY PLAN details, e.g. "SCAN task_instance" or "SCAN TABLE dag_run AS dr USING INDEX x".
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$")
+_SQLITE_SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (?:SUBQUERY )?(\w+)")
+
+
+@dataclass
+class RecordedStatement:
+    statement: str
+    parameters: Any
+    executemany: bool
+
+    @property
+    def is_select(self) -> bool:
+        return self.statement.lstrip(" (\n").upper().startswith(("SELECT", "WITH"))
+
+
+@dataclass
+class PlanIssue:
+    kind: str  # "full_scan" or "cartesian_product"
+    table: Optional[str]
+    detail: str
+
+
+@dataclass
+class StatementPlan:
+    statement: RecordedStatement
+    plan: List[str] = field(default_factory=list)
+    issues: List[PlanIssue] = field(default_factory=list)
+
+
+class StatementRecorder(object):
+    """Records the statements executed on an engine while it is active."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[RecordedStatement] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(RecordedStatement(statement, parameters, executemany))
+
+    def __enter__(self) -> "StatementRecorder":
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def _sqlite_issues(rows: List[tuple]) -> List[PlanIssue]:
+    """Issues of (id, parent, notused, detail) rows of EXPLAIN QUERY PLAN."""
+    subqueries = {
+        match.group(1)
+        for match in (_SQLITE_SUBQUERY.match(row[3]) for row in rows)
+        if match is not None
+    }
+    issues = []
+    loops_per_parent: Dict[int, int] = dict()
+    for node_id, parent, _, detail in rows:
+        is_loop = detail.startswith(("SCAN", "SEARCH"))
+        if not is_loop:
+            continue
+        loop_index = loops_per_parent.get(parent, 0)
+        loops_per_parent[parent] = loop_index + 1
+        match = _SQLITE_SCAN.match(detail)
+        if match is None:
+            continue
+        table, rest = match.groups()
+        if table in subqueries or table.startswith(("SUBQUERY", "CONSTANT")):
+            continue
+        if loop_index > 0:
+            # An inner loop scanning the whole table (or index) for every outer row.
+            issues.append(PlanIssue("cartesian_product", table, detail))
+        elif "COVERING INDEX" not in rest:
+            issues.append(PlanIssue("full_scan", table, detail))
+    return issues
+
+
+def _postgres_issues(node: Dict[str, Any]) -> List[PlanIssue]:
+    issues = []
+    node_type = node.get("Node Type")
+    children = node.get("Plans", [])
+    if node_type == "Seq Scan":
+        issues.append(PlanIssue("full_scan", node.get("Relation Name"), node_type))
+    if node_type == "Nested Loop" and "Join Filter" not in node and len(children) == 2:
+        # Join conditions show up as a Join Filter or as conditions of the inner index scans.
+        inner = json.dumps(children[1])
+        if "Index Cond" not in inner and "Recheck Cond" not in inner:
+            issues.append(PlanIssue("cartesian_product", None, "Nested Loop without join condition"))
+    for child in children:
+        issues.extend(_postgres_issues(child))
+    return issues
+
+
+def explain(connection, recorded: RecordedStatement) -> StatementPlan:
+    """Plan and issues of a recorded statement, explained on the given SQLAlchemy connection.
+
+    Only SELECT statements on SQLite and PostgreSQL are explained.
+    """
+    result = StatementPlan(recorded)
+    dialect = connection.dialect.name
+    if not recorded.is_select or recorded.executemany or dialect not in ("sqlite", "postgresql"):
+        return result
+    # The raw DBAPI cursor accepts the statement with its original parameter style.
+    cursor = connection.connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + recorded.statement, recorded.parameters)
+            rows = [tuple(row) for row in cursor.fetchall()]
+            result.plan = [row[3] for row in rows]
+            result.issues = _sqlite_issues(rows)
+        else:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + recorded.statement, recorded.parameters)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            result.plan = json.dumps(plan, indent=2).splitlines()
+            result.issues = _postgres_issues(plan[0]["Plan"])
+    finally:
+        cursor.close()
+    return result
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """What a single call of a stat function may cost."""
+
+    max_queries: int
+    # Tables the function is expected to read in full (e.g. for global aggregations).
+    allowed_full_scans: FrozenSet[str] = frozenset()
+    allow_cartesian: bool = False
+    # Times one statement may be repeated within a call, more is an N+1 pattern.
+    max_repeats: int = 1
+
+
+def check_budget(plans: List[StatementPlan], budget: QueryBudget) -> List[str]:
+    """Budget violations of the statements of one stat function call."""
+    violations = []
+    if len(plans) > budget.max_queries:
+        violations.append("%d queries (budget %d)" % (len(plans), budget.max_queries))
+    repeats = Counter(plan.statement.statement for plan in plans)
+    for statement, count in repeats.items():
+        if count > budget.max_repeats:
+            violations.append(
+                "statement repeated %d times (N+1): %s" % (count, " ".join(statement.split())[:120])
+            )
+    for plan in plans:
+        for issue in plan.issues:
+            if issue.kind == "full_scan" and issue.table in budget.allowed_full_scans:
+                continue
+            if issue.kind == "cartesian_product" and budget.allow_cartesian:
+                continue
+            violations.append("%s of %s: %s" % (issue.kind, issue.table or "-", issue.detail))
+    return violations
+
+
+def stat_function_calls() -> Dict[str, Callable[[Any], Any]]:
+    """Calls of every stat function the collectors use, taking a scrape context."""
+    from airflow_prometheus.stat import (
+        get_active_dag_ids, get_dag_duration_info, get_dag_scheduler_delay, get_dag_state_info,
+        get_latest_tasks_state_info_by_dag, get_num_queued_tasks, get_task_duration_info,
+        get_task_failure_counts, get_task_scheduler_delay, get_task_state_info, get_task_state_rollup,
+        get_xcom_parameter_values,
+    )
+    from airflow_prometheus.stat.durations import duration_sketches
+
+    return {
+        "get_active_dag_ids": get_active_dag_ids,
+        "get_dag_state_info": get_dag_state_info,
+        "get_dag_duration_info": get_dag_duration_info,
+        "get_dag_scheduler_delay": get_dag_scheduler_delay,
+        "get_task_state_info": get_task_state_info,
+        "get_task_state_rollup": lambda context: get_task_state_rollup(["dag_id", "state"], context=context),
+        "get_task_failure_counts": get_task_failure_counts,
+        "get_task_duration_info": get_task_duration_info,
+        "get_latest_tasks_state_info_by_dag": lambda context: get_latest_tasks_state_info_by_dag(context=context),
+        "get_xcom_parameter_values": (
+            lambda context: get_xcom_parameter_values([dict(task_id="all", key="rows")], context)
+        ),
+        "get_task_scheduler_delay": get_task_scheduler_delay,
+        "get_num_queued_tasks": get_num_queued_tasks,
+        "DurationSketches.refresh": duration_sketches.refresh,
+    }
+
+
+def _consume(result):
+    """Run a stat function to completion, whatever it returns."""
+    if result is None or isinstance(result, (int, float, dict, list)):
+        return
+    for _ in result:
+        pass
+
+
+def explain_stat_functions(engine, names: Optional[Iterable[str]] = None) -> Dict[str, List[StatementPlan]]:
+    """Statements and plans of one call of every (or every given) stat function on the engine."""
+    from airflow_prometheus.stat.context import configure_session_factory, scrape_context
+    from sqlalchemy.orm import sessionmaker
+
+    configure_session_factory(sessionmaker(bind=engine))
+    calls = stat_function_calls()
+    names = list(names or calls)
+    plans: Dict[str, List[StatementPlan]] = dict()
+    with scrape_context() as context:
+        # Warm the capability probes, so that only the queries of the functions are recorded.
+        for name in names:
+            _consume(calls[name](context))
+        connection = context.session.connection()
+        for name in names:
+            with StatementRecorder(engine) as recorder:
+                _consume(calls[name](context))
+            plans[name] = [explain(connection, statement) for statement in recorder.statements]
+    return plans
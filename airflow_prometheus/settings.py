@@ -0,0 +1,67 @@
+"""Exporter settings read from the [prometheus] section of airflow.cfg."""
+from airflow.configuration import conf
+
+SECTION = "prometheus"
+
+# Refresh the metrics in a background thread and serve a cached snapshot.
+BACKGROUND_REFRESH: bool = conf.getboolean(SECTION, "background_refresh", fallback=False)
+# Seconds between two background refreshes of the snapshot.
+REFRESH_INTERVAL: float = conf.getfloat(SECTION, "refresh_interval", fallback=30.0)
+# Seconds a request waits for the very first snapshot before serving an empty one.
+FIRST_SNAPSHOT_TIMEOUT: float = conf.getfloat(SECTION, "first_snapshot_timeout", fallback=10.0)
+# Directory through which webserver workers share one snapshot computed by an elected leader.
+SHARED_SNAPSHOT_DIR: str = conf.get(SECTION, "shared_snapshot_dir", fallback="")
+# Seconds between two attempts of a follower worker to take over the leadership.
+LEADER_POLL_INTERVAL: float = conf.getfloat(SECTION, "leader_poll_interval", fallback=5.0)
+# Isolation level of the single read transaction shared by all collectors of a scrape.
+SCRAPE_ISOLATION_LEVEL: str = conf.get(SECTION, "scrape_isolation_level", fallback="REPEATABLE READ")
+# Seconds the results of table and column capability probes are cached.
+CAPABILITY_PROBE_TTL: float = conf.getfloat(SECTION, "capability_probe_ttl", fallback=60.0)
+# Seconds between two checks of the DAG folder for changed files.
+DAG_BAG_REFRESH_INTERVAL: float = conf.getfloat(SECTION, "dag_bag_refresh_interval", fallback=30.0)
+# Fold settled task instances into in-memory accumulators instead of re-aggregating the whole table.
+INCREMENTAL_TASK_AGGREGATION: bool = conf.getboolean(SECTION, "incremental_task_aggregation", fallback=False)
+# Task instances that ended within this many seconds are re-aggregated on every scrape.
+AGGREGATION_RESCAN_WINDOW: float = conf.getfloat(SECTION, "aggregation_rescan_window", fallback=3600.0)
+# Seconds between two full rebuilds of the incremental accumulators.
+AGGREGATION_RECONCILE_INTERVAL: float = conf.getfloat(SECTION, "aggregation_reconcile_interval", fallback=21600.0)
+# Export duration histograms and quantiles built from incrementally maintained sketches.
+DURATION_SKETCHES: bool = conf.getboolean(SECTION, "duration_sketches", fallback=False)
+# Relative accuracy of the reported duration quantiles.
+DURATION_SKETCH_ACCURACY: float = conf.getfloat(SECTION, "duration_sketch_accuracy", fallback=0.02)
+# Upper bound of bins kept per sketch, which bounds the memory of every series.
+DURATION_SKETCH_MAX_BINS: int = conf.getint(SECTION, "duration_sketch_max_bins", fallback=512)
+# Seconds a finished row must be old before it is folded into the sketches.
+DURATION_SKETCH_LAG: float = conf.getfloat(SECTION, "duration_sketch_lag", fallback=60.0)
+# Upper bounds in seconds of the exported duration histogram buckets.
+DURATION_BUCKETS = [
+    float(bucket)
+    for bucket in conf.get(
+        SECTION, "duration_buckets", fallback="1,5,15,30,60,300,900,1800,3600,7200,21600,86400",
+    ).split(",")
+    if bucket.strip()
+]
+# Quantiles exported for every duration sketch.
+DURATION_QUANTILES = [
+    float(quantile)
+    for quantile in conf.get(SECTION, "duration_quantiles", fallback="0.5,0.95,0.99").split(",")
+    if quantile.strip()
+]
+# XCom values larger than this many bytes are neither fetched nor decoded.
+XCOM_MAX_VALUE_SIZE: int = conf.getint(SECTION, "xcom_max_value_size", fallback=4 * 1024 * 1024)
+# Only decode the configured keys of JSON XCom values instead of the whole document.
+XCOM_TARGETED_DECODING: bool = conf.getboolean(SECTION, "xcom_targeted_decoding", fallback=True)
+# Only task instances started within this many seconds make up the task scheduling delay, 0 reads all of them.
+SCHEDULER_DELAY_LOOKBACK: float = conf.getfloat(SECTION, "scheduler_delay_lookback", fallback=0.0)
+# Stream /metrics as a chunked response written directly from database cursors.
+STREAMING_EXPOSITION: bool = conf.getboolean(SECTION, "streaming_exposition", fallback=False)
+# Rows fetched per round trip and lines written per chunk while streaming.
+STREAM_BATCH_SIZE: int = conf.getint(SECTION, "stream_batch_size", fallback=1000)
+# Publish timings, row counts and series counts of the exporter itself.
+SELF_INSTRUMENTATION: bool = conf.getboolean(SECTION, "self_instrumentation", fallback=True)
+# Seconds the JSON datasource responses are cached for, 0 disables the cache.
+JSON_CACHE_TTL: float = conf.getfloat(SECTION, "json_cache_ttl", fallback=10.0)
+# Upper bound in bytes of the cached JSON datasource responses.
+JSON_CACHE_MAX_BYTES: int = conf.getint(SECTION, "json_cache_max_bytes", fallback=64 * 1024 * 1024)
+# Upper bound of the events returned per Grafana annotation query, the newest ones are kept.
+MAX_ANNOTATIONS: int = conf.getint(SECTION, "max_annotations", fallback=1000)
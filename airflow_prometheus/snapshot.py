@@ -0,0 +1,230 @@
+"""Background collection of pre-encoded metric snapshots."""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, List, Optional, Tuple, Union
+
+from airflow.utils.log.logging_mixin import LoggingMixin
+from prometheus_client import CollectorRegistry, generate_latest
+
+from airflow_prometheus.instrumentation import instrumentation
+from airflow_prometheus.stat.context import scrape_context
+
+# Files of a shared snapshot directory.
+LEADER_LOCK_FILE = "leader.lock"
+SNAPSHOT_FILE = "snapshot.bin"
+# Header of a shared snapshot file: magic, created_at, duration and payload size.
+SNAPSHOT_HEADER = struct.Struct("<4sddQ")
+SNAPSHOT_MAGIC = b"APS1"
+
+# Body of the 503 response served until the first snapshot has been collected.
+FIRST_SNAPSHOT_PENDING = b"The first metrics snapshot is not ready yet\n"
+
+SNAPSHOT_AGE_METRIC = (
+    b"# HELP airflow_prometheus_snapshot_age_seconds Age of the served metrics snapshot\n"
+    b"# TYPE airflow_prometheus_snapshot_age_seconds gauge\n"
+    b"airflow_prometheus_snapshot_age_seconds %f\n"
+)
+
+
+@dataclass(frozen=True)
+class MetricsSnapshot:
+    # A memoryview of the shared snapshot file in followers, not copied out of the page cache.
+    payload: Union[bytes, memoryview]
+    created_at: float
+    duration: float
+
+    def chunks(self) -> List[Union[bytes, memoryview]]:
+        """Payload (not copied) followed by the current age of the snapshot."""
+        return [self.payload, SNAPSHOT_AGE_METRIC % (time.time() - self.created_at)]
+
+    def render(self) -> bytes:
+        return b"".join(self.chunks())
+
+
+class SnapshotWorker(object):
+    """Periodically runs all collectors of a registry and keeps the encoded result."""
+
+    def __init__(self, registry: CollectorRegistry, interval: float):
+        self.registry = registry
+        self.interval = interval
+        self._snapshot: Optional[MetricsSnapshot] = None
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> Optional[MetricsSnapshot]:
+        return self._snapshot
+
+    def start(self):
+        """Start the refresh thread unless it is already running."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="airflow-prometheus-snapshot", daemon=True,
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def refresh(self) -> MetricsSnapshot:
+        """Collect all metrics once and swap in the new snapshot."""
+        started_at = time.time()
+        with scrape_context():
+            payload = generate_latest(self.registry)
+        instrumentation.record_payload(len(payload))
+        snapshot = MetricsSnapshot(
+            payload=payload,
+            created_at=time.time(),
+            duration=time.time() - started_at,
+        )
+        self._snapshot = snapshot
+        self._ready.set()
+        return snapshot
+
+    def render_chunks(self, timeout: float) -> Optional[List[Union[bytes, memoryview]]]:
+        """Chunks of the encoded snapshot, waiting up to timeout seconds for the first one.
+
+        None if there is no snapshot yet, which must not be served as an empty scrape.
+        """
+        self.start()
+        if not self._ready.wait(timeout):
+            return None
+        return self._snapshot.chunks()
+
+    def render(self, timeout: float) -> Optional[bytes]:
+        """Encoded snapshot, waiting up to timeout seconds for the first one."""
+        chunks = self.render_chunks(timeout)
+        return None if chunks is None else b"".join(chunks)
+
+    def _run(self):
+        log = LoggingMixin().log
+        while not self._stopped.is_set():
+            started_at = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("Could not refresh the Prometheus metrics snapshot.")
+            self._stopped.wait(max(0.0, self.interval - (time.time() - started_at)))
+
+
+class SharedSnapshotWorker(SnapshotWorker):
+    """Snapshot worker sharing one snapshot between the processes of a host.
+
+    Only the worker holding the exclusive lock on the leader file collects
+    metrics; it publishes every snapshot to a file of the shared directory,
+    which the other workers map once per change and serve from the shared
+    page cache. The kernel releases the lock when the leader dies, so another
+    worker takes over on its next attempt.
+    """
+
+    def __init__(self, registry: CollectorRegistry, interval: float, directory: str, poll_interval: float):
+        super().__init__(registry, interval)
+        self.directory = Path(directory)
+        self.poll_interval = poll_interval
+        self._lock_file: Optional[IO] = None
+        self._loaded_version: Optional[Tuple[int, int, int]] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def _try_lead(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self.directory / LEADER_LOCK_FILE, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        LoggingMixin().log.info("Process %d now collects the shared Prometheus snapshot.", os.getpid())
+        return True
+
+    def _resign(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def publish(self, snapshot: MetricsSnapshot):
+        """Atomically replace the shared snapshot file."""
+        path = self.directory / SNAPSHOT_FILE
+        temporary_path = self.directory / ("%s.%d.tmp" % (SNAPSHOT_FILE, os.getpid()))
+        with open(temporary_path, "wb") as file:
+            file.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, snapshot.created_at, snapshot.duration, len(snapshot.payload),
+            ))
+            file.write(snapshot.payload)
+        os.replace(temporary_path, path)
+
+    def load(self) -> Optional[MetricsSnapshot]:
+        """Latest published snapshot, read again only when the file was replaced."""
+        path = self.directory / SNAPSHOT_FILE
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return self._snapshot
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version == self._loaded_version or stat.st_size < SNAPSHOT_HEADER.size:
+            return self._snapshot
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, created_at, duration, size = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or SNAPSHOT_HEADER.size + size != len(data):
+            data.close()
+            return self._snapshot
+        # The view keeps the map alive, it is unmapped once no request serves it any more.
+        # Replacing the file does not change the mapped (unlinked) one.
+        payload = memoryview(data)[SNAPSHOT_HEADER.size:]
+        self._snapshot = MetricsSnapshot(payload=payload, created_at=created_at, duration=duration)
+        self._loaded_version = version
+        self._ready.set()
+        return self._snapshot
+
+    def refresh(self) -> MetricsSnapshot:
+        snapshot = super().refresh()
+        self.publish(snapshot)
+        return snapshot
+
+    def render_chunks(self, timeout: float) -> Optional[List[Union[bytes, memoryview]]]:
+        """Chunks of the encoded snapshot, waiting up to timeout seconds for the first one."""
+        self.start()
+        deadline = time.time() + timeout
+        while True:
+            snapshot = self._snapshot if self.is_leader else self.load()
+            if snapshot is not None:
+                return snapshot.chunks()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            self._ready.wait(min(remaining, 0.1))
+
+    def _run(self):
+        log = LoggingMixin().log
+        try:
+            while not self._stopped.is_set():
+                started_at = time.time()
+                if self._try_lead():
+                    try:
+                        self.refresh()
+                    except Exception:
+                        log.exception("Could not refresh the shared Prometheus metrics snapshot.")
+                    wait = self.interval - (time.time() - started_at)
+                else:
+                    wait = self.poll_interval
+                self._stopped.wait(max(0.0, wait))
+        finally:
+            self._resign()
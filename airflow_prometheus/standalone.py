@@ -0,0 +1,151 @@
+"""Standalone exporter process serving /metrics without the Airflow webserver.
+
+Only the collectors are imported (no Flask, UI views, pandas or Grafana
+blueprint) and the scrapes use a dedicated database pool:
+
+    airflow-prometheus-exporter --port 9112
+"""
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Union
+from urllib.parse import urlparse
+
+import typer
+from airflow.configuration import conf
+from airflow.utils.log.logging_mixin import LoggingMixin
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from airflow_prometheus import settings
+from airflow_prometheus.collectors import register_collectors
+from airflow_prometheus.exposition import generate_stream
+from airflow_prometheus.instrumentation import instrumentation
+from airflow_prometheus.snapshot import FIRST_SNAPSHOT_PENDING, SnapshotWorker
+from airflow_prometheus.stat.context import configure_session_factory, scrape_context
+
+app = typer.Typer()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (and /) from the registry or snapshot worker of the server."""
+
+    # Needed for chunked responses.
+    protocol_version = "HTTP/1.1"
+
+    def _send(
+        self, status: int, payload: Union[bytes, List[bytes]], content_type: str = "text/plain; charset=utf-8",
+    ):
+        """Send the payload or the (bytes-like) chunks of a payload, which are not copied."""
+        chunks = [payload] if isinstance(payload, bytes) else payload
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(sum(len(chunk) for chunk in chunks)))
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+    def _send_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        size = 0
+        # The scrape context stays open until the last chunk has been sent.
+        with scrape_context():
+            for chunk in generate_stream(self.server.registry, settings.STREAM_BATCH_SIZE):
+                size += len(chunk)
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+        instrumentation.record_payload(size)
+
+    def do_GET(self):  # noqa: N802
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._send(200, b"ok\n")
+            return
+        if path not in ("/", "/metrics"):
+            self._send(404, b"Not found\n")
+            return
+        if self.server.snapshot_worker is None and settings.STREAMING_EXPOSITION:
+            try:
+                self._send_stream()
+            except Exception:
+                # The headers are gone already, an incomplete chunked body fails the scrape.
+                LoggingMixin().log.exception("Could not stream the Prometheus metrics.")
+                self.close_connection = True
+            return
+        try:
+            if self.server.snapshot_worker is not None:
+                payload = self.server.snapshot_worker.render_chunks(settings.FIRST_SNAPSHOT_TIMEOUT)
+                if payload is None:
+                    # Fails the scrape (up == 0) instead of reporting every series as gone.
+                    self._send(503, FIRST_SNAPSHOT_PENDING)
+                    return
+            else:
+                with scrape_context():
+                    payload = generate_latest(self.server.registry)
+                instrumentation.record_payload(len(payload))
+        except Exception:
+            LoggingMixin().log.exception("Could not collect the Prometheus metrics.")
+            self._send(500, b"Could not collect the metrics\n")
+            return
+        self._send(200, payload, CONTENT_TYPE_LATEST)
+
+    def log_message(self, format, *args):  # noqa: A002
+        LoggingMixin().log.debug("%s - %s", self.address_string(), format % args)
+
+
+class ExporterServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, registry: CollectorRegistry, snapshot_worker: Optional[SnapshotWorker]):
+        super().__init__(address, MetricsHandler)
+        self.registry = registry
+        self.snapshot_worker = snapshot_worker
+
+
+@app.command()
+def main(
+    host: str = typer.Option("0.0.0.0", help="Address to listen on"),  # noqa: S104
+    port: int = typer.Option(9112, help="Port to listen on"),
+    database_url: Optional[str] = typer.Option(None, help="Defaults to the sql_alchemy_conn of Airflow"),
+    pool_size: int = typer.Option(2, help="Connections of the dedicated database pool"),
+    background: bool = typer.Option(
+        settings.BACKGROUND_REFRESH, help="Serve snapshots refreshed every refresh_interval seconds",
+    ),
+):
+    """Run the collectors behind a minimal HTTP server."""
+    started_at = time.time()
+    database_url = database_url or conf.get("core", "sql_alchemy_conn")
+    if database_url.startswith("sqlite"):
+        # SQLite engines use a single-connection pool without size settings.
+        engine = create_engine(database_url)
+    else:
+        engine = create_engine(database_url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+    configure_session_factory(sessionmaker(bind=engine))
+
+    registry = CollectorRegistry(auto_describe=True)
+    register_collectors(registry)
+    snapshot_worker = SnapshotWorker(registry, settings.REFRESH_INTERVAL) if background else None
+    if snapshot_worker is not None:
+        snapshot_worker.start()
+
+    server = ExporterServer((host, port), registry, snapshot_worker)
+    LoggingMixin().log.info(
+        "Serving Prometheus metrics on http://%s:%d/metrics (started in %.2fs)",
+        host, port, time.time() - started_at,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if snapshot_worker is not None:
+            snapshot_worker.stop()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    app()
@@ -1,27 +1,55 @@
-from .dags import get_dag_state_info, get_dag_duration_info
+from .dags import get_dag_state_info, get_dag_duration_info, get_active_dag_ids
 from .scheduler import get_dag_scheduler_delay, get_num_queued_tasks, get_task_scheduler_delay
-from .tasks import get_task_state_info, extract_xcom_parameter,\
-    get_xcom_params, get_task_duration_info, get_task_failure_counts, \
+from .annotations import AnnotationEvent, get_failed_dag_runs, get_task_failures, get_task_retries
+from .timeseries import BucketValue, get_dag_run_count_buckets, get_dag_run_duration_buckets, \
+    get_queue_wait_buckets, get_task_duration_buckets
+from .tasks import get_task_state_info, get_task_duration_info, get_task_failure_counts, \
     get_latest_tasks_state_info, LatestTaskInfo, get_latest_tasks_state_info_for_all_dags, \
-    check_if_can_query_tasks
+    check_if_can_query_tasks, get_latest_tasks_state_info_by_dag, get_task_state_rollup
+from .xcom import extract_xcom_parameter, get_xcom_params, get_xcom_parameter_values, XComParameterInfo, \
+    xcom_value_cache
 from .dags_info import get_dag_bag_info
+from .dag_bag import DagBagProvider, dag_bag_provider
 from .utils import ProcessingState
+from .capabilities import CapabilityProbe, capabilities
+from .context import ScrapeContext, scrape_context
 
 __all__ = [
     "get_dag_state_info",
     "get_task_state_info",
+    "get_task_state_rollup",
     "extract_xcom_parameter",
     "get_dag_scheduler_delay",
     "get_xcom_params",
+    "get_xcom_parameter_values",
+    "XComParameterInfo",
+    "xcom_value_cache",
     "get_num_queued_tasks",
     "get_task_duration_info",
     "get_task_failure_counts",
     "get_task_scheduler_delay",
     "get_dag_duration_info",
+    "get_active_dag_ids",
+    "AnnotationEvent",
+    "get_failed_dag_runs",
+    "get_task_failures",
+    "get_task_retries",
+    "BucketValue",
+    "get_task_duration_buckets",
+    "get_dag_run_duration_buckets",
+    "get_dag_run_count_buckets",
+    "get_queue_wait_buckets",
     "get_dag_bag_info",
+    "DagBagProvider",
+    "dag_bag_provider",
     "get_latest_tasks_state_info",
+    "get_latest_tasks_state_info_by_dag",
     "LatestTaskInfo",
     "ProcessingState",
     "get_latest_tasks_state_info_for_all_dags",
     "check_if_can_query_tasks",
+    "CapabilityProbe",
+    "capabilities",
+    "ScrapeContext",
+    "scrape_context",
 ]
@@ -0,0 +1,169 @@
+"""Incremental aggregation of task instance counts and durations."""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from airflow.models import TaskInstance
+from airflow.utils import timezone
+from airflow.utils.state import State
+from sqlalchemy import func, or_
+
+# States a task instance does not leave unless it is cleared.
+SETTLED_STATES = (
+    State.SUCCESS,
+    State.FAILED,
+    State.SKIPPED,
+    State.UPSTREAM_FAILED,
+    State.REMOVED,
+)
+
+# (dag_id, task_id, operator, state)
+TaskStateKey = Tuple[str, str, Optional[str], Optional[str]]
+
+
+@dataclass
+class TaskStateAccumulator:
+    count: int = 0
+    duration_sum: float = 0
+    duration_count: int = 0
+    min_duration: Optional[float] = None
+    max_duration: Optional[float] = None
+    max_tries: Optional[int] = None
+
+    @property
+    def avg_duration(self) -> Optional[float]:
+        if self.duration_count == 0:
+            return None
+        return self.duration_sum / self.duration_count
+
+    def merge(self, other: "TaskStateAccumulator") -> "TaskStateAccumulator":
+        return TaskStateAccumulator(
+            count=self.count + other.count,
+            duration_sum=self.duration_sum + other.duration_sum,
+            duration_count=self.duration_count + other.duration_count,
+            min_duration=_combine(min, self.min_duration, other.min_duration),
+            max_duration=_combine(max, self.max_duration, other.max_duration),
+            max_tries=_combine(max, self.max_tries, other.max_tries),
+        )
+
+
+def _combine(fn, left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return fn(left, right)
+
+
+def merge_accumulators(
+    target: Dict[TaskStateKey, TaskStateAccumulator],
+    source: Dict[TaskStateKey, TaskStateAccumulator],
+):
+    for key, accumulator in source.items():
+        if key in target:
+            target[key] = target[key].merge(accumulator)
+        else:
+            target[key] = accumulator
+
+
+def aggregate_task_states(session, *criteria) -> Dict[TaskStateKey, TaskStateAccumulator]:
+    """GROUP BY (dag_id, task_id, operator, state) over the matching task instances."""
+    query = (
+        session.query(
+            TaskInstance.dag_id,
+            TaskInstance.task_id,
+            TaskInstance.operator,
+            TaskInstance.state,
+            func.count(TaskInstance.dag_id).label("value"),
+            func.sum(TaskInstance.duration).label("duration_sum"),
+            func.count(TaskInstance.duration).label("duration_count"),
+            func.min(TaskInstance.duration).label("min_duration"),
+            func.max(TaskInstance.duration).label("max_duration"),
+            func.max(TaskInstance.max_tries).label("max_tries"),
+        )
+        .filter(*criteria)
+        .group_by(
+            TaskInstance.dag_id, TaskInstance.task_id, TaskInstance.state, TaskInstance.operator,
+        )
+    )
+    return {
+        (row.dag_id, row.task_id, row.operator, row.state): TaskStateAccumulator(
+            count=row.value,
+            duration_sum=row.duration_sum or 0,
+            duration_count=row.duration_count,
+            min_duration=row.min_duration,
+            max_duration=row.max_duration,
+            max_tries=row.max_tries,
+        )
+        for row in query
+    }
+
+
+class TaskStateAggregator(object):
+    """Keeps per-task accumulators of settled task instances between scrapes.
+
+    Task instances in a settled state that ended before the rescan window are
+    folded into the accumulators once, using end_date as a watermark.
+    Everything else (in-flight or recently ended) is aggregated on every call.
+    Cleared task instances can make the settled part drift, so it is rebuilt
+    from scratch every reconcile interval.
+    """
+
+    def __init__(self, rescan_window: timedelta, reconcile_interval: float):
+        self.rescan_window = rescan_window
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._settled: Dict[TaskStateKey, TaskStateAccumulator] = dict()
+        self._watermark: Optional[datetime] = None
+        self._reconciled_at = 0.0
+
+    def reset(self):
+        with self._lock:
+            self._settled = dict()
+            self._watermark = None
+
+    def aggregate(self, session) -> Dict[TaskStateKey, TaskStateAccumulator]:
+        with self._lock:
+            cutoff = timezone.utcnow() - self.rescan_window
+            if self._watermark is not None:
+                cutoff = max(cutoff, self._watermark)
+            settled_criteria = (
+                TaskInstance.state.in_(SETTLED_STATES),
+                TaskInstance.end_date.isnot(None),
+                TaskInstance.end_date <= cutoff,
+            )
+            if (
+                self._watermark is None
+                or time.monotonic() - self._reconciled_at >= self.reconcile_interval
+            ):
+                self._settled = aggregate_task_states(session, *settled_criteria)
+                self._reconciled_at = time.monotonic()
+            elif cutoff > self._watermark:
+                merge_accumulators(
+                    self._settled,
+                    aggregate_task_states(
+                        session, *settled_criteria, TaskInstance.end_date > self._watermark,
+                    ),
+                )
+            self._watermark = cutoff
+            results = dict(self._settled)
+
+        # The complement of the settled criteria, split so each part can use an index.
+        merge_accumulators(
+            results,
+            aggregate_task_states(
+                session,
+                or_(TaskInstance.state.is_(None), TaskInstance.state.notin_(SETTLED_STATES)),
+            ),
+        )
+        merge_accumulators(
+            results,
+            aggregate_task_states(
+                session,
+                TaskInstance.state.in_(SETTLED_STATES),
+                or_(TaskInstance.end_date.is_(None), TaskInstance.end_date > cutoff),
+            ),
+        )
+        return results
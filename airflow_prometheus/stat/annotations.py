@@ -0,0 +1,154 @@
+"""Events in a time range for Grafana annotations, newest first and capped."""
+from datetime import datetime
+from typing import Collection, Generator, List, NamedTuple, Optional
+
+from airflow.models import DagRun, TaskFail, TaskInstance
+from airflow.utils.state import State
+from sqlalchemy import and_, or_
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from .capabilities import capabilities
+from .context import ScrapeContext, scrape_session
+from .utils import task_instance_dag_run_join, task_instance_run_key
+
+# Rows fetched per keyset page.
+PAGE_SIZE = 500
+
+
+class AnnotationEvent(NamedTuple):
+    time: datetime
+    dag_id: str
+    # None for DAG run events.
+    task_id: Optional[str]
+    execution_date: datetime
+    # State, try number or duration of the event, depending on its kind.
+    detail: str
+
+
+def _after_keyset(columns, values):
+    """Rows ordered after the given values by the columns in descending order."""
+    conditions = []
+    for index, column in enumerate(columns):
+        conditions.append(and_(
+            *(previous == value for previous, value in zip(columns[:index], values[:index])),
+            column < values[index],
+        ))
+    return or_(*conditions)
+
+
+def _keyset_pages(query, columns, limit: int) -> Generator:
+    """Rows of the query by the unique columns in descending order, one page per round trip.
+
+    The first column is the event time filtered by the range, so every page
+    continues an index range scan instead of skipping OFFSET rows.
+    """
+    last = None
+    remaining = limit
+    while remaining > 0:
+        page_query = query if last is None else query.filter(_after_keyset(columns, last))
+        page = page_query.order_by(*(column.desc() for column in columns)).limit(min(PAGE_SIZE, remaining)).all()
+        yield from page
+        remaining -= len(page)
+        if len(page) < PAGE_SIZE:
+            return
+        last = [getattr(page[-1], column.key) for column in columns]
+
+
+@instrumentation.stat_function
+def get_failed_dag_runs(
+    start: datetime,
+    end: datetime,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[AnnotationEvent]:
+    """Failed DAG runs that ended within the range."""
+    with scrape_session(context) as session:
+        query = session.query(
+            DagRun.end_date, DagRun.id, DagRun.dag_id, DagRun.execution_date,
+        ).filter(
+            DagRun.state == State.FAILED,
+            DagRun.end_date > start,
+            DagRun.end_date <= end,
+        )
+        if dag_ids is not None:
+            query = query.filter(DagRun.dag_id.in_(dag_ids))
+        return [
+            AnnotationEvent(
+                time=run.end_date,
+                dag_id=run.dag_id,
+                task_id=None,
+                execution_date=run.execution_date,
+                detail=State.FAILED,
+            )
+            for run in _keyset_pages(query, [DagRun.end_date, DagRun.id], settings.MAX_ANNOTATIONS)
+        ]
+
+
+@instrumentation.stat_function
+def get_task_failures(
+    start: datetime,
+    end: datetime,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[AnnotationEvent]:
+    """Failed task attempts (retried or not) recorded in task_fail that ended within the range."""
+    if not capabilities.supports(TaskFail, context=context):
+        return []
+    with scrape_session(context) as session:
+        query = session.query(
+            TaskFail.end_date, TaskFail.id, TaskFail.dag_id, TaskFail.task_id, TaskFail.execution_date,
+            TaskFail.duration,
+        ).filter(
+            TaskFail.end_date > start,
+            TaskFail.end_date <= end,
+        )
+        if dag_ids is not None:
+            query = query.filter(TaskFail.dag_id.in_(dag_ids))
+        return [
+            AnnotationEvent(
+                time=failure.end_date,
+                dag_id=failure.dag_id,
+                task_id=failure.task_id,
+                execution_date=failure.execution_date,
+                detail=f"failed after {failure.duration or 0} sec",
+            )
+            for failure in _keyset_pages(query, [TaskFail.end_date, TaskFail.id], settings.MAX_ANNOTATIONS)
+        ]
+
+
+@instrumentation.stat_function
+def get_task_retries(
+    start: datetime,
+    end: datetime,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[AnnotationEvent]:
+    """Task instances whose latest attempt was a retry and started within the range."""
+    run_key = task_instance_run_key()
+    with scrape_session(context) as session:
+        query = session.query(
+            TaskInstance.start_date, TaskInstance.dag_id, TaskInstance.task_id, run_key,
+            # Labelled apart from the execution_date run key of Airflow 2.1.
+            DagRun.execution_date.label("run_execution_date"),
+            TaskInstance._try_number.label("try_number"), TaskInstance.state,
+        ).join(
+            DagRun, task_instance_dag_run_join(),
+        ).filter(
+            TaskInstance.start_date > start,
+            TaskInstance.start_date <= end,
+            TaskInstance._try_number > 1,
+        )
+        if dag_ids is not None:
+            query = query.filter(TaskInstance.dag_id.in_(dag_ids))
+        columns = [TaskInstance.start_date, TaskInstance.dag_id, TaskInstance.task_id, run_key]
+        return [
+            AnnotationEvent(
+                time=task.start_date,
+                dag_id=task.dag_id,
+                task_id=task.task_id,
+                execution_date=task.run_execution_date,
+                detail=f"attempt {task.try_number} ({task.state})",
+            )
+            for task in _keyset_pages(query, columns, settings.MAX_ANNOTATIONS)
+        ]
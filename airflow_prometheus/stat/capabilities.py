@@ -0,0 +1,87 @@
+"""Cached probes of which metadata tables and columns can be queried."""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from airflow_prometheus import settings
+from .context import ScrapeContext, scrape_session
+
+
+@contextmanager
+def _probe_session(context: Optional[ScrapeContext]) -> Iterator[Session]:
+    """Session of a probe within a SAVEPOINT.
+
+    A failing statement aborts the whole transaction on Postgres, rolling
+    back to the savepoint keeps the shared scrape transaction usable.
+    """
+    with scrape_session(context) as session, session.begin_nested():
+        yield session
+
+
+class CapabilityProbe(object):
+    """Answers "can this be queried?" with at most one cheap query per TTL."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._has_rows: Dict[str, Tuple[float, bool]] = dict()
+        self._columns: Dict[str, Tuple[float, Optional[Set[str]]]] = dict()
+
+    def invalidate(self):
+        with self._lock:
+            self._has_rows.clear()
+            self._columns.clear()
+
+    def _cached(self, cache: Dict, key: str):
+        with self._lock:
+            entry = cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return True, entry[1]
+        return False, None
+
+    def _store(self, cache: Dict, key: str, value):
+        with self._lock:
+            cache[key] = (time.monotonic(), value)
+        return value
+
+    def columns(self, table_name: str, context: Optional[ScrapeContext] = None) -> Set[str]:
+        """Names of the columns of a table, empty if the table does not exist."""
+        found, columns = self._cached(self._columns, table_name)
+        if found:
+            return columns
+        try:
+            with _probe_session(context) as session:
+                inspector = inspect(session.connection())
+                columns = {column["name"] for column in inspector.get_columns(table_name)}
+        except SQLAlchemyError:
+            columns = set()
+        return self._store(self._columns, table_name, columns)
+
+    def supports(self, model, *column_names: str, context: Optional[ScrapeContext] = None) -> bool:
+        """Whether the table of the model exists and has all of the given columns."""
+        columns = self.columns(model.__tablename__, context)
+        return bool(columns) and all(name in columns for name in column_names)
+
+    def has_rows(self, model, context: Optional[ScrapeContext] = None) -> bool:
+        """Whether the table of the model has at least one row."""
+        table_name = model.__tablename__
+        found, has_rows = self._cached(self._has_rows, table_name)
+        if found:
+            return has_rows
+        if not self.columns(table_name, context):
+            return self._store(self._has_rows, table_name, False)
+        try:
+            with _probe_session(context) as session:
+                primary_key = list(model.__table__.primary_key.columns)
+                has_rows = session.query(*primary_key).limit(1).first() is not None
+        except SQLAlchemyError:
+            has_rows = False
+        return self._store(self._has_rows, table_name, has_rows)
+
+
+capabilities = CapabilityProbe(ttl=settings.CAPABILITY_PROBE_TTL)
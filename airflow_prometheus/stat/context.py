@@ -0,0 +1,85 @@
+"""Scrape-scoped database session shared by all collectors."""
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from airflow import settings as airflow_settings
+from sqlalchemy.orm import Session as SqlaSession
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+
+# Dialects on which the scrape transaction is switched to a snapshot isolation level.
+SNAPSHOT_ISOLATION_DIALECTS = ("postgresql", "mysql")
+
+_session_factory: Optional[Callable[[], SqlaSession]] = None
+_local = threading.local()
+
+
+@dataclass
+class ScrapeContext:
+    """One pooled connection and one consistent read snapshot for a scrape."""
+
+    session: SqlaSession
+    cache: Dict[Any, Any] = field(default_factory=dict)
+
+
+def configure_session_factory(factory: Optional[Callable[[], SqlaSession]]):
+    """Use a dedicated session factory instead of the Airflow one."""
+    global _session_factory
+    _session_factory = factory
+
+
+def current_scrape_context() -> Optional[ScrapeContext]:
+    """Context of the scrape running on this thread, if any."""
+    return getattr(_local, "context", None)
+
+
+def _open_session() -> SqlaSession:
+    if _session_factory is not None:
+        session = _session_factory()
+    else:
+        session = airflow_settings.Session()
+    instrumentation.install(session.get_bind())
+    return session
+
+
+@contextmanager
+def scrape_context() -> Iterator[ScrapeContext]:
+    """Open a scrape context or join the one already running on this thread."""
+    context = current_scrape_context()
+    if context is not None:
+        yield context
+        return
+
+    session = _open_session()
+    try:
+        if session.bind.dialect.name in SNAPSHOT_ISOLATION_DIALECTS:
+            # Must happen before the first query so it applies to the whole transaction.
+            session.connection(
+                execution_options={"isolation_level": settings.SCRAPE_ISOLATION_LEVEL}
+            )
+        context = ScrapeContext(session=session)
+        _local.context = context
+        yield context
+    finally:
+        _local.context = None
+        # The scrape only reads, so there is nothing to commit.
+        session.rollback()
+        session.close()
+
+
+@contextmanager
+def scrape_session(context: Optional[ScrapeContext] = None) -> Iterator[SqlaSession]:
+    """Session of the given or current scrape, or a short-lived one outside of scrapes."""
+    if context is None:
+        context = current_scrape_context()
+    if context is not None:
+        yield context.session
+        return
+    session = _open_session()
+    try:
+        yield session
+    finally:
+        session.close()
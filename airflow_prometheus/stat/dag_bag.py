@@ -0,0 +1,128 @@
+"""Process-wide DagBag that only re-parses DAG files which changed."""
+import hashlib
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from airflow.configuration import conf
+from airflow.models.dag import DAG
+from airflow.models.dagbag import DagBag
+from airflow.utils.file import list_py_file_paths
+
+from airflow_prometheus import settings
+
+
+@dataclass
+class DagBagCacheStats:
+    hits: int = 0
+    misses: int = 0
+    reloads: int = 0
+    last_reload_seconds: float = 0
+    total_reload_seconds: float = 0
+
+
+def _file_hash(filepath: str) -> Optional[str]:
+    try:
+        with open(filepath, "rb") as file:
+            return hashlib.sha1(file.read()).hexdigest()  # noqa: S303
+    except OSError:
+        return None
+
+
+class DagBagProvider(object):
+    """Thread-safe shared DagBag.
+
+    The DAG folder is checked at most once per refresh interval. Files are
+    only re-parsed when both their mtime and their content hash changed.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.stats = DagBagCacheStats()
+        self._lock = threading.Lock()
+        self._dag_bag: Optional[DagBag] = None
+        self._dags: List[DAG] = []
+        self._files: Dict[str, Tuple[float, Optional[str]]] = dict()
+        self._checked_at = 0.0
+
+    def get_dag_bag(self) -> DagBag:
+        """The shared DagBag, refreshed if it is due."""
+        with self._lock:
+            if self._dag_bag is None:
+                self._reload(self._build)
+            elif time.monotonic() - self._checked_at >= self.refresh_interval:
+                changed, removed = self._changed_files()
+                if changed or removed:
+                    self._reload(lambda: self._update(changed, removed))
+                else:
+                    self.stats.hits += 1
+                self._checked_at = time.monotonic()
+            else:
+                self.stats.hits += 1
+            return self._dag_bag
+
+    def get_dags(self) -> List[DAG]:
+        """Snapshot of all DAGs that is safe to iterate while the bag reloads."""
+        self.get_dag_bag()
+        return self._dags
+
+    def _reload(self, reload_fn):
+        started_at = time.monotonic()
+        reload_fn()
+        self._dags = list(self._dag_bag.dags.values())
+        self._checked_at = time.monotonic()
+        elapsed = self._checked_at - started_at
+        self.stats.misses += 1
+        self.stats.reloads += 1
+        self.stats.last_reload_seconds = elapsed
+        self.stats.total_reload_seconds += elapsed
+
+    def _build(self):
+        self._dag_bag = DagBag()
+        self._files = {
+            filepath: (mtime, _file_hash(filepath))
+            for filepath, mtime in self._scan_folder().items()
+        }
+
+    def _scan_folder(self) -> Dict[str, float]:
+        mtimes = dict()
+        for filepath in list_py_file_paths(
+            self._dag_bag.dag_folder,
+            include_examples=conf.getboolean("core", "LOAD_EXAMPLES"),
+        ):
+            try:
+                mtimes[filepath] = os.path.getmtime(filepath)
+            except OSError:
+                continue
+        return mtimes
+
+    def _changed_files(self) -> Tuple[List[str], List[str]]:
+        mtimes = self._scan_folder()
+        removed = [filepath for filepath in self._files if filepath not in mtimes]
+        changed = []
+        for filepath, mtime in mtimes.items():
+            known = self._files.get(filepath)
+            if known is not None and known[0] == mtime:
+                continue
+            file_hash = _file_hash(filepath)
+            if known is None or known[1] != file_hash:
+                changed.append(filepath)
+            self._files[filepath] = (mtime, file_hash)
+        for filepath in removed:
+            del self._files[filepath]
+        return changed, removed
+
+    def _update(self, changed: List[str], removed: List[str]):
+        stale = set(changed) | set(removed)
+        for dag_id, dag in list(self._dag_bag.dags.items()):
+            if dag.fileloc in stale:
+                del self._dag_bag.dags[dag_id]
+        for filepath in removed:
+            self._dag_bag.file_last_changed.pop(filepath, None)
+        for filepath in changed:
+            self._dag_bag.process_file(filepath, only_if_updated=False)
+
+
+dag_bag_provider = DagBagProvider(refresh_interval=settings.DAG_BAG_REFRESH_INTERVAL)
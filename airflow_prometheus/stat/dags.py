@@ -1,33 +1,48 @@
 """Prometheus exporter for Airflow."""
 from airflow.models import DagModel, DagRun, TaskInstance
-from airflow.settings import Session
 from airflow.utils.state import State
 from sqlalchemy import and_, func
-from dataclasses import dataclass
 
-from typing import Generator
-from .utils import session_scope, ProcessingState, to_processing_state
+from typing import Generator, List, NamedTuple, Optional
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from .context import ScrapeContext, scrape_session
+from .utils import ProcessingState, to_processing_state
 from datetime import datetime
 
 
-@dataclass
-class DagStateInfo:
+class DagStateInfo(NamedTuple):
     dag_id: str
     owner: str
     state: ProcessingState
     count: float
 
 
-@dataclass
-class DagDurationInfo:
+class DagDurationInfo(NamedTuple):
     dag_id: str
     start_date: datetime
     end_date: datetime
 
 
-def get_dag_state_info() -> Generator[DagStateInfo, None, None]:
+@instrumentation.stat_function
+def get_active_dag_ids(context: Optional[ScrapeContext] = None) -> List[str]:
+    """Ids of active and unpaused DAGs."""
+    with scrape_session(context) as session:
+        return [
+            dag_id
+            for dag_id, in session.query(DagModel.dag_id).filter(
+                DagModel.is_active == True,  # noqa
+                DagModel.is_paused == False,
+            )
+        ]
+
+
+@instrumentation.stat_function
+def get_dag_state_info(
+    context: Optional[ScrapeContext] = None,
+) -> Generator[DagStateInfo, None, None]:
     """Number of DAG Runs with particular state."""
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         dag_status_query = (
             session.query(
                 DagRun.dag_id,
@@ -49,7 +64,7 @@ def get_dag_state_info() -> Generator[DagStateInfo, None, None]:
                 DagModel.is_active == True,  # noqa
                 DagModel.is_paused == False,
             )
-            .all()
+            .yield_per(settings.STREAM_BATCH_SIZE)
         ):
             yield DagStateInfo(
                 dag_id=dag.dag_id,
@@ -59,9 +74,12 @@ def get_dag_state_info() -> Generator[DagStateInfo, None, None]:
             )
 
 
-def get_dag_duration_info() -> Generator[DagDurationInfo, None, None]:
+@instrumentation.stat_function
+def get_dag_duration_info(
+    context: Optional[ScrapeContext] = None,
+) -> Generator[DagDurationInfo, None, None]:
     """Duration of successful DAG Runs."""
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         max_execution_dt_query = (
             session.query(
                 DagRun.dag_id,
@@ -96,6 +114,10 @@ def get_dag_duration_info() -> Generator[DagDurationInfo, None, None]:
                     ),
                 ),
             )
+            .filter(
+                TaskInstance.start_date.isnot(None),
+                TaskInstance.end_date.isnot(None),
+            )
             .group_by(
                 max_execution_dt_query.c.dag_id,
                 max_execution_dt_query.c.max_execution_dt,
@@ -117,11 +139,7 @@ def get_dag_duration_info() -> Generator[DagDurationInfo, None, None]:
                     == dag_start_dt_query.c.execution_date,
                 ),
             )
-            .filter(
-                TaskInstance.start_date.isnot(None),
-                TaskInstance.end_date.isnot(None),
-            )
-            .all()
+            .yield_per(settings.STREAM_BATCH_SIZE)
         ):
             yield DagDurationInfo(
                 dag_id=dag.dag_id,
@@ -1,19 +1,21 @@
-from airflow.models.dagbag import DagBag
 from dataclasses import dataclass
 from typing import Dict
 from collections import defaultdict
 
+from .dag_bag import dag_bag_provider, DagBagCacheStats
+
 
 @dataclass
 class DagBagInfo:
     loaded_dags_count: int
     tasks: Dict[str, int]
+    cache: DagBagCacheStats
 
 
 def get_dag_bag_info() -> DagBagInfo:
     loaded_dags_count = 0
     tasks: Dict[str, int] = defaultdict(int)
-    for dag in DagBag().dags.values():
+    for dag in dag_bag_provider.get_dags():
         loaded_dags_count += 1
         for task in dag.tasks:
             tasks[task.__class__.__name__] += 1
@@ -21,4 +23,5 @@ def get_dag_bag_info() -> DagBagInfo:
     return DagBagInfo(
         loaded_dags_count=loaded_dags_count,
         tasks=tasks,
+        cache=dag_bag_provider.stats,
     )
@@ -0,0 +1,81 @@
+"""Incrementally maintained duration sketches per task and per DAG."""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from airflow.models import DagRun, TaskInstance
+from airflow.utils import timezone
+from airflow.utils.state import State
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from .context import ScrapeContext, scrape_session
+from .sketch import QuantileSketch
+
+# Rows fetched per round trip while folding history into the sketches.
+FOLD_BATCH_SIZE = 10000
+
+
+class DurationSketches(object):
+    """Quantile sketches of finished task instance and DAG run durations.
+
+    Every refresh folds in rows that ended since the previous one. Rows are
+    only folded once they are older than the lag, so late commits of rows
+    with an earlier end_date are not skipped by the watermark.
+    """
+
+    def __init__(self, relative_accuracy: float, max_bins: int, lag: timedelta):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.lag = lag
+        self.tasks: Dict[Tuple[str, str], QuantileSketch] = dict()
+        self.dags: Dict[str, QuantileSketch] = dict()
+        # Held while folding rows in; readers take it to get a consistent view.
+        self.lock = threading.RLock()
+        self._watermark: Optional[datetime] = None
+
+    def _new_sketch(self) -> QuantileSketch:
+        return QuantileSketch(self.relative_accuracy, self.max_bins)
+
+    @instrumentation.stat_function
+    def refresh(self, context: Optional[ScrapeContext] = None):
+        with self.lock, scrape_session(context) as session:
+            cutoff = timezone.utcnow() - self.lag
+            if self._watermark is not None and cutoff <= self._watermark:
+                return
+
+            task_rows = session.query(
+                TaskInstance.dag_id, TaskInstance.task_id, TaskInstance.duration,
+            ).filter(
+                TaskInstance.state.in_((State.SUCCESS, State.FAILED)),
+                TaskInstance.duration.isnot(None),
+                TaskInstance.end_date <= cutoff,
+            )
+            dag_rows = session.query(
+                DagRun.dag_id, DagRun.start_date, DagRun.end_date,
+            ).filter(
+                DagRun.state == State.SUCCESS,
+                DagRun.start_date.isnot(None),
+                DagRun.end_date <= cutoff,
+            )
+            if self._watermark is not None:
+                task_rows = task_rows.filter(TaskInstance.end_date > self._watermark)
+                dag_rows = dag_rows.filter(DagRun.end_date > self._watermark)
+
+            for dag_id, task_id, duration in task_rows.yield_per(FOLD_BATCH_SIZE):
+                key = (dag_id, task_id)
+                if key not in self.tasks:
+                    self.tasks[key] = self._new_sketch()
+                self.tasks[key].add(duration)
+            for dag_id, start_date, end_date in dag_rows.yield_per(FOLD_BATCH_SIZE):
+                if dag_id not in self.dags:
+                    self.dags[dag_id] = self._new_sketch()
+                self.dags[dag_id].add((end_date - start_date).total_seconds())
+            self._watermark = cutoff
+
+
+duration_sketches = DurationSketches(
+    relative_accuracy=settings.DURATION_SKETCH_ACCURACY,
+    max_bins=settings.DURATION_SKETCH_MAX_BINS,
+    lag=timedelta(seconds=settings.DURATION_SKETCH_LAG),
+)
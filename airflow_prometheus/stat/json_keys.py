@@ -0,0 +1,87 @@
+"""Extraction of top-level keys from a JSON object without decoding all of it."""
+import json
+import re
+from typing import Any, Collection, Dict
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+# Rest of a string after its opening quote, including the closing quote.
+_STRING_REST = re.compile(rb'(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+_SCALAR = re.compile(rb"[^,}\]\s]+")
+
+_QUOTE = ord('"')
+_OPEN = (ord("{"), ord("["))
+
+
+def _skip_whitespace(data: bytes, pos: int) -> int:
+    return _WHITESPACE.match(data, pos).end()
+
+
+def _string_end(data: bytes, pos: int) -> int:
+    match = _STRING_REST.match(data, pos + 1)
+    if match is None:
+        raise ValueError("Unterminated string at %d" % pos)
+    return match.end()
+
+
+def _value_end(data: bytes, pos: int) -> int:
+    """Position just after the JSON value starting at pos."""
+    if pos >= len(data):
+        raise ValueError("Expected a value at %d" % pos)
+    first = data[pos]
+    if first == _QUOTE:
+        return _string_end(data, pos)
+    if first in _OPEN:
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(data, pos)
+            if match is None:
+                raise ValueError("Unterminated container at %d" % pos)
+            char = data[match.start()]
+            if char == _QUOTE:
+                pos = _string_end(data, match.start())
+                continue
+            pos = match.end()
+            depth += 1 if char in _OPEN else -1
+            if depth == 0:
+                return pos
+    match = _SCALAR.match(data, pos)
+    if match is None:
+        raise ValueError("Expected a value at %d" % pos)
+    return match.end()
+
+
+def _expect(data: bytes, pos: int, char: bytes) -> int:
+    if data[pos:pos + 1] != char:
+        raise ValueError("Expected %r at %d" % (char, pos))
+    return pos + 1
+
+
+def extract_json_keys(data: bytes, keys: Collection[str]) -> Dict[str, Any]:
+    """Values of the given top-level keys of the JSON object encoded in data.
+
+    Values of other keys are skipped over without being decoded, so memory use
+    only depends on the size of the requested values.
+
+    Raises:
+        ValueError: if data is not a JSON object
+    """
+    found_slices = dict()
+    pos = _expect(data, _skip_whitespace(data, 0), b"{")
+    pos = _skip_whitespace(data, pos)
+    if data[pos:pos + 1] == b"}":
+        return dict()
+    while True:
+        key_end = _string_end(data, _expect(data, pos, b'"') - 1)
+        key = json.loads(data[pos:key_end])
+        pos = _expect(data, _skip_whitespace(data, key_end), b":")
+        value_start = _skip_whitespace(data, pos)
+        value_end = _value_end(data, value_start)
+        if key in keys:
+            # Like json.loads, the last occurrence of a duplicated key wins.
+            found_slices[key] = (value_start, value_end)
+        pos = _skip_whitespace(data, value_end)
+        if data[pos:pos + 1] == b"}":
+            break
+        pos = _skip_whitespace(data, _expect(data, pos, b","))
+    return {key: json.loads(data[start:end]) for key, (start, end) in found_slices.items()}
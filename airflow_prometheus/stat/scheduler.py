@@ -1,15 +1,21 @@
 """Prometheus exporter for Airflow."""
+from datetime import timedelta
+
 from airflow.models import DagRun, TaskInstance
-from airflow.settings import Session
+from airflow.utils import timezone
 from airflow.utils.state import State
-from sqlalchemy import and_, func
+from sqlalchemy import func
+from typing import Optional
 
-from .utils import session_scope
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from .context import ScrapeContext, scrape_session
 
 
-def get_dag_scheduler_delay():
+@instrumentation.stat_function
+def get_dag_scheduler_delay(context: Optional[ScrapeContext] = None):
     """Compute DAG scheduling delay."""
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         return (
             session.query(
                 DagRun.dag_id, DagRun.execution_date, DagRun.start_date,
@@ -21,44 +27,65 @@ def get_dag_scheduler_delay():
         )
 
 
-def get_task_scheduler_delay():
+@instrumentation.stat_function
+def get_task_scheduler_delay(context: Optional[ScrapeContext] = None):
     """Compute Task scheduling delay."""
-    with session_scope(Session) as session:
-        task_status_query = (
+    criteria = [
+        TaskInstance.state == State.SUCCESS,
+        TaskInstance.queued_dttm.isnot(None),
+        TaskInstance.start_date.isnot(None),
+    ]
+    if settings.SCHEDULER_DELAY_LOOKBACK > 0:
+        # Bounds the rows read (and ranked) to the recent ones served by the start_date index.
+        criteria.append(
+            TaskInstance.start_date > timezone.utcnow() - timedelta(seconds=settings.SCHEDULER_DELAY_LOOKBACK)
+        )
+    with scrape_session(context) as session:
+        if session.bind.dialect.name == "sqlite":
+            # Window functions need SQLite 3.25, older than what Airflow accepts. A bare
+            # column next to a single MAX() is documented to come from the row holding
+            # that maximum (https://sqlite.org/lang_select.html#bareagg), so queued_dttm
+            # belongs to the latest started task of the queue like with row_number below.
+            return (
+                session.query(
+                    TaskInstance.queue,
+                    TaskInstance.queued_dttm,
+                    func.max(TaskInstance.start_date).label("start_date"),
+                )
+                .filter(*criteria)
+                .group_by(TaskInstance.queue)
+                .all()
+            )
+
+        # The latest started task per queue, without joining task_instance on start_date.
+        ranked_tasks = (
             session.query(
                 TaskInstance.queue,
-                func.max(TaskInstance.start_date).label("max_start"),
-            )
-            .filter(
-                TaskInstance.state == State.SUCCESS,
-                TaskInstance.queued_dttm.isnot(None),
+                TaskInstance.queued_dttm,
+                TaskInstance.start_date,
+                func.row_number().over(
+                    partition_by=TaskInstance.queue,
+                    order_by=TaskInstance.start_date.desc(),
+                ).label("task_rank"),
             )
-            .group_by(TaskInstance.queue)
+            .filter(*criteria)
             .subquery()
         )
         return (
             session.query(
-                task_status_query.c.queue,
-                TaskInstance.queued_dttm,
-                task_status_query.c.max_start.label("start_date"),
-            )
-            .join(
-                TaskInstance,
-                and_(
-                    TaskInstance.queue == task_status_query.c.queue,
-                    TaskInstance.start_date == task_status_query.c.max_start,
-                ),
-            )
-            .filter(
-                TaskInstance.state == State.SUCCESS,  # Redundant, for performance.
+                ranked_tasks.c.queue,
+                ranked_tasks.c.queued_dttm,
+                ranked_tasks.c.start_date,
             )
+            .filter(ranked_tasks.c.task_rank == 1)
             .all()
         )
 
 
-def get_num_queued_tasks():
+@instrumentation.stat_function
+def get_num_queued_tasks(context: Optional[ScrapeContext] = None):
     """Number of queued tasks currently."""
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         return (
             session.query(TaskInstance)
             .filter(TaskInstance.state == State.QUEUED)
@@ -0,0 +1,90 @@
+"""Mergeable quantile sketches with bounded memory (DDSketch style)."""
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class QuantileSketch(object):
+    """Relative-error quantile sketch over non-negative values.
+
+    Values are counted in logarithmically sized bins so every quantile is
+    within relative_accuracy of the true value. When more than max_bins bins
+    are in use the lowest ones are collapsed, which only costs accuracy on
+    the smallest values.
+    """
+
+    __slots__ = ("relative_accuracy", "max_bins", "_gamma_log", "bins", "zero_count", "count", "sum")
+
+    def __init__(self, relative_accuracy: float = 0.02, max_bins: int = 512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._gamma_log = math.log(gamma)
+        self.bins: Dict[int, int] = dict()
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._gamma_log))
+
+    def _lower_bound(self, key: int) -> float:
+        return math.exp((key - 1) * self._gamma_log)
+
+    def _value(self, key: int) -> float:
+        # Midpoint (in relative terms) of the bin, which bounds the relative error.
+        return 2 * math.exp(key * self._gamma_log) / (1 + math.exp(self._gamma_log))
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        self.count += count
+        self.sum += value * count
+
+    def merge(self, other: "QuantileSketch"):
+        self.zero_count += other.zero_count
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.count += other.count
+        self.sum += other.sum
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = keys[: len(keys) - self.max_bins + 1]
+        target = keys[len(excess)]
+        self.bins[target] += sum(self.bins.pop(key) for key in excess)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return self._value(key)
+        return self._value(max(self.bins))
+
+    def cumulative_counts(self, upper_bounds: Iterable[float]) -> List[Tuple[float, int]]:
+        """Approximate histogram buckets (upper bound, cumulative count).
+
+        A bin is counted in a bucket when its whole range lies below the bound.
+        """
+        keys = sorted(self.bins)
+        buckets = []
+        index = 0
+        seen = self.zero_count
+        for upper_bound in sorted(upper_bounds):
+            while index < len(keys) and self._lower_bound(keys[index] + 1) <= upper_bound:
+                seen += self.bins[keys[index]]
+                index += 1
+            buckets.append((upper_bound, seen))
+        return buckets
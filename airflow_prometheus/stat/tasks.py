@@ -1,30 +1,39 @@
 """Prometheus exporter for Airflow."""
-import json
-import pickle
-
-from airflow.configuration import conf
-from airflow.models import DagModel, DagRun, TaskInstance, TaskFail, XCom
-from airflow.settings import Session
+from airflow.models import DagModel, DagRun, TaskInstance, TaskFail
 from airflow.utils.state import State
-from airflow.models.dagbag import DagBag
-from airflow.utils.log.logging_mixin import LoggingMixin
 from sqlalchemy import and_, func
 from sqlalchemy.exc import InvalidRequestError
-from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+from .aggregation import TaskStateAccumulator, TaskStateAggregator
+from .capabilities import capabilities
+from .context import ScrapeContext, scrape_session
+from .dag_bag import dag_bag_provider
+from .utils import ProcessingState, task_instance_dag_run_join, to_processing_state
+from typing import Collection, Generator, Dict, List, NamedTuple, Optional
+
+# Labels of the task state families and the columns they are aggregated by.
+TASK_STATE_LABELS = ("dag_id", "task_id", "operator_name", "owner", "state")
+TASK_STATE_COLUMNS = {
+    "dag_id": TaskInstance.dag_id,
+    "task_id": TaskInstance.task_id,
+    "operator_name": TaskInstance.operator,
+    "owner": DagModel.owners,
+    "state": TaskInstance.state,
+}
 
-from .utils import session_scope, ProcessingState, to_processing_state
-from typing import Generator, Dict, List
+task_state_aggregator = TaskStateAggregator(
+    rescan_window=timedelta(seconds=settings.AGGREGATION_RESCAN_WINDOW),
+    reconcile_interval=settings.AGGREGATION_RECONCILE_INTERVAL,
+)
 
-def check_if_can_query_tasks():
-    try:
-        with session_scope(Session) as session:
-            return len(session.query(TaskInstance.task_id).all()) > 0
-    except:
-        return False
 
-@dataclass
-class TaskStateInfo:
+def check_if_can_query_tasks(context: Optional[ScrapeContext] = None):
+    return capabilities.has_rows(TaskInstance, context)
+
+class TaskStateInfo(NamedTuple):
     task_id: str
     dag_id: str
     operator_name: str
@@ -37,15 +46,13 @@ class TaskStateInfo:
     max_tries: int
 
 
-@dataclass
-class TaskFailInfo:
+class TaskFailInfo(NamedTuple):
     task_id: str
     dag_id: str
     count: float
 
 
-@dataclass
-class TaskDurationInfo:
+class TaskDurationInfo(NamedTuple):
     task_id: str
     dag_id: str
     start_date: datetime
@@ -53,8 +60,7 @@ class TaskDurationInfo:
     execution_date: datetime
 
 
-@dataclass
-class LatestTaskInfo:
+class LatestTaskInfo(NamedTuple):
     task_id: str
     dag_id: str
     execution_date: datetime
@@ -62,49 +68,89 @@ class LatestTaskInfo:
     duration: float
 
 
-def get_latest_tasks_state_info_for_all_dags() -> List[LatestTaskInfo]:
-    if not check_if_can_query_tasks():
-        return []
+def get_latest_tasks_state_info_for_all_dags(
+    context: Optional[ScrapeContext] = None,
+    dag_ids: Optional[Collection[str]] = None,
+) -> List[LatestTaskInfo]:
+    loaded_dag_ids = {dag.dag_id for dag in dag_bag_provider.get_dags()}
     results: List[LatestTaskInfo] = []
-    for dag in DagBag().dags.values():
-        meta = get_latest_tasks_state_info(dag.dag_id)
-        results += list(meta.values())
+    for dag_id, meta in get_latest_tasks_state_info_by_dag(dag_ids, context).items():
+        if dag_id in loaded_dag_ids:
+            results += list(meta.values())
     return results
 
 
-def get_latest_tasks_state_info(dag_id: str) -> Dict[str, LatestTaskInfo]:
-    if not check_if_can_query_tasks():
-        return dict()
-    with session_scope(Session) as session:
-        latest_dag_execution_date = (
-            session.query(
-                DagRun.execution_date,
-                DagRun.dag_id,
-            )
-            .filter(DagRun.dag_id == dag_id)
-            .order_by(DagRun.execution_date.desc())
-            .limit(1)
-            .all()
+def get_latest_tasks_state_info(
+    dag_id: str, context: Optional[ScrapeContext] = None,
+) -> Dict[str, LatestTaskInfo]:
+    return get_latest_tasks_state_info_by_dag([dag_id], context).get(dag_id, dict())
+
+
+def _latest_dag_runs_query(session, dag_ids: Optional[Collection[str]]):
+    """Subquery with the execution_date of the latest run of each DAG."""
+    if session.bind.dialect.name == "sqlite":
+        # Older SQLite builds lack window functions, MAX per group is equivalent here.
+        latest_runs = session.query(
+            DagRun.dag_id,
+            func.max(DagRun.execution_date).label("execution_date"),
         )
-        if len(latest_dag_execution_date) == 0:
-            return dict()
+        if dag_ids is not None:
+            latest_runs = latest_runs.filter(DagRun.dag_id.in_(dag_ids))
+        return latest_runs.group_by(DagRun.dag_id).subquery()
+
+    ranked_runs = session.query(
+        DagRun.dag_id,
+        DagRun.execution_date,
+        func.row_number().over(
+            partition_by=DagRun.dag_id,
+            order_by=DagRun.execution_date.desc(),
+        ).label("run_rank"),
+    )
+    if dag_ids is not None:
+        ranked_runs = ranked_runs.filter(DagRun.dag_id.in_(dag_ids))
+    ranked_runs = ranked_runs.subquery()
+    return (
+        session.query(ranked_runs.c.dag_id, ranked_runs.c.execution_date)
+        .filter(ranked_runs.c.run_rank == 1)
+        .subquery()
+    )
 
-        latest_dag_execution_date = latest_dag_execution_date[0].execution_date
+
+@instrumentation.stat_function
+def get_latest_tasks_state_info_by_dag(
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> Dict[str, Dict[str, LatestTaskInfo]]:
+    """Task states of the latest run of every DAG (or only the given ones) in one query."""
+    if not check_if_can_query_tasks(context):
+        return dict()
+    if dag_ids is not None and len(dag_ids) == 0:
+        return dict()
+    with scrape_session(context) as session:
+        latest_runs = _latest_dag_runs_query(session, dag_ids)
         latest_task_runs = (
             session.query(
                 TaskInstance.state,
                 TaskInstance.dag_id,
                 TaskInstance.task_id,
                 TaskInstance.duration,
-                DagRun.execution_date
+                DagRun.execution_date,
+            )
+            .join(DagRun, task_instance_dag_run_join())
+            .join(
+                latest_runs,
+                and_(
+                    DagRun.dag_id == latest_runs.c.dag_id,
+                    DagRun.execution_date == latest_runs.c.execution_date,
+                ),
             )
-            .join(DagRun, DagRun.dag_id == TaskInstance.dag_id)
-            .filter(DagRun.execution_date == latest_dag_execution_date)
             .all()
         )
-        latest_task_runs_dict = dict()
+        latest_task_runs_dict: Dict[str, Dict[str, LatestTaskInfo]] = dict()
         for latest_task_run in latest_task_runs:
-            latest_task_runs_dict[latest_task_run.task_id] = LatestTaskInfo(
+            latest_task_runs_dict.setdefault(latest_task_run.dag_id, dict())[
+                latest_task_run.task_id
+            ] = LatestTaskInfo(
                 task_id=latest_task_run.task_id,
                 dag_id=latest_task_run.dag_id,
                 execution_date=latest_task_run.execution_date,
@@ -114,11 +160,17 @@ def get_latest_tasks_state_info(dag_id: str) -> Dict[str, LatestTaskInfo]:
         return latest_task_runs_dict
 
 
-def get_task_state_info() -> Generator[TaskStateInfo, None, None]:
+@instrumentation.stat_function
+def get_task_state_info(
+    context: Optional[ScrapeContext] = None,
+) -> Generator[TaskStateInfo, None, None]:
     """Number of task instances with particular state."""
-    if not check_if_can_query_tasks():
+    if not check_if_can_query_tasks(context):
         return
-    with session_scope(Session) as session:
+    if settings.INCREMENTAL_TASK_AGGREGATION:
+        yield from _get_incremental_task_state_info(context)
+        return
+    with scrape_session(context) as session:
         task_status_query = (
             session.query(
                 TaskInstance.dag_id,
@@ -154,7 +206,7 @@ def get_task_state_info() -> Generator[TaskStateInfo, None, None]:
                 DagModel.is_active == True,  # noqa
                 DagModel.is_paused == False,
             )
-            .all()
+            .yield_per(settings.STREAM_BATCH_SIZE)
         ):
             yield TaskStateInfo(
                 task_id=task.task_id,
@@ -170,11 +222,114 @@ def get_task_state_info() -> Generator[TaskStateInfo, None, None]:
             )
 
 
-def get_task_failure_counts() -> Generator[TaskFailInfo, None, None]:
+def _get_incremental_task_state_info(
+    context: Optional[ScrapeContext] = None,
+    labels: Collection[str] = TASK_STATE_LABELS,
+    dag_ids: Optional[Collection[str]] = None,
+) -> Generator[TaskStateInfo, None, None]:
+    with scrape_session(context) as session:
+        owners = dict(
+            session.query(DagModel.dag_id, DagModel.owners)
+            .filter(
+                DagModel.is_active == True,  # noqa
+                DagModel.is_paused == False,
+            )
+            .all()
+        )
+        accumulators = task_state_aggregator.aggregate(session)
+
+    rolled_up: Dict[tuple, TaskStateAccumulator] = dict()
+    for (dag_id, task_id, operator, state), task in accumulators.items():
+        if dag_id not in owners or (dag_ids is not None and dag_id not in dag_ids):
+            continue
+        values = dict(
+            dag_id=dag_id,
+            task_id=task_id,
+            operator_name=operator,
+            owner=owners[dag_id],
+            state=to_processing_state(state),
+        )
+        key = tuple(values[label] if label in labels else "" for label in TASK_STATE_LABELS)
+        rolled_up[key] = rolled_up[key].merge(task) if key in rolled_up else task
+
+    for (dag_id, task_id, operator, owner, state), task in rolled_up.items():
+        yield TaskStateInfo(
+            task_id=task_id,
+            dag_id=dag_id,
+            operator_name=operator,
+            owner=owner,
+            state=state,
+            count=task.count,
+            avg_duration=task.avg_duration or 0,
+            min_duration=task.min_duration or 0,
+            max_duration=task.max_duration or 0,
+            max_tries=task.max_tries,
+        )
+
+
+@instrumentation.stat_function
+def get_task_state_rollup(
+    labels: Collection[str],
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> Generator[TaskStateInfo, None, None]:
+    """Number of task instances with particular state, aggregated in SQL over the given labels only.
+
+    Labels that are not kept are reported as empty strings.
+    """
+    if not check_if_can_query_tasks(context):
+        return
+    if settings.INCREMENTAL_TASK_AGGREGATION:
+        yield from _get_incremental_task_state_info(context, labels, dag_ids)
+        return
+    columns = [
+        TASK_STATE_COLUMNS[label].label(label) for label in TASK_STATE_LABELS if label in labels
+    ]
+    with scrape_session(context) as session:
+        query = (
+            session.query(
+                *columns,
+                func.count(TaskInstance.dag_id).label("value"),
+                func.avg(TaskInstance.duration).label("avg_duration"),
+                func.min(TaskInstance.duration).label("min_duration"),
+                func.max(TaskInstance.duration).label("max_duration"),
+                func.max(TaskInstance.max_tries).label("max_tries"),
+            )
+            .join(DagModel, DagModel.dag_id == TaskInstance.dag_id)
+            .filter(
+                DagModel.is_active == True,  # noqa
+                DagModel.is_paused == False,
+            )
+        )
+        if dag_ids is not None:
+            query = query.filter(TaskInstance.dag_id.in_(dag_ids))
+        query = query.group_by(
+            *[TASK_STATE_COLUMNS[label] for label in TASK_STATE_LABELS if label in labels]
+        )
+        for task in query.yield_per(settings.STREAM_BATCH_SIZE):
+            values = task._asdict()
+            yield TaskStateInfo(
+                task_id=values.get("task_id", ""),
+                dag_id=values.get("dag_id", ""),
+                operator_name=values.get("operator_name", ""),
+                owner=values.get("owner", ""),
+                state=to_processing_state(values["state"]) if "state" in values else "",
+                count=task.value,
+                avg_duration=task.avg_duration or 0,
+                min_duration=task.min_duration or 0,
+                max_duration=task.max_duration or 0,
+                max_tries=task.max_tries,
+            )
+
+
+@instrumentation.stat_function
+def get_task_failure_counts(
+    context: Optional[ScrapeContext] = None,
+) -> Generator[TaskFailInfo, None, None]:
     """Compute Task Failure Counts."""
-    if not check_if_can_query_tasks():
+    if not check_if_can_query_tasks(context):
         return
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         for task in (
             session.query(
                 TaskFail.dag_id,
@@ -187,6 +342,7 @@ def get_task_failure_counts() -> Generator[TaskFailInfo, None, None]:
                 DagModel.is_paused == False,
             )
             .group_by(TaskFail.dag_id, TaskFail.task_id,)
+            .yield_per(settings.STREAM_BATCH_SIZE)
         ):
             yield TaskFailInfo(
                 task_id=task.task_id,
@@ -195,65 +351,14 @@ def get_task_failure_counts() -> Generator[TaskFailInfo, None, None]:
             )
 
 
-def get_xcom_params(task_id):
-    """XCom parameters for matching task_id's for the latest run of a DAG."""
-    if not check_if_can_query_tasks():
-        return []
-    with session_scope(Session) as session:
-        max_execution_dt_query = (
-            session.query(
-                DagRun.dag_id,
-                func.max(DagRun.execution_date).label("max_execution_dt"),
-            )
-            .group_by(DagRun.dag_id)
-            .subquery()
-        )
-
-        query = session.query(XCom.dag_id, XCom.task_id, XCom.value).join(
-            max_execution_dt_query,
-            and_(
-                (XCom.dag_id == max_execution_dt_query.c.dag_id),
-                (
-                    XCom.execution_date
-                    == max_execution_dt_query.c.max_execution_dt
-                ),
-            ),
-        )
-        if task_id == "all":
-            return query.all()
-        else:
-            return query.filter(XCom.task_id == task_id).all()
-
-
-def extract_xcom_parameter(value):
-    """Deserializes value stored in xcom table."""
-    enable_pickling = conf.getboolean("core", "enable_xcom_pickling")
-    if enable_pickling:
-        value = pickle.loads(value)
-        try:
-            value = json.loads(value)
-            return value
-        except Exception:
-            return {}
-    else:
-        try:
-            return json.loads(value.decode("UTF-8"))
-        except ValueError:
-            log = LoggingMixin().log
-            log.error(
-                "Could not deserialize the XCOM value from JSON. "
-                "If you are using pickles instead of JSON "
-                "for XCOM, then you need to enable pickle "
-                "support for XCOM in your airflow config."
-            )
-            return {}
-
-
-def get_task_duration_info() -> Generator[TaskDurationInfo, None, None]:
+@instrumentation.stat_function
+def get_task_duration_info(
+    context: Optional[ScrapeContext] = None,
+) -> Generator[TaskDurationInfo, None, None]:
     """Duration of successful tasks in seconds."""
-    if not check_if_can_query_tasks():
+    if not check_if_can_query_tasks(context):
         return
-    with session_scope(Session) as session:
+    with scrape_session(context) as session:
         max_execution_dt_query = (
             session.query(
                 DagRun.dag_id,
@@ -278,7 +383,7 @@ def get_task_duration_info() -> Generator[TaskDurationInfo, None, None]:
                 TaskInstance.end_date,
                 DagRun.execution_date
             )
-            .join(DagRun, DagRun.dag_id == TaskInstance.dag_id)
+            .join(DagRun, task_instance_dag_run_join())
             .join(
                 max_execution_dt_query,
                 and_(
@@ -294,7 +399,7 @@ def get_task_duration_info() -> Generator[TaskDurationInfo, None, None]:
                 TaskInstance.start_date.isnot(None),
                 TaskInstance.end_date.isnot(None),
             )
-            .all()
+            .yield_per(settings.STREAM_BATCH_SIZE)
         ):
             yield TaskDurationInfo(
                 task_id=task.task_id,
@@ -0,0 +1,172 @@
+"""Historical timeseries aggregated per time bucket by the database."""
+from datetime import datetime
+from typing import Collection, List, NamedTuple, Optional
+
+from airflow.models import DagRun, TaskInstance
+from airflow.utils.state import State
+from sqlalchemy import Float, Integer, cast, extract, func, literal_column
+
+from airflow_prometheus.instrumentation import instrumentation
+from .capabilities import capabilities
+from .context import ScrapeContext, scrape_session
+from .tasks import check_if_can_query_tasks
+
+
+class BucketValue(NamedTuple):
+    # End of the bucket in seconds since the epoch.
+    bucket: int
+    # Series of the value within the bucket (state, queue), None for single series.
+    key: Optional[str]
+    value: float
+
+
+def bucket_expression(column, interval_seconds: int, dialect: str):
+    """End of the bucket of a timestamp column, in seconds since the epoch.
+
+    Buckets are closed and labelled on the right, like the (start, end] range
+    filters and the resampling of other timeseries: with a range aligned to
+    the interval they exactly cover it.
+    """
+    # Inlined, so that the SELECT and GROUP BY expressions are identical on Postgres.
+    interval = literal_column(str(int(interval_seconds)), Integer)
+    if dialect == "postgresql":
+        return func.ceil(extract("epoch", column) / interval) * interval
+    if dialect == "mysql":
+        # Airflow sets the session time zone of MySQL to UTC.
+        return func.ceil(func.unix_timestamp(column) / interval) * interval
+    # Whole seconds rounded up by the fraction of the second (%f is "SS.SSS"), then
+    # integer division, SQLite lacks CEIL.
+    seconds = cast(func.strftime("%s", column), Integer) + (
+        cast(func.strftime("%f", column), Float) > cast(func.strftime("%S", column), Integer)
+    )
+    return (seconds + interval - 1) / interval * interval
+
+
+def duration_expression(start, end, dialect: str):
+    """Seconds between two timestamp columns."""
+    if dialect == "postgresql":
+        return extract("epoch", end - start)
+    if dialect == "mysql":
+        return func.timestampdiff(literal_column("MICROSECOND"), start, end) / 1000000.0
+    return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+
+def _bucket_values(query, bucket, key=None) -> List[BucketValue]:
+    group_by = [bucket] if key is None else [bucket, key]
+    return [
+        BucketValue(
+            bucket=int(row.bucket),
+            key=None if key is None else row.key,
+            value=float(row.value),
+        )
+        for row in query.group_by(*group_by).order_by(bucket)
+        if row.bucket is not None and row.value is not None
+    ]
+
+
+@instrumentation.stat_function
+def get_task_duration_buckets(
+    start: datetime,
+    end: datetime,
+    interval_seconds: int,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[BucketValue]:
+    """Average duration of the task instances that finished within every bucket."""
+    if not check_if_can_query_tasks(context):
+        return []
+    with scrape_session(context) as session:
+        bucket = bucket_expression(TaskInstance.end_date, interval_seconds, session.bind.dialect.name)
+        query = session.query(
+            bucket.label("bucket"), func.avg(TaskInstance.duration).label("value"),
+        ).filter(
+            TaskInstance.state.in_((State.SUCCESS, State.FAILED)),
+            TaskInstance.end_date > start,
+            TaskInstance.end_date <= end,
+            TaskInstance.duration.isnot(None),
+        )
+        if dag_ids is not None:
+            query = query.filter(TaskInstance.dag_id.in_(dag_ids))
+        return _bucket_values(query, bucket)
+
+
+@instrumentation.stat_function
+def get_dag_run_duration_buckets(
+    start: datetime,
+    end: datetime,
+    interval_seconds: int,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[BucketValue]:
+    """Average duration of the successful DAG runs that ended within every bucket."""
+    if not capabilities.supports(DagRun, context=context):
+        return []
+    with scrape_session(context) as session:
+        dialect = session.bind.dialect.name
+        bucket = bucket_expression(DagRun.end_date, interval_seconds, dialect)
+        query = session.query(
+            bucket.label("bucket"),
+            func.avg(duration_expression(DagRun.start_date, DagRun.end_date, dialect)).label("value"),
+        ).filter(
+            DagRun.state == State.SUCCESS,
+            DagRun.end_date > start,
+            DagRun.end_date <= end,
+            DagRun.start_date.isnot(None),
+        )
+        if dag_ids is not None:
+            query = query.filter(DagRun.dag_id.in_(dag_ids))
+        return _bucket_values(query, bucket)
+
+
+@instrumentation.stat_function
+def get_dag_run_count_buckets(
+    start: datetime,
+    end: datetime,
+    interval_seconds: int,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[BucketValue]:
+    """Number of DAG runs per state, by the bucket of their execution date."""
+    if not capabilities.supports(DagRun, context=context):
+        return []
+    with scrape_session(context) as session:
+        bucket = bucket_expression(DagRun.execution_date, interval_seconds, session.bind.dialect.name)
+        query = session.query(
+            bucket.label("bucket"), DagRun.state.label("key"), func.count().label("value"),
+        ).filter(
+            DagRun.execution_date > start,
+            DagRun.execution_date <= end,
+        )
+        if dag_ids is not None:
+            query = query.filter(DagRun.dag_id.in_(dag_ids))
+        return _bucket_values(query, bucket, DagRun.state)
+
+
+@instrumentation.stat_function
+def get_queue_wait_buckets(
+    start: datetime,
+    end: datetime,
+    interval_seconds: int,
+    dag_ids: Optional[Collection[str]] = None,
+    context: Optional[ScrapeContext] = None,
+) -> List[BucketValue]:
+    """Average time between queueing and starting the task instances per queue, by start date."""
+    if not check_if_can_query_tasks(context) or not capabilities.supports(
+        TaskInstance, "queue", "queued_dttm", context=context,
+    ):
+        return []
+    with scrape_session(context) as session:
+        dialect = session.bind.dialect.name
+        bucket = bucket_expression(TaskInstance.start_date, interval_seconds, dialect)
+        query = session.query(
+            bucket.label("bucket"),
+            TaskInstance.queue.label("key"),
+            func.avg(duration_expression(TaskInstance.queued_dttm, TaskInstance.start_date, dialect)).label("value"),
+        ).filter(
+            TaskInstance.start_date > start,
+            TaskInstance.start_date <= end,
+            TaskInstance.queued_dttm.isnot(None),
+        )
+        if dag_ids is not None:
+            query = query.filter(TaskInstance.dag_id.in_(dag_ids))
+        return _bucket_values(query, bucket, TaskInstance.queue)
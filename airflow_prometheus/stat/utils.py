@@ -1,7 +1,10 @@
 """Prometheus exporter for Airflow."""
 from contextlib import contextmanager
 from enum import Enum, unique
-from typing import Optional
+from typing import Dict, Optional
+
+from airflow.models import DagRun, TaskInstance
+from sqlalchemy import and_
 
 
 @unique
@@ -19,13 +22,40 @@ class ProcessingState(str, Enum):
     REMOVED = "removed"
 
 
+# Precomputed lookup from raw state values to ProcessingState members.
+_PROCESSING_STATES: Dict[Optional[str], ProcessingState] = {
+    **{state.value: state for state in ProcessingState},
+    None: ProcessingState.NO_STATUS,
+}
+
+
 def to_processing_state(raw_value: Optional[str]) -> ProcessingState:
-    if raw_value is None:
-        raw_value = ProcessingState.NO_STATUS
-    else:
-        raw_value = str(raw_value)
-    assert raw_value in ProcessingState.__members__.values()
-    return [getattr(ProcessingState, key) for (key, value) in ProcessingState.__members__.items() if value == raw_value][0]
+    state = _PROCESSING_STATES.get(raw_value)
+    if state is None:
+        state = _PROCESSING_STATES.get(str(raw_value))
+    if state is None:
+        raise ValueError(f"Unknown task state: {raw_value}")
+    return state
+
+
+def task_instance_run_key():
+    """Column of task instances identifying their DAG run: run_id since Airflow 2.2, execution_date before."""
+    if "run_id" in TaskInstance.__table__.columns:
+        return TaskInstance.run_id
+    return TaskInstance.__table__.columns["execution_date"]
+
+
+def task_instance_dag_run_join():
+    """Join condition of task instances with their DAG runs.
+
+    On Airflow 2.2 TaskInstance.execution_date is an association proxy
+    through the DAG run, which can only be compared, not selected or joined on.
+    """
+    run_key = task_instance_run_key()
+    return and_(
+        DagRun.dag_id == TaskInstance.dag_id,
+        getattr(DagRun, run_key.key) == run_key,
+    )
 
 
 @contextmanager
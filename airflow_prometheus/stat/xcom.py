@@ -0,0 +1,208 @@
+"""Prometheus exporter for Airflow."""
+import json
+import pickle
+import threading
+from datetime import datetime
+from enum import Enum
+from typing import Any, Collection, Dict, FrozenSet, Generator, Iterable, List, NamedTuple, Optional, Tuple
+
+from airflow.configuration import conf
+from airflow.models import DagRun, TaskInstance, XCom
+from airflow.utils.log.logging_mixin import LoggingMixin
+from sqlalchemy import and_, case, func
+
+from airflow_prometheus import settings
+from airflow_prometheus.instrumentation import instrumentation
+
+from .capabilities import capabilities
+from .context import ScrapeContext, scrape_session
+from .json_keys import extract_json_keys
+
+# (dag_id, task_id, key, execution_date, timestamp, requested keys) of a stored XCom.
+XComCacheKey = Tuple[str, str, str, datetime, Optional[datetime], FrozenSet[str]]
+
+
+class XComSkipReason(str, Enum):
+    OVERSIZED = "oversized"
+    UNDECODABLE = "undecodable"
+
+
+class XComParameterInfo(NamedTuple):
+    dag_id: str
+    task_id: str
+    value: Any
+
+
+def decode_xcom_keys(
+    value: Optional[bytes],
+    value_size: Optional[int],
+    keys: Collection[str],
+    enable_pickling: bool,
+) -> Tuple[Dict[str, Any], Optional[XComSkipReason]]:
+    """Requested top-level keys of an XCom value and the reason it was skipped, if any."""
+    if value_size is not None and value_size > settings.XCOM_MAX_VALUE_SIZE:
+        return dict(), XComSkipReason.OVERSIZED
+    if value is None:
+        return dict(), None
+    try:
+        if enable_pickling:
+            value = pickle.loads(value)  # noqa: S301
+            if isinstance(value, dict):
+                return {key: value[key] for key in keys if key in value}, None
+            if isinstance(value, str):
+                value = value.encode("UTF-8")
+            elif not isinstance(value, bytes):
+                return dict(), XComSkipReason.UNDECODABLE
+        if settings.XCOM_TARGETED_DECODING:
+            return extract_json_keys(value, keys), None
+        decoded = json.loads(value)
+        if not isinstance(decoded, dict):
+            return dict(), XComSkipReason.UNDECODABLE
+        return {key: decoded[key] for key in keys if key in decoded}, None
+    except Exception:
+        return dict(), XComSkipReason.UNDECODABLE
+
+
+class XComValueCache(object):
+    """Decoded XCom values of the latest scrape.
+
+    Entries not seen during a scrape are dropped at its end, so the cache
+    never outgrows the set of XComs of the latest DAG runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[XComCacheKey, Dict[str, Any]] = dict()
+        self.skipped: Dict[XComSkipReason, int] = {reason: 0 for reason in XComSkipReason}
+
+    def decode_all(
+        self, rows, keys_by_task: Dict[str, List[str]], enable_pickling: bool,
+    ) -> List[Tuple[Any, Dict[str, Any]]]:
+        with self._lock:
+            previous = self._values
+            current: Dict[XComCacheKey, Dict[str, Any]] = dict()
+            decoded = []
+            for row in rows:
+                keys = frozenset(keys_by_task.get(row.task_id, []) + keys_by_task.get("all", []))
+                cache_key = (
+                    row.dag_id, row.task_id, row.key, row.execution_date, row.timestamp, keys,
+                )
+                if cache_key in previous:
+                    values = previous[cache_key]
+                elif cache_key in current:
+                    values = current[cache_key]
+                else:
+                    values, skip_reason = decode_xcom_keys(
+                        row.value, row.value_size, keys, enable_pickling,
+                    )
+                    if skip_reason is not None:
+                        self.skipped[skip_reason] += 1
+                current[cache_key] = values
+                decoded.append((row, values))
+            self._values = current
+            return decoded
+
+
+xcom_value_cache = XComValueCache()
+
+
+def _latest_xcoms_query(session, task_ids: Iterable[str]):
+    max_execution_dt_query = (
+        session.query(
+            DagRun.dag_id,
+            func.max(DagRun.execution_date).label("max_execution_dt"),
+        )
+        .group_by(DagRun.dag_id)
+        .subquery()
+    )
+
+    value_size = func.length(XCom.value)
+    query = session.query(
+        XCom.dag_id,
+        XCom.task_id,
+        XCom.key,
+        XCom.execution_date,
+        XCom.timestamp,
+        value_size.label("value_size"),
+        # Oversized values are never transferred from the database.
+        case([(value_size <= settings.XCOM_MAX_VALUE_SIZE, XCom.value)]).label("value"),
+    ).join(
+        max_execution_dt_query,
+        and_(
+            (XCom.dag_id == max_execution_dt_query.c.dag_id),
+            (
+                XCom.execution_date
+                == max_execution_dt_query.c.max_execution_dt
+            ),
+        ),
+    )
+    task_ids = set(task_ids)
+    if "all" in task_ids:
+        return query
+    return query.filter(XCom.task_id.in_(task_ids))
+
+
+def _can_query_xcoms(context: Optional[ScrapeContext]) -> bool:
+    return capabilities.has_rows(TaskInstance, context) and capabilities.supports(
+        XCom, "execution_date", context=context,
+    )
+
+
+@instrumentation.stat_function
+def get_xcom_params(task_id, context: Optional[ScrapeContext] = None):
+    """XCom parameters for matching task_id's for the latest run of a DAG."""
+    if not _can_query_xcoms(context):
+        return []
+    with scrape_session(context) as session:
+        return _latest_xcoms_query(session, [task_id]).all()
+
+
+@instrumentation.stat_function
+def get_xcom_parameter_values(
+    xcom_params: List[Dict[str, str]], context: Optional[ScrapeContext] = None,
+) -> Generator[XComParameterInfo, None, None]:
+    """Values of all configured (task_id, key) XCom parameters in one query."""
+    if not xcom_params or not _can_query_xcoms(context):
+        return
+    keys_by_task: Dict[str, List[str]] = dict()
+    for param in xcom_params:
+        keys_by_task.setdefault(param["task_id"], []).append(param["key"])
+
+    enable_pickling = conf.getboolean("core", "enable_xcom_pickling")
+    with scrape_session(context) as session:
+        rows = _latest_xcoms_query(session, keys_by_task.keys()).all()
+    for row, values in xcom_value_cache.decode_all(rows, keys_by_task, enable_pickling):
+        for key in keys_by_task.get(row.task_id, []) + keys_by_task.get("all", []):
+            if key in values:
+                yield XComParameterInfo(
+                    dag_id=row.dag_id,
+                    task_id=row.task_id,
+                    value=values[key],
+                )
+
+
+def extract_xcom_parameter(value, enable_pickling: Optional[bool] = None):
+    """Deserializes value stored in xcom table."""
+    if value is None:
+        return {}
+    if enable_pickling is None:
+        enable_pickling = conf.getboolean("core", "enable_xcom_pickling")
+    if enable_pickling:
+        value = pickle.loads(value)
+        try:
+            value = json.loads(value)
+            return value
+        except Exception:
+            return {}
+    else:
+        try:
+            return json.loads(value.decode("UTF-8"))
+        except ValueError:
+            log = LoggingMixin().log
+            log.error(
+                "Could not deserialize the XCOM value from JSON. "
+                "If you are using pickles instead of JSON "
+                "for XCOM, then you need to enable pickle "
+                "support for XCOM in your airflow config."
+            )
+            return {}
@@ -1,15 +1,31 @@
+import os
+import threading
+
 import yaml
 from pathlib import Path
 
 CONFIG_FILE = Path.cwd() / "config.yaml"
 
+_lock = threading.Lock()
+_cached_mtime = None
+_cached_config = {}
+
 
 def load_xcom_config():
-    """Loads the XCom config if present."""
+    """Loads the XCom config if present, parsing the file again only when its mtime changed."""
+    global _cached_mtime, _cached_config
     try:
-        with open(CONFIG_FILE) as file:
-            # The FullLoader parameter handles the conversion from YAML
-            # scalar values to Python the dictionary format
-            return yaml.load(file, Loader=yaml.FullLoader)
+        mtime = os.path.getmtime(CONFIG_FILE)
     except FileNotFoundError:
         return {}
+    with _lock:
+        if mtime != _cached_mtime:
+            try:
+                with open(CONFIG_FILE) as file:
+                    # The FullLoader parameter handles the conversion from YAML
+                    # scalar values to Python the dictionary format
+                    _cached_config = yaml.load(file, Loader=yaml.FullLoader) or {}
+            except FileNotFoundError:
+                return {}
+            _cached_mtime = mtime
+        return _cached_config
@@ -0,0 +1,91 @@
+"""Import time of the plugin, as paid by every Airflow process loading it.
+
+Every sample imports the plugin module in a fresh interpreter, then runs the
+deferred initialization the first metrics or JSON request triggers:
+
+    python -m benchmarks.import_time small
+"""
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import typer
+
+from benchmarks.scrape import _ensure_database, configure_airflow
+from benchmarks.synthetic_db import SCENARIOS
+
+# Heavy modules the plugin must not import before the first request.
+DEFERRED_MODULES = ("pandas", "numpy", "airflow_prometheus.grafana_data.service")
+
+_SAMPLE = """
+import json, sys, time
+started_at = time.perf_counter()
+import airflow_prometheus.prometheus_exporter as exporter
+imported_at = time.perf_counter()
+loaded = [name for name in %(modules)r if name in sys.modules]
+exporter.ensure_initialized()
+print(json.dumps(dict(
+    import_seconds=imported_at - started_at,
+    first_request_seconds=time.perf_counter() - imported_at,
+    loaded_at_import=loaded,
+)))
+"""
+
+app = typer.Typer()
+
+
+def _sample() -> Dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _SAMPLE % dict(modules=DEFERRED_MODULES)],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _slowest_imports(limit: int) -> List[str]:
+    """The modules with the highest cumulative time in `python -X importtime`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import airflow_prometheus.prometheus_exporter"],
+        check=True, stderr=subprocess.PIPE, universal_newlines=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].rstrip()))
+    rows.sort(reverse=True)
+    return ["%10.1f ms %s" % (cumulative / 1000, name) for cumulative, name in rows[:limit]]
+
+
+@app.command()
+def run(
+    scenario_name: str = typer.Argument("small", help="One of: %s" % ", ".join(SCENARIOS)),
+    repeat: int = typer.Option(5, help="Fresh interpreters to sample (the median is reported)"),
+    top: int = typer.Option(15, help="Slowest imports to list"),
+):
+    """Measure the import of the plugin and the initialization deferred to the first request."""
+    directory = _ensure_database(SCENARIOS[scenario_name])
+    configure_airflow(directory)
+    # Warm the bytecode caches, the first interpreter would compile everything.
+    _sample()
+    samples = [_sample() for _ in range(repeat)]
+    typer.echo("import:        %8.4f s" % statistics.median(sample["import_seconds"] for sample in samples))
+    typer.echo("first request: %8.4f s" % statistics.median(
+        sample["first_request_seconds"] for sample in samples
+    ))
+    loaded = samples[-1]["loaded_at_import"]
+    typer.echo("deferred modules loaded at import: %s" % (", ".join(loaded) or "none"))
+    typer.echo("")
+    for line in _slowest_imports(top):
+        typer.echo(line)
+    if loaded:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,88 @@
+"""Query-count and query-plan budgets of the stat functions.
+
+Every stat function is called once against the synthetic database (or the
+database given with --database-url). All statements it issues are
+recorded, explained and checked against its budget:
+
+    python -m benchmarks.query_budgets small
+    python -m benchmarks.query_budgets --database-url postgresql://... --show-plans
+
+tests/test_query_budgets.py checks the same budgets with the recommended indexes.
+"""
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+from benchmarks.scrape import _ensure_database, configure_airflow
+from benchmarks.synthetic_db import SCENARIOS
+
+app = typer.Typer()
+
+
+def _budgets() -> Dict[str, object]:
+    # Imported lazily, Airflow must be configured first.
+    from airflow_prometheus.query_plan import QueryBudget
+
+    def budget(max_queries: int, *allowed_full_scans: str) -> QueryBudget:
+        return QueryBudget(max_queries=max_queries, allowed_full_scans=frozenset(allowed_full_scans))
+
+    # Global aggregations read their whole table by nature, everything else
+    # must be served from indexes. The small dag table may always be scanned.
+    return {
+        "get_active_dag_ids": budget(1, "dag"),
+        "get_dag_state_info": budget(1, "dag", "dag_run"),
+        "get_dag_duration_info": budget(1, "dag", "dag_run"),
+        "get_dag_scheduler_delay": budget(1, "dag_run"),
+        "get_task_state_info": budget(1, "dag", "task_instance"),
+        "get_task_state_rollup": budget(1, "dag", "task_instance"),
+        "get_task_failure_counts": budget(1, "dag", "task_fail"),
+        "get_task_duration_info": budget(1, "dag", "dag_run"),
+        "get_latest_tasks_state_info_by_dag": budget(1, "dag_run"),
+        "get_xcom_parameter_values": budget(1, "dag_run"),
+        "get_task_scheduler_delay": budget(1),
+        "get_num_queued_tasks": budget(1),
+        "DurationSketches.refresh": budget(2, "dag_run"),
+    }
+
+
+@app.command()
+def check(
+    scenario_name: str = typer.Argument("small", help="One of: %s" % ", ".join(SCENARIOS)),
+    database_url: Optional[str] = typer.Option(None, help="Check an existing metadata database instead"),
+    function: List[str] = typer.Option([], help="Only check these stat functions"),
+    show_plans: bool = typer.Option(False, help="Print every statement with its plan"),
+):
+    """Fail if a stat function exceeds its query-count or query-plan budget."""
+    if database_url is None:
+        directory = _ensure_database(SCENARIOS[scenario_name])
+        configure_airflow(directory)
+        database_url = "sqlite:///%s" % (Path(directory) / "airflow.db")
+    else:
+        configure_airflow(Path.cwd())
+        os.environ["AIRFLOW__CORE__SQL_ALCHEMY_CONN"] = database_url
+    from sqlalchemy import create_engine
+
+    from airflow_prometheus.query_plan import check_budget, explain_stat_functions
+
+    budgets = _budgets()
+    all_plans = explain_stat_functions(create_engine(database_url), function or list(budgets))
+    failed = False
+    for name, plans in all_plans.items():
+        violations = check_budget(plans, budgets[name])
+        typer.echo("%-4s %s (%d queries)" % ("FAIL" if violations else "ok", name, len(plans)))
+        for violation in violations:
+            typer.echo("     %s" % violation)
+        if show_plans:
+            for plan in plans:
+                typer.echo("     > %s" % " ".join(plan.statement.statement.split()))
+                for line in plan.plan:
+                    typer.echo("       %s" % line)
+        failed = failed or bool(violations)
+    if failed:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,228 @@
+"""Scrape latency and memory benchmarks against a synthetic metadata database.
+
+Usage (from the repository root):
+
+    python -m benchmarks.scrape small
+    python -m benchmarks.scrape medium --save
+    python -m benchmarks.scrape medium --compare
+"""
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+from benchmarks.synthetic_db import SCENARIOS, Scenario, generate
+
+BENCHMARKS_DIR = Path(__file__).parent
+BASELINES_DIR = BENCHMARKS_DIR / "baselines"
+WORK_DIR = BENCHMARKS_DIR / ".work"
+# Name of the case that runs all registered collectors at once.
+FULL_SCRAPE = "generate_latest"
+# Absolute allowances on top of the relative tolerance, so that timer and
+# allocator noise of millisecond cases (and other machines) is no regression.
+# Queries and payload are deterministic for a scenario and get none.
+SLACK = dict(wall_seconds=0.05, peak_rss_bytes=32 * 1024 * 1024, payload_bytes=0)
+
+app = typer.Typer()
+
+
+@dataclass
+class CaseResult:
+    case: str
+    wall_seconds: float
+    queries: int
+    peak_rss_bytes: int
+    payload_bytes: int
+
+
+def configure_airflow(directory: Path):
+    """Point Airflow at the synthetic database; must run before airflow is imported."""
+    os.environ["AIRFLOW_HOME"] = str(directory)
+    os.environ["AIRFLOW__CORE__SQL_ALCHEMY_CONN"] = "sqlite:///%s" % (directory / "airflow.db")
+    os.environ["AIRFLOW__CORE__DAGS_FOLDER"] = str(directory / "dags")
+    os.environ["AIRFLOW__CORE__LOAD_EXAMPLES"] = "False"
+    os.environ["AIRFLOW__CORE__UNIT_TEST_MODE"] = "False"
+
+
+def _ensure_database(scenario: Scenario) -> Path:
+    directory = WORK_DIR / scenario.name
+    marker = directory / "scenario.json"
+    if marker.exists() and json.loads(marker.read_text()) == asdict(scenario):
+        return directory
+    configure_airflow(directory)
+    started_at = time.perf_counter()
+    generate(scenario, directory)
+    typer.echo(
+        "Generated %s (%d task instances) in %.1fs"
+        % (scenario.name, scenario.task_instances, time.perf_counter() - started_at)
+    )
+    return directory
+
+
+def _collectors() -> Dict[str, object]:
+    from airflow_prometheus import metrics
+
+    return {
+        name: getattr(metrics, name)
+        for name in metrics.__all__
+        if name.endswith("Collector")
+    }
+
+
+def _run_case(directory: Path, case: str, repeat: int, queue: multiprocessing.Queue):
+    """Runs in a fresh process, so peak RSS only covers the measured case."""
+    configure_airflow(directory)
+    from prometheus_client import REGISTRY, CollectorRegistry, generate_latest
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    from airflow_prometheus.stat.context import configure_session_factory, scrape_context
+
+    engine = create_engine("sqlite:///%s" % (directory / "airflow.db"))
+    configure_session_factory(sessionmaker(bind=engine))
+    queries = [0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*args):
+        queries[0] += 1
+
+    if case == FULL_SCRAPE:
+        from airflow_prometheus.prometheus_exporter import ensure_initialized
+
+        ensure_initialized()
+        registry = REGISTRY
+    else:
+        registry = CollectorRegistry(auto_describe=True)
+        registry.register(_collectors()[case]())
+
+    def scrape() -> bytes:
+        with scrape_context():
+            return generate_latest(registry)
+
+    # The first scrape warms the dag bag, capability and XCom caches.
+    scrape()
+    timings = []
+    for _ in range(repeat):
+        queries[0] = 0
+        started_at = time.perf_counter()
+        payload = scrape()
+        timings.append(time.perf_counter() - started_at)
+
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024
+    queue.put(asdict(CaseResult(
+        case=case,
+        wall_seconds=statistics.median(timings),
+        queries=queries[0],
+        peak_rss_bytes=peak_rss,
+        payload_bytes=len(payload),
+    )))
+
+
+def run_cases(directory: Path, cases: List[str], repeat: int) -> List[CaseResult]:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        queue = context.Queue()
+        process = context.Process(target=_run_case, args=(directory, case, repeat, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError("Benchmark case %s failed with exit code %s" % (case, process.exitcode))
+        results.append(CaseResult(**queue.get()))
+    return results
+
+
+def _baseline_path(scenario: Scenario) -> Path:
+    return BASELINES_DIR / ("%s.json" % scenario.name)
+
+
+def compare(
+    baseline: Dict[str, Dict], results: List[CaseResult], tolerance: float,
+) -> List[str]:
+    """Regressions of results against a baseline, as human readable lines."""
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.case)
+        if expected is None:
+            continue
+        if result.queries > expected["queries"]:
+            regressions.append(
+                "%s: %d queries (baseline %d)" % (result.case, result.queries, expected["queries"])
+            )
+        for metric in ("wall_seconds", "peak_rss_bytes", "payload_bytes"):
+            value, limit = getattr(result, metric), expected[metric] * (1 + tolerance) + SLACK[metric]
+            if value > limit:
+                regressions.append(
+                    "%s: %s %s (baseline %s)" % (result.case, metric, value, expected[metric])
+                )
+    return regressions
+
+
+@app.command()
+def run(
+    scenario_name: str = typer.Argument("small", help="One of: %s" % ", ".join(SCENARIOS)),
+    dags: Optional[int] = typer.Option(None, help="Override the number of DAGs"),
+    tasks_per_dag: Optional[int] = typer.Option(None, help="Override the number of tasks per DAG"),
+    runs_per_dag: Optional[int] = typer.Option(None, help="Override the number of runs per DAG"),
+    case: List[str] = typer.Option([], help="Only run these collectors (or generate_latest)"),
+    repeat: int = typer.Option(5, help="Measured scrapes per case (the median is reported)"),
+    save: bool = typer.Option(False, help="Store the results as the baseline of the scenario"),
+    check: bool = typer.Option(False, "--compare", help="Fail on regressions against the baseline"),
+    tolerance: float = typer.Option(0.2, help="Allowed relative increase of time, memory and payload"),
+):
+    """Benchmark every collector and the full scrape against a synthetic database."""
+    scenario = SCENARIOS[scenario_name]
+    overrides = dict(dags=dags, tasks_per_dag=tasks_per_dag, runs_per_dag=runs_per_dag)
+    overrides = {name: value for name, value in overrides.items() if value is not None}
+    if overrides:
+        scenario = replace(scenario, name="%s-custom" % scenario.name, **overrides)
+
+    directory = _ensure_database(scenario)
+    if not case:
+        # Collector names are only known once Airflow points at the synthetic database.
+        configure_airflow(directory)
+        case = sorted(_collectors()) + [FULL_SCRAPE]
+    results = run_cases(directory, case, repeat)
+
+    typer.echo("%-32s %12s %8s %14s %14s" % ("case", "wall [s]", "queries", "peak RSS [B]", "payload [B]"))
+    for result in results:
+        typer.echo("%-32s %12.4f %8d %14d %14d" % (
+            result.case, result.wall_seconds, result.queries, result.peak_rss_bytes, result.payload_bytes,
+        ))
+
+    baseline_path = _baseline_path(scenario)
+    if check:
+        if not baseline_path.exists():
+            typer.echo("No baseline at %s" % baseline_path, err=True)
+            raise typer.Exit(code=2)
+        regressions = compare(json.loads(baseline_path.read_text())["results"], results, tolerance)
+        for regression in regressions:
+            typer.echo("REGRESSION %s" % regression, err=True)
+        if regressions:
+            raise typer.Exit(code=1)
+    if save:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps(
+            dict(
+                scenario=asdict(scenario),
+                results={result.case: asdict(result) for result in results},
+            ),
+            indent=2,
+            sort_keys=True,
+        ))
+        typer.echo("Saved baseline to %s" % baseline_path)
+
+
+if __name__ == "__main__":
+    app()
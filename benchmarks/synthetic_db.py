@@ -0,0 +1,213 @@
+"""Synthetic Airflow metadata database for the benchmarks."""
+import json
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+# Rows inserted per executemany round trip.
+INSERT_BATCH_SIZE = 10000
+
+TASK_STATES = ["success"] * 90 + ["failed"] * 5 + ["skipped"] * 2 + ["upstream_failed", "running", "queued"]
+OPERATORS = ["PythonOperator", "BashOperator", "DummyOperator", "KubernetesPodOperator"]
+OWNERS = ["airflow", "data", "ml", "platform"]
+
+DAG_FILE = '''"""Synthetic DAGs matching the rows of the benchmark database."""
+from datetime import datetime
+
+from airflow import DAG
+from airflow.operators.dummy import DummyOperator
+
+for dag_index in range({dags}):
+    dag = DAG(
+        "synthetic_dag_%05d" % dag_index,
+        start_date=datetime(2021, 1, 1),
+        schedule_interval="@daily",
+    )
+    with dag:
+        previous = None
+        for task_index in range({tasks_per_dag}):
+            task = DummyOperator(task_id="task_%04d" % task_index)
+            if previous is not None:
+                previous >> task
+            previous = task
+    globals()[dag.dag_id] = dag
+'''
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    dags: int
+    tasks_per_dag: int
+    runs_per_dag: int
+    xcoms_per_run: int = 2
+    fails_per_run: float = 0.05
+    seed: int = 42
+
+    @property
+    def task_instances(self) -> int:
+        return self.dags * self.tasks_per_dag * self.runs_per_dag
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario
+    for scenario in [
+        Scenario("small", dags=10, tasks_per_dag=10, runs_per_dag=10),
+        Scenario("medium", dags=1000, tasks_per_dag=20, runs_per_dag=25),
+        Scenario("large", dags=10000, tasks_per_dag=20, runs_per_dag=10),
+    ]
+}
+
+
+def _batches(rows: Iterator[Dict], size: int = INSERT_BATCH_SIZE) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_id(execution_date: datetime) -> str:
+    return "scheduled__%s" % execution_date.isoformat()
+
+
+def _insert(engine, table, rows: Iterator[Dict]):
+    for batch in _batches(rows):
+        engine.execute(table.insert(), batch)
+
+
+def generate(scenario: Scenario, directory: Path) -> Path:
+    """Create the database and DAG folder of a scenario and return the database path.
+
+    Airflow must be configured to use the returned database before its
+    models are imported, see benchmarks.scrape.configure_airflow.
+    """
+    from airflow.models import DagModel, DagRun, TaskFail, TaskInstance, XCom
+    from airflow.models.base import Base
+    from sqlalchemy import create_engine
+
+    directory.mkdir(parents=True, exist_ok=True)
+    database = directory / "airflow.db"
+    dag_folder = directory / "dags"
+    dag_folder.mkdir(exist_ok=True)
+    (dag_folder / "synthetic_dags.py").write_text(
+        DAG_FILE.format(dags=scenario.dags, tasks_per_dag=scenario.tasks_per_dag)
+    )
+    if database.exists():
+        database.unlink()
+
+    engine = create_engine("sqlite:///%s" % database)
+    Base.metadata.create_all(engine)
+    rng = random.Random(scenario.seed)
+    first_run = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    dag_ids = ["synthetic_dag_%05d" % index for index in range(scenario.dags)]
+    task_ids = ["task_%04d" % index for index in range(scenario.tasks_per_dag)]
+
+    _insert(engine, DagModel.__table__, (
+        dict(
+            dag_id=dag_id,
+            is_paused=False,
+            is_active=True,
+            owners=rng.choice(OWNERS),
+            fileloc=str(dag_folder / "synthetic_dags.py"),
+            max_active_tasks=16,
+            has_task_concurrency_limits=False,
+        )
+        for dag_id in dag_ids
+    ))
+
+    def dag_runs():
+        for dag_id in dag_ids:
+            for run in range(scenario.runs_per_dag):
+                execution_date = first_run + timedelta(days=run)
+                yield dict(
+                    dag_id=dag_id,
+                    execution_date=execution_date,
+                    start_date=execution_date + timedelta(seconds=rng.randint(0, 600)),
+                    end_date=execution_date + timedelta(seconds=rng.randint(600, 7200)),
+                    state=rng.choice(["success"] * 9 + ["failed"]),
+                    run_id=_run_id(execution_date),
+                    run_type="scheduled",
+                    external_trigger=False,
+                )
+
+    _insert(engine, DagRun.__table__, dag_runs())
+    # Airflow 2.2 keys task instances by run_id, 2.1 by execution_date.
+    keyed_by_run_id = "run_id" in TaskInstance.__table__.columns
+
+    def task_instances():
+        for dag_id in dag_ids:
+            for run in range(scenario.runs_per_dag):
+                execution_date = first_run + timedelta(days=run)
+                for task_id in task_ids:
+                    start_date = execution_date + timedelta(seconds=rng.randint(0, 3600))
+                    duration = rng.lognormvariate(4, 1.5)
+                    run_key = (
+                        dict(run_id=_run_id(execution_date)) if keyed_by_run_id
+                        else dict(execution_date=execution_date)
+                    )
+                    yield dict(
+                        dag_id=dag_id,
+                        task_id=task_id,
+                        start_date=start_date,
+                        end_date=start_date + timedelta(seconds=duration),
+                        duration=duration,
+                        state=rng.choice(TASK_STATES),
+                        try_number=1,
+                        max_tries=rng.randint(0, 3),
+                        pool="default_pool",
+                        pool_slots=1,
+                        queue="default",
+                        priority_weight=1,
+                        operator=rng.choice(OPERATORS),
+                        queued_dttm=start_date - timedelta(seconds=rng.randint(1, 60)),
+                        **run_key,
+                    )
+
+    _insert(engine, TaskInstance.__table__, task_instances())
+
+    def xcoms():
+        for dag_id in dag_ids:
+            for run in range(scenario.runs_per_dag):
+                execution_date = first_run + timedelta(days=run)
+                for task_id in rng.sample(task_ids, min(scenario.xcoms_per_run, len(task_ids))):
+                    yield dict(
+                        dag_id=dag_id,
+                        task_id=task_id,
+                        key="return_value",
+                        execution_date=execution_date,
+                        timestamp=execution_date,
+                        value=json.dumps(
+                            dict(rows=rng.randint(0, 10 ** 6), payload="x" * rng.randint(0, 1024))
+                        ).encode("UTF-8"),
+                    )
+
+    _insert(engine, XCom.__table__, xcoms())
+
+    def task_fails():
+        for dag_id in dag_ids:
+            for run in range(scenario.runs_per_dag):
+                execution_date = first_run + timedelta(days=run)
+                for task_id in task_ids:
+                    if rng.random() >= scenario.fails_per_run:
+                        continue
+                    start_date = execution_date + timedelta(seconds=rng.randint(0, 3600))
+                    duration = rng.randint(1, 600)
+                    yield dict(
+                        dag_id=dag_id,
+                        task_id=task_id,
+                        execution_date=execution_date,
+                        start_date=start_date,
+                        end_date=start_date + timedelta(seconds=duration),
+                        duration=duration,
+                    )
+
+    _insert(engine, TaskFail.__table__, task_fails())
+    (directory / "scenario.json").write_text(json.dumps(asdict(scenario), indent=2))
+    engine.dispose()
+    return database
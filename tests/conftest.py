@@ -0,0 +1,9 @@
+"""Airflow is pointed at a throwaway home before any test module imports it."""
+import os
+import tempfile
+
+_AIRFLOW_HOME = tempfile.mkdtemp(prefix="airflow_prometheus_tests_")
+os.environ["AIRFLOW_HOME"] = _AIRFLOW_HOME
+os.environ["AIRFLOW__CORE__SQL_ALCHEMY_CONN"] = "sqlite:///%s" % os.path.join(_AIRFLOW_HOME, "airflow.db")
+os.environ["AIRFLOW__CORE__LOAD_EXAMPLES"] = "False"
+os.environ["AIRFLOW__CORE__UNIT_TEST_MODE"] = "False"
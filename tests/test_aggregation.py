@@ -0,0 +1,95 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from airflow.models import TaskInstance
+from airflow.models.base import Base
+from airflow.utils import timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from airflow_prometheus.stat import aggregation
+from airflow_prometheus.stat.aggregation import TaskStateAggregator, aggregate_task_states
+
+NOW = timezone.datetime(2021, 6, 1)
+RESCAN_WINDOW = timedelta(hours=1)
+
+
+@pytest.fixture()
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[TaskInstance.__table__])
+    session = Session(bind=engine)
+    yield session
+    session.close()
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=NOW)
+    monkeypatch.setattr(aggregation, "timezone", SimpleNamespace(utcnow=lambda: clock.now))
+    return clock
+
+
+def add_task(session, task_id, state, ended_ago=None, duration=None, run=0):
+    if "run_id" in TaskInstance.__table__.columns:
+        run_key = dict(run_id="run_%d" % run)
+    else:
+        run_key = dict(execution_date=NOW - timedelta(days=run))
+    session.execute(TaskInstance.__table__.insert().values(
+        dag_id="dag", task_id=task_id, operator="DummyOperator", state=state,
+        end_date=None if ended_ago is None else NOW - ended_ago, duration=duration,
+        max_tries=1, try_number=1, pool="default_pool", **run_key,
+    ))
+
+
+@pytest.fixture()
+def tasks(session):
+    add_task(session, "old", "success", timedelta(days=1), 10.0, run=0)
+    add_task(session, "old", "failed", timedelta(days=1), 30.0, run=1)
+    add_task(session, "recent", "success", timedelta(minutes=30), 20.0, run=0)
+    add_task(session, "running", "running", run=0)
+    add_task(session, "queued", None, run=0)
+    return session
+
+
+def test_first_aggregate_matches_a_full_group_by(tasks, clock):
+    aggregator = TaskStateAggregator(RESCAN_WINDOW, reconcile_interval=float("inf"))
+
+    assert aggregator.aggregate(tasks) == aggregate_task_states(tasks)
+
+
+def test_rows_settling_past_the_watermark_are_folded_once(tasks, clock):
+    aggregator = TaskStateAggregator(RESCAN_WINDOW, reconcile_interval=float("inf"))
+    aggregator.aggregate(tasks)
+
+    clock.now = NOW + timedelta(hours=1)
+    add_task(tasks, "recent", "success", timedelta(minutes=10), 40.0, run=1)
+
+    assert aggregator.aggregate(tasks) == aggregate_task_states(tasks)
+    clock.now += timedelta(minutes=30)
+    assert aggregator.aggregate(tasks) == aggregate_task_states(tasks)
+    recent = aggregator.aggregate(tasks)[("dag", "recent", "DummyOperator", "success")]
+    assert (recent.count, recent.duration_sum, recent.min_duration, recent.max_duration) == (2, 60.0, 20.0, 40.0)
+
+
+def test_settled_rows_are_kept_until_reconciled(tasks, clock):
+    aggregator = TaskStateAggregator(RESCAN_WINDOW, reconcile_interval=float("inf"))
+    aggregator.aggregate(tasks)
+    # Cleared after it was folded in.
+    tasks.execute(TaskInstance.__table__.delete().where(TaskInstance.task_id == "old"))
+
+    assert ("dag", "old", "DummyOperator", "success") in aggregator.aggregate(tasks)
+
+    aggregator.reconcile_interval = 0
+    assert aggregator.aggregate(tasks) == aggregate_task_states(tasks)
+
+
+def test_reset_rebuilds_from_scratch(tasks, clock):
+    aggregator = TaskStateAggregator(RESCAN_WINDOW, reconcile_interval=float("inf"))
+    aggregator.aggregate(tasks)
+    tasks.execute(TaskInstance.__table__.delete().where(TaskInstance.task_id == "old"))
+
+    aggregator.reset()
+
+    assert aggregator.aggregate(tasks) == aggregate_task_states(tasks)
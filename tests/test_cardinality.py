@@ -0,0 +1,85 @@
+import pytest
+
+from airflow_prometheus.cardinality import OTHER, CardinalityPolicy, DroppedSeries, dropped_series_of, top_k
+from airflow_prometheus.metrics.tasks import _fold_other, _limited_task_info
+from airflow_prometheus.stat.context import ScrapeContext
+from airflow_prometheus.stat.tasks import TaskStateInfo
+
+
+def task(task_id, state="success", count=1, avg=1.0, min_duration=1.0, max_duration=1.0, max_tries=1, dag_id="dag"):
+    return TaskStateInfo(
+        task_id=task_id, dag_id=dag_id, operator_name="DummyOperator", owner="airflow", state=state,
+        count=count, avg_duration=avg, min_duration=min_duration, max_duration=max_duration, max_tries=max_tries,
+    )
+
+
+def test_top_k_keeps_the_largest_rows_in_order_and_folds_the_rest():
+    folded = []
+
+    def fold(rest):
+        folded.extend(rest)
+        return [sum(rest)]
+
+    assert top_k([5, 1, 9, 3, 7], 3, key=lambda row: row, fold=fold) == [5, 9, 7, 4]
+    assert folded == [1, 3]
+
+
+def test_top_k_returns_small_inputs_unchanged():
+    def fold(rest):
+        raise AssertionError("nothing to fold")
+
+    assert top_k([2, 1], 2, key=lambda row: row, fold=fold) == [2, 1]
+
+
+def test_fold_other_aggregates_per_partition():
+    rest = [
+        task("a", "success", count=1, avg=10.0, min_duration=10.0, max_duration=10.0, max_tries=1),
+        task("b", "success", count=3, avg=20.0, min_duration=5.0, max_duration=30.0, max_tries=None),
+        task("c", "failed", count=2, avg=4.0, min_duration=4.0, max_duration=4.0, max_tries=3),
+    ]
+
+    folded = {row.state: row for row in _fold_other(rest, partition=("dag_id", "state"), drop_labels=())}
+
+    success = folded["success"]
+    assert (success.task_id, success.operator_name, success.owner, success.dag_id) == (OTHER, OTHER, OTHER, "dag")
+    assert (success.count, success.avg_duration) == (4, pytest.approx(17.5))
+    assert (success.min_duration, success.max_duration, success.max_tries) == (5.0, 30.0, 1)
+    assert folded["failed"] == task(OTHER, "failed", count=2, avg=4.0, min_duration=4.0, max_duration=4.0,
+                                    max_tries=3)._replace(operator_name=OTHER, owner=OTHER)
+
+
+def test_fold_other_keeps_dropped_labels():
+    folded, = _fold_other([task("a"), task("b")], partition=("state",), drop_labels=("owner",))
+
+    assert (folded.task_id, folded.dag_id, folded.owner) == (OTHER, OTHER, "airflow")
+
+
+def test_limited_task_info_applies_top_k_and_records_the_drops():
+    policy = CardinalityPolicy(dict(families=dict(family=dict(top_k=2, top_k_by="duration"))))
+    tasks = [task("a", max_duration=3.0), task("b", max_duration=1.0), task("c", max_duration=2.0),
+             task("d", max_duration=0.5)]
+    context = ScrapeContext(session=None)
+
+    limited = _limited_task_info(
+        "family", ("dag_id", "task_id", "state"), ("dag_id", "state"), policy, None, lambda: tasks, context,
+    )
+
+    assert [row.task_id for row in limited] == ["a", "c", OTHER]
+    assert limited[-1].count == 2
+    assert dropped_series_of(context).items() == [("family", "top_k", 1)]
+
+
+def test_policy_rejects_unknown_top_k_orders():
+    with pytest.raises(ValueError):
+        CardinalityPolicy(dict(families=dict(family=dict(top_k_by="owner"))))
+
+
+def test_dropped_series_are_counted_per_scrape():
+    first, second = ScrapeContext(session=None), ScrapeContext(session=None)
+
+    assert list(dropped_series_of(first).limit("family", range(5), max_series=3)) == [0, 1, 2]
+    assert list(dropped_series_of(second).limit("family", range(5), max_series=None)) == [0, 1, 2, 3, 4]
+
+    assert dropped_series_of(first).items() == [("family", "budget", 2)]
+    assert dropped_series_of(second).items() == [("family", "budget", 0)]
+    assert isinstance(dropped_series_of(first), DroppedSeries)
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from airflow_prometheus.grafana_data.filters import FilterSet
+from airflow_prometheus.grafana_data.serialization import Table
+
+DAG_IDS = ["etl_daily", "etl_hourly", "ml_train", "report"]
+
+
+def filters(*ad_hoc_filters):
+    return FilterSet.from_grafana([dict(key=key, operator=operator, value=value) for key, operator, value in ad_hoc_filters])
+
+
+@pytest.mark.parametrize("operator, value, expected", [
+    ("=", "report", ["report"]),
+    ("!=", "report", ["etl_daily", "etl_hourly", "ml_train"]),
+    ("=~", "etl_.*", ["etl_daily", "etl_hourly"]),
+    # Anchored like Prometheus matchers.
+    ("=~", "etl", []),
+    ("!~", "etl_.*|report", ["ml_train"]),
+])
+def test_operators(operator, value, expected):
+    ad_hoc_filters = filters(("dag_id", operator, value))
+
+    assert [dag_id for dag_id in DAG_IDS if ad_hoc_filters.allows("dag_id", dag_id)] == expected
+    mask = ad_hoc_filters.filters[0].mask(np.array(DAG_IDS, dtype=object))
+    assert list(np.array(DAG_IDS)[mask]) == expected
+
+
+@pytest.mark.parametrize("operator, expected", [
+    ("=|", ["ml_train", "report"]),
+    ("!=|", ["etl_daily", "etl_hourly"]),
+])
+def test_multi_value_operators(operator, expected):
+    ad_hoc_filters = FilterSet.from_grafana([dict(key="dag_id", operator=operator, values=["report", "ml_train"])])
+
+    assert [dag_id for dag_id in DAG_IDS if ad_hoc_filters.allows("dag_id", dag_id)] == expected
+
+
+def test_values_are_compared_as_strings():
+    ad_hoc_filters = filters(("try_number", "=", "2"))
+
+    assert ad_hoc_filters.allows("try_number", 2)
+    assert not ad_hoc_filters.allows("try_number", 3)
+
+
+def test_filters_on_other_keys_allow_everything():
+    assert filters(("state", "=", "failed")).allows("dag_id", "report")
+
+
+@pytest.mark.parametrize("ad_hoc_filter", [
+    dict(key="dag_id", operator=">", value="a"),
+    dict(key="dag_id", operator="=~", value="("),
+])
+def test_unsupported_filters_raise_value_error(ad_hoc_filter):
+    with pytest.raises(ValueError):
+        FilterSet.from_grafana([ad_hoc_filter])
+
+
+def test_apply_requires_every_filter_and_ignores_missing_columns():
+    table = Table(dict(dag_id=DAG_IDS, state=["success", "failed", "failed", "failed"]))
+    ad_hoc_filters = filters(("dag_id", "=~", "etl_.*|report"), ("state", "=", "failed"), ("owner", "=", "ml"))
+
+    filtered = ad_hoc_filters.apply(table)
+
+    assert filtered.rows() == [("etl_hourly", "failed"), ("report", "failed")]
+
+
+def test_only_and_without_split_by_key():
+    ad_hoc_filters = filters(("dag_id", "=", "report"), ("state", "=", "failed"))
+
+    assert ad_hoc_filters.only(["dag_id"]).cache_key() == (("dag_id", "=", ("report",)),)
+    assert ad_hoc_filters.without(["dag_id"]).cache_key() == (("state", "=", ("failed",)),)
+    assert not ad_hoc_filters.only(["owner"])
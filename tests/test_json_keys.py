@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from airflow_prometheus.stat.json_keys import extract_json_keys
+
+DOCUMENTS = [
+    b'{}',
+    b' { "a" : 1 , "b" : "two" } ',
+    b'{"a": {"nested": [1, {"a": "}"}]}, "b": null, "c": true}',
+    b'{"skipped": "quote \\" and { brace [", "a": [1.5e3, -2, "x"]}',
+    b'{"skipped": [[[]], {"}": "]"}], "b": {"k": "v"}}',
+    b'{"a":1,"a":2}',
+    b'{"\\u0061": "escaped key", "b": false}',
+    '{"a": "été", "b": "☃"}'.encode("utf-8"),
+]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+def test_values_match_a_full_decode(document):
+    decoded = json.loads(document)
+
+    assert extract_json_keys(document, ["a", "b"]) == {key: decoded[key] for key in ("a", "b") if key in decoded}
+
+
+def test_missing_keys_are_left_out():
+    assert extract_json_keys(b'{"a": 1}', ["b"]) == dict()
+
+
+@pytest.mark.parametrize("document", [
+    b'[1, 2]',
+    b'"a"',
+    b'{"a": 1',
+    b'{"a": "unterminated}',
+    b'{"a": [1, 2}',
+    b'{"a" 1}',
+    b'{"a": 1 "b": 2}',
+    b'{"a": }',
+])
+def test_invalid_objects_raise_value_error(document):
+    with pytest.raises(ValueError):
+        extract_json_keys(document, ["a", "b"])
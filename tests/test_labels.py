@@ -0,0 +1,24 @@
+from airflow_prometheus.metrics.labels import LabelSets, label_table_of
+from airflow_prometheus.stat.context import ScrapeContext
+
+MAX_TRIES_LABELS = LabelSets(["operator_name", "task_id", "dag_id"])
+DURATION_LABELS = LabelSets(["aggregation", "operator_name", "task_id", "dag_id"])
+
+
+def test_label_sets_are_shared_within_a_scrape():
+    context = ScrapeContext(session=None)
+    table = label_table_of(context)
+
+    labels = MAX_TRIES_LABELS.get(("BashOperator", "task", "dag"), table)
+
+    assert labels == dict(operator_name="BashOperator", task_id="task", dag_id="dag")
+    assert MAX_TRIES_LABELS.get(("BashOperator", "task", "dag"), label_table_of(context)) is labels
+    assert DURATION_LABELS.get(("avg", "BashOperator", "task", "dag"), table)["task_id"] is labels["task_id"]
+
+
+def test_label_sets_are_not_kept_across_scrapes():
+    first = MAX_TRIES_LABELS.get(("BashOperator", "task", "dag"), label_table_of(ScrapeContext(session=None)))
+    second = MAX_TRIES_LABELS.get(("BashOperator", "task", "dag"), label_table_of(ScrapeContext(session=None)))
+
+    assert first == second and first is not second
+    assert MAX_TRIES_LABELS.get(("BashOperator", "task", "dag")) is not first
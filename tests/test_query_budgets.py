@@ -0,0 +1,33 @@
+import os
+import shutil
+
+import pytest
+from sqlalchemy import create_engine
+
+from airflow_prometheus import index_advisor
+from airflow_prometheus.query_plan import check_budget, explain_stat_functions
+from benchmarks.query_budgets import _budgets
+from benchmarks.scrape import _ensure_database
+from benchmarks.synthetic_db import SCENARIOS
+
+BUDGETS = _budgets()
+
+
+@pytest.fixture(scope="module")
+def plans(tmp_path_factory):
+    """Plans of every stat function on a copy of the small synthetic database with the recommended indexes."""
+    database = tmp_path_factory.mktemp("query_budgets") / "airflow.db"
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # Generating the database points the environment at it, this process keeps its own Airflow home.
+        for name in ("AIRFLOW_HOME", "AIRFLOW__CORE__SQL_ALCHEMY_CONN", "AIRFLOW__CORE__DAGS_FOLDER"):
+            monkeypatch.setenv(name, os.environ.get(name, ""))
+        shutil.copyfile(_ensure_database(SCENARIOS["small"]) / "airflow.db", database)
+    database_url = "sqlite:///%s" % database
+    index_advisor.create(database_url=database_url, all_missing=True, dry_run=False)
+    return explain_stat_functions(create_engine(database_url), list(BUDGETS))
+
+
+@pytest.mark.parametrize("name", list(BUDGETS))
+def test_stat_function_stays_within_its_budget(plans, name):
+    assert plans[name], "no statement was recorded"
+    assert check_budget(plans[name], BUDGETS[name]) == []
@@ -0,0 +1,146 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from airflow_prometheus.grafana_data import cache
+from airflow_prometheus.grafana_data.cache import ResponseCache
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def counting(payload: bytes):
+    def compute():
+        compute.calls += 1
+        return payload
+    compute.calls = 0
+    return compute
+
+
+def test_payloads_are_served_until_they_expire(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=100)
+    compute = counting(b"payload")
+
+    assert response_cache.get_or_compute("key", compute) == b"payload"
+    clock.now = 9.9
+    assert response_cache.get_or_compute("key", compute) == b"payload"
+    assert compute.calls == 1
+    clock.now = 10.0
+    assert response_cache.get_or_compute("key", compute) == b"payload"
+    assert compute.calls == 2
+    assert (response_cache.stats.hits, response_cache.stats.misses) == (1, 2)
+    assert response_cache.size == len(b"payload")
+
+
+def test_least_recently_used_payloads_are_evicted_beyond_the_budget(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=10)
+    response_cache.get_or_compute("a", counting(b"aaaa"))
+    response_cache.get_or_compute("b", counting(b"bbbb"))
+    # Used again, so "b" is now the least recently used.
+    response_cache.get_or_compute("a", counting(b"unused"))
+
+    response_cache.get_or_compute("c", counting(b"cccc"))
+
+    assert list(response_cache._entries) == ["a", "c"]
+    assert (response_cache.size, response_cache.stats.evictions) == (8, 1)
+
+
+def test_payloads_larger_than_the_budget_are_not_cached(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=4)
+    compute = counting(b"too large")
+
+    response_cache.get_or_compute("key", compute)
+    response_cache.get_or_compute("key", compute)
+
+    assert compute.calls == 2
+    assert response_cache.size == 0
+
+
+def test_disabled_cache_always_computes():
+    response_cache = ResponseCache(ttl=0, max_bytes=100)
+    compute = counting(b"payload")
+
+    response_cache.get_or_compute("key", compute)
+    response_cache.get_or_compute("key", compute)
+
+    assert compute.calls == 2
+    assert not response_cache._entries
+
+
+def _concurrent_requests(response_cache, result):
+    """Futures of a leader computing result() and of a follower that asks meanwhile."""
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        # Held until the follower is waiting for this computation.
+        assert release.wait(5)
+        return result()
+
+    def request():
+        try:
+            return response_cache.get_or_compute("key", compute)
+        except Exception as error:
+            return error
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(request)
+        assert started.wait(5)
+        follower = executor.submit(request)
+        while response_cache.stats.coalesced == 0:
+            threading.Event().wait(0.001)
+        release.set()
+    assert len(calls) == 1
+    return leader.result(), follower.result()
+
+
+def test_concurrent_identical_requests_compute_once(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=100)
+
+    leader, follower = _concurrent_requests(response_cache, lambda: b"payload")
+
+    assert leader == follower == b"payload"
+    assert (response_cache.stats.misses, response_cache.stats.coalesced) == (1, 1)
+
+
+def test_errors_reach_waiting_requests_and_are_not_cached(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=100)
+
+    def failing():
+        raise RuntimeError("query failed")
+
+    leader, follower = _concurrent_requests(response_cache, failing)
+
+    assert isinstance(leader, RuntimeError)
+    assert follower is leader
+    assert response_cache.get_or_compute("key", counting(b"retried")) == b"retried"
+    assert not response_cache._flights
+
+
+def test_cache_metrics(clock):
+    response_cache = ResponseCache(ttl=10, max_bytes=10)
+    response_cache.get_or_compute("first", counting(b"payload"))
+    response_cache.get_or_compute("first", counting(b"payload"))
+    response_cache.get_or_compute("second", counting(b"payload"))
+
+    samples = {
+        (sample.name, sample.labels.get("result")): sample.value
+        for family in response_cache.collect()
+        for sample in family.samples
+    }
+
+    assert samples == {
+        ("airflow_prometheus_json_cache_requests_total", "hit"): 1,
+        ("airflow_prometheus_json_cache_requests_total", "miss"): 2,
+        ("airflow_prometheus_json_cache_requests_total", "coalesced"): 0,
+        ("airflow_prometheus_json_cache_evictions_total", None): 1,
+        ("airflow_prometheus_json_cache_bytes", None): 7,
+    }
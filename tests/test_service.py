@@ -0,0 +1,16 @@
+from flask import Flask
+
+from airflow_prometheus.grafana_data.registry import data_generators
+from airflow_prometheus.grafana_data.service import align_to_interval, get_panel, parse_time
+
+
+def test_panel_ranges_are_timezone_aware():
+    data_generators.add_panel_reader("range", lambda target, ts_range: ts_range)
+    try:
+        with Flask(__name__).test_request_context("/?query=range:x&from=1622541600000&to=1622545200000"):
+            ts_range = get_panel()
+    finally:
+        del data_generators.panel_readers["range"]
+
+    assert ts_range == {"$gt": parse_time("2021-06-01T10:00:00Z"), "$lte": parse_time("2021-06-01T11:00:00Z")}
+    assert align_to_interval(ts_range["$lte"], 3600000, up=True) == ts_range["$lte"]
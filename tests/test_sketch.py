@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from airflow_prometheus.stat.sketch import QuantileSketch
+
+QUANTILES = (0.0, 0.1, 0.5, 0.9, 0.99, 1.0)
+
+
+def exact_quantile(values, q):
+    # The same rank convention as the sketch: the value at rank q * (n - 1), rounded down.
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def sketch_of(values, **kwargs):
+    sketch = QuantileSketch(**kwargs)
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+@pytest.fixture()
+def durations():
+    generator = random.Random(42)
+    return [generator.lognormvariate(3, 2) for _ in range(10000)]
+
+
+def test_empty_sketch_has_no_quantiles():
+    assert QuantileSketch().quantile(0.5) is None
+
+
+@pytest.mark.parametrize("q", QUANTILES)
+def test_quantiles_are_within_the_relative_accuracy(durations, q):
+    sketch = sketch_of(durations, relative_accuracy=0.02)
+
+    assert sketch.quantile(q) == pytest.approx(exact_quantile(durations, q), rel=0.02)
+
+
+def test_zero_and_negative_values_are_counted_as_zero():
+    sketch = sketch_of([0, -1, 0, 5, 5])
+
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(5, rel=0.02)
+
+
+def test_merge_equals_a_sketch_of_all_values(durations):
+    left, right = sketch_of(durations[:3000]), sketch_of(durations[3000:])
+
+    left.merge(right)
+
+    combined = sketch_of(durations)
+    assert left.bins == combined.bins
+    assert (left.zero_count, left.count, left.sum) == (combined.zero_count, combined.count, pytest.approx(combined.sum))
+
+
+@pytest.mark.parametrize("merged", [False, True])
+def test_collapsing_keeps_the_bin_budget_and_the_upper_quantiles(durations, merged):
+    assert len(sketch_of(durations).bins) > 200
+    if merged:
+        sketch = sketch_of(durations[:5000], max_bins=200)
+        sketch.merge(sketch_of(durations[5000:], max_bins=200))
+    else:
+        sketch = sketch_of(durations, max_bins=200)
+
+    assert len(sketch.bins) <= 200
+    assert sketch.count == len(durations)
+    for q in (0.5, 0.9, 0.99, 1.0):
+        assert sketch.quantile(q) == pytest.approx(exact_quantile(durations, q), rel=0.02)
+
+
+def test_cumulative_counts_never_overcount(durations):
+    sketch = sketch_of(durations)
+    bounds = [1, 10, 100, 1000, float("inf")]
+
+    buckets = sketch.cumulative_counts(bounds)
+
+    assert [bound for bound, _ in buckets] == bounds
+    counts = [count for _, count in buckets]
+    assert counts == sorted(counts)
+    for bound, count in buckets:
+        exact = sum(1 for value in durations if value <= bound)
+        # Only the bin straddling the bound is left out.
+        assert exact * 0.9 <= count <= exact
+    assert counts[-1] == len(durations)
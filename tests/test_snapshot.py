@@ -0,0 +1,68 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+from prometheus_client import CollectorRegistry
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from airflow_prometheus.snapshot import SnapshotWorker
+from airflow_prometheus.standalone import ExporterServer
+from airflow_prometheus.stat.context import configure_session_factory
+
+
+class BlockedCollector(object):
+    """Collects a gauge once released."""
+
+    def __init__(self):
+        self.released = threading.Event()
+
+    def collect(self):
+        self.released.wait(10)
+        yield GaugeMetricFamily("airflow_test", "Test gauge", value=1)
+
+
+@pytest.fixture
+def session_factory():
+    configure_session_factory(sessionmaker(bind=create_engine("sqlite://")))
+    yield
+    configure_session_factory(None)
+
+
+@pytest.fixture
+def collector():
+    collector = BlockedCollector()
+    yield collector
+    collector.released.set()
+
+
+def get(server):
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % server.server_address[1]) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+
+
+def test_scrapes_fail_until_the_first_snapshot_exists(session_factory, collector, monkeypatch):
+    monkeypatch.setattr("airflow_prometheus.settings.FIRST_SNAPSHOT_TIMEOUT", 0.05)
+    registry = CollectorRegistry()
+    registry.register(collector)
+    worker = SnapshotWorker(registry, interval=60)
+    server = ExporterServer(("127.0.0.1", 0), registry, worker)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert worker.render_chunks(0.01) is None
+        assert get(server)[0] == 503
+
+        collector.released.set()
+        assert worker.render(5) is not None
+        status, body = get(server)
+        assert status == 200
+        assert b"airflow_test 1.0" in body
+    finally:
+        worker.stop()
+        server.shutdown()
+        server.server_close()
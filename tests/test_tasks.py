@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+import pytest
+from airflow.models import DagRun, TaskInstance
+from airflow.models.base import Base
+from airflow.utils import timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from airflow_prometheus.query_plan import StatementRecorder
+from airflow_prometheus.stat.capabilities import capabilities
+from airflow_prometheus.stat.context import ScrapeContext
+from airflow_prometheus.stat.tasks import get_latest_tasks_state_info_by_dag
+from airflow_prometheus.stat.utils import ProcessingState
+
+FIRST_RUN = timezone.datetime(2021, 1, 1)
+
+
+@pytest.fixture()
+def context():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[DagRun.__table__, TaskInstance.__table__])
+    session = Session(bind=engine)
+    capabilities.invalidate()
+    yield ScrapeContext(session)
+    capabilities.invalidate()
+    session.close()
+
+
+def add_run(session, dag_id, day, states):
+    """A DAG run with one task instance per state, keyed like the installed Airflow version."""
+    execution_date = FIRST_RUN + timedelta(days=day)
+    run_id = "scheduled__%s" % execution_date.isoformat()
+    session.execute(DagRun.__table__.insert().values(
+        dag_id=dag_id, execution_date=execution_date, run_id=run_id, state="success", run_type="scheduled",
+    ))
+    if "run_id" in TaskInstance.__table__.columns:
+        run_key = dict(run_id=run_id)
+    else:
+        run_key = dict(execution_date=execution_date)
+    for index, state in enumerate(states):
+        session.execute(TaskInstance.__table__.insert().values(
+            dag_id=dag_id, task_id="task_%d" % index, state=state, duration=float(day),
+            try_number=1, max_tries=0, pool="default_pool", **run_key,
+        ))
+
+
+def test_task_states_of_the_latest_run_of_every_dag(context):
+    add_run(context.session, "first", 0, ["failed", "failed"])
+    add_run(context.session, "first", 1, ["success", "running"])
+    add_run(context.session, "second", 0, ["queued"])
+
+    with StatementRecorder(context.session.bind) as recorder:
+        latest = get_latest_tasks_state_info_by_dag(context=context)
+
+    # Joined through dag_run on the run key, not through the execution_date association proxy of Airflow 2.2.
+    statement, = [
+        recorded.statement for recorded in recorder.statements
+        if recorded.is_select and "JOIN" in recorded.statement
+    ]
+    assert "EXISTS" not in statement
+    assert {dag_id: {task_id: task.state for task_id, task in tasks.items()} for dag_id, tasks in latest.items()} == {
+        "first": dict(task_0=ProcessingState.SUCCESS, task_1=ProcessingState.RUNNING),
+        "second": dict(task_0=ProcessingState.QUEUED),
+    }
+    first = latest["first"]["task_0"]
+    assert (first.execution_date, first.duration) == (FIRST_RUN + timedelta(days=1), 1.0)
+
+
+def test_only_the_given_dags_are_read(context):
+    add_run(context.session, "first", 0, ["success"])
+    add_run(context.session, "second", 0, ["success"])
+
+    assert list(get_latest_tasks_state_info_by_dag(["second"], context)) == ["second"]
+    assert get_latest_tasks_state_info_by_dag([], context) == dict()